@@ -0,0 +1,183 @@
+"""
+Parity and timing of the compute backends (compute_backend.py).
+
+Purpose:
+Every backend must give the same cube, so the reports built on it (generate_crash_table_by_year,
+calculate_count_table, get_crash_severity_summary, get_region_crash_counts_for_join) are identical
+whichever backend counted. This script builds the cube with each installed backend on a synthetic
+CAS file and on edge cases (missing values, unobserved categories, empty df) and checks, per backend:
+1. report outputs equal the row-level pandas versions (groupby/unstack/value_counts, as the reports
+   were written before the cube), so the numpy backend itself is checked too, not only compared with itself
+2. counts and labels equal the numpy backend cube
+A backend which raises counts as a failure. The cube build is timed per backend (skip with --parity-only).
+
+Usage (from project folder):
+python -m benchmarks.backend_parity --rows 200000
+python -m benchmarks.backend_parity --rows 200000 --repeat 5 --json reports/backend_parity.json
+python -m benchmarks.backend_parity --rows 50000 --parity-only --require numpy pandas arrow   #CI
+
+Exit code is 1 when a check fails or a --require backend is not installed, so the command can gate CI.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import get_synthetic_csv
+from clean_data import load_and_clean
+from compute_backend import BACKENDS, DEFAULT_BACKEND, available_backends
+from crash_cube import build_crash_cube
+from main import calculate_count_table, generate_crash_table_by_year, get_crash_severity_summary, SEVERITY_ORDER
+from map_plotting import get_region_crash_counts_for_join
+
+def checked_keys(frame):
+    """First and last observed year and speed limit (plus one of each without records) for the per-year reports."""
+    years = sorted(frame["crashYear"].dropna().unique())
+    speeds = sorted(frame["effectiveSpeed"].dropna().unique())
+    return [int(y) for y in years[:1] + years[-1:]] + [1900], [int(s) for s in speeds[:1] + speeds[-1:]] + [5]
+
+def report_outputs(cube, years, speeds):
+    """Outputs of the report functions for one cube, name -> DataFrame/Series (or None)."""
+    outputs = {"crash_table_by_year": generate_crash_table_by_year(cube),
+               "count_table": calculate_count_table(cube, SEVERITY_ORDER)}
+    for year in years:
+        outputs[f"region_counts_{year}"] = get_region_crash_counts_for_join(cube, year)
+        for speed in speeds:
+            outputs[f"severity_summary_{year}_{speed}"] = get_crash_severity_summary(year, speed, cube)
+    return outputs
+
+def pandas_reference_outputs(frame, years, speeds):
+    """Same outputs as report_outputs, computed on the rows with groupby/value_counts (no cube, no backend)."""
+    by_year = frame.groupby(["crashYear", "crashSeverity"], observed=False).size().unstack(fill_value=0)
+    by_year = by_year.reindex(columns=SEVERITY_ORDER, fill_value=0)
+    by_year["Total"] = by_year.sum(axis=1)
+    count_table = frame.groupby(["effectiveSpeed", "crashSeverity"], observed=False).size().unstack(fill_value=0)
+    outputs = {"crash_table_by_year": by_year, "count_table": count_table.reindex(columns=SEVERITY_ORDER, fill_value=0)}
+    for year in years:
+        in_year = frame.loc[frame["crashYear"] == year]
+        regions = in_year.groupby("region", observed=False).size().reset_index(name="CrashCount")
+        regions["region"] = regions["region"].astype(str)
+        outputs[f"region_counts_{year}"] = regions
+        for speed in speeds:
+            rows = in_year.loc[in_year["effectiveSpeed"] == speed]
+            outputs[f"severity_summary_{year}_{speed}"] = (
+                None if rows.empty else rows["crashSeverity"].value_counts().reindex(SEVERITY_ORDER, fill_value=0))
+    return outputs
+
+def same_output(expected, actual):
+    """Same labels (index, columns) and counts; dtypes may differ (e.g. int16 years in the df, int64 in the cube)."""
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if len(expected) == 0 and len(actual) == 0:
+        return list(getattr(expected, "columns", [])) == list(getattr(actual, "columns", []))
+    return (list(expected.index) == list(actual.index)
+            and list(getattr(expected, "columns", [])) == list(getattr(actual, "columns", []))
+            and np.array_equal(np.asarray(expected, dtype=object), np.asarray(actual, dtype=object)))
+
+def compare_outputs(expected, actual):
+    """Names of outputs which differ."""
+    return [f"{name} differs" for name, value in expected.items() if not same_output(value, actual[name])]
+
+def compare_cubes(expected, actual):
+    """List of differences between two cubes (empty if identical)."""
+    problems = []
+    if expected.labels != actual.labels:
+        problems.append("labels differ")
+    if expected.categorical != actual.categorical:
+        problems.append("categorical columns differ")
+    if expected.counts.shape != actual.counts.shape:
+        problems.append(f"shape {actual.counts.shape} != {expected.counts.shape}")
+    elif not np.array_equal(expected.counts, actual.counts):
+        problems.append(f"{int((expected.counts != actual.counts).sum())} cube cell(s) differ")
+    return problems
+
+def check_backend(backend, cases, references):
+    """Problems of one backend over all cases (empty list = parity)."""
+    problems = []
+    for case, frame in cases.items():
+        years, speeds = checked_keys(frame)
+        try:
+            cube = build_crash_cube(frame, backend)
+            problems += [f"{case}: {p} (vs pandas rows)" for p in compare_outputs(references[case],
+                                                                                 report_outputs(cube, years, speeds))]
+            if backend != DEFAULT_BACKEND:
+                problems += [f"{case}: {p} (vs {DEFAULT_BACKEND})"
+                             for p in compare_cubes(build_crash_cube(frame, DEFAULT_BACKEND), cube)]
+        except Exception as error: #a crashing backend is a parity failure, other backends are still checked
+            problems.append(f"{case}: raised {error!r}")
+    return problems
+
+def edge_case_frames(cleaned_df):
+    """Small frames which break a careless group-by: missing values, unobserved categories, no rows."""
+    sample = cleaned_df.head(500).copy()
+    with_missing = sample.copy()
+    for i, column in enumerate(["crashYear", "effectiveSpeed", "crashSeverity", "weatherA", "region", "urban"]):
+        with_missing.loc[with_missing.index[i::7], column] = np.nan
+    one_severity = sample[sample["crashSeverity"] == sample["crashSeverity"].iloc[0]] #other categories unobserved
+    return {"missing values": with_missing, "unobserved categories": one_severity, "empty": sample.iloc[:0]}
+
+def time_backend(cleaned_df, backend, repeat):
+    """Median and min seconds of build_crash_cube after one warm-up run."""
+    build_crash_cube(cleaned_df, backend)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build_crash_cube(cleaned_df, backend)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare compute backends with the numpy backend")
+    parser.add_argument("--rows", type=int, default=200_000, help="rows of the synthetic csv")
+    parser.add_argument("--file", default=None, help="CAS csv instead of synthetic data")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per backend")
+    parser.add_argument("--json", default=None, help="also write the results to this json file")
+    parser.add_argument("--parity-only", action="store_true", help="skip the timing runs (CI)")
+    parser.add_argument("--require", nargs="*", default=[], choices=BACKENDS,
+                        help="fail if one of these backends is not installed (default: skip missing ones)")
+    args = parser.parse_args(argv)
+
+    cleaned_df = load_and_clean(args.file or get_synthetic_csv(args.rows))
+    installed = available_backends()
+    cases = {"full data": cleaned_df, **edge_case_frames(cleaned_df)}
+    references = {case: pandas_reference_outputs(frame, *checked_keys(frame)) for case, frame in cases.items()}
+    results = {"rows": len(cleaned_df), "backends": {}}
+    failures = []
+    print(f"{len(cleaned_df)} cleaned rows, backends installed: {', '.join(installed)}")
+    for backend in BACKENDS:
+        if backend not in installed:
+            results["backends"][backend] = {"available": False}
+            if backend in args.require:
+                failures.append(f"{backend} is required but not installed")
+            print(f"{backend:8} not installed, {'FAIL (required)' if backend in args.require else 'skipped'}")
+            continue
+        problems = check_backend(backend, cases, references)
+        if problems:
+            failures.append(f"{backend}: {len(problems)} difference(s)")
+        results["backends"][backend] = {"available": True, "parity": not problems, "problems": problems}
+        timing = ""
+        if not args.parity_only:
+            median, fastest = time_backend(cleaned_df, backend, args.repeat)
+            results["backends"][backend].update(median_s=round(median, 4), min_s=round(fastest, 4))
+            timing = f" median {median * 1000:8.1f} ms  min {fastest * 1000:8.1f} ms"
+        print(f"{backend:8} {'OK  ' if not problems else 'DIFF'}{timing}")
+        for problem in problems:
+            print(f"    {problem}")
+
+    results["failures"] = failures
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print(f"Parity FAILED: {'; '.join(failures)}")
+        return 1
+    print("Parity OK for every installed backend")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
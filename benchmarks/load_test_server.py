@@ -0,0 +1,185 @@
+"""
+Load test: concurrent HTTP clients against the query server (query_server.py).
+
+Purpose:
+Start the query server (or use one already running with --url), then let N client threads send a mix of
+report requests (severity summary, tables, region counts, some maps) over keep-alive connections.
+The queries come from a fixed pool, so repeated queries show the response cache, and clients revalidate
+answers they have seen with If-None-Match (304 expected). Reports throughput, p50/p95/p99 latency,
+status codes and the server counters.
+
+Usage (from project folder):
+python -m benchmarks.load_test_server --clients 32 --seconds 10
+python -m benchmarks.load_test_server --url http://127.0.0.1:8765 --clients 8 --distinct 50
+
+Exit code is 1 when a request failed (status other than 200/304/503, or connection error).
+"""
+
+import argparse
+import http.client
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from main import SEVERITY_ORDER
+
+WEATHERS = ["Fine", "Light rain", "Heavy rain", "Mist or Fog", "Snow"]
+SPEEDS = [30, 50, 60, 70, 80, 100]
+YEARS = list(range(2000, 2025))
+
+
+def random_query(rng, with_maps):
+    """One request path of the report mix."""
+    kind = rng.random()
+    filters = {}
+    if rng.random() < 0.5:
+        filters["weather"] = ",".join(rng.sample(WEATHERS, rng.randint(1, 3)))
+    if rng.random() < 0.3:
+        filters["severity"] = ",".join(rng.sample(SEVERITY_ORDER, rng.randint(1, 3)))
+    if with_maps and kind < 0.05:
+        return "/map.png?" + urlencode({"year": rng.choice(YEARS), **filters})
+    if kind < 0.45:
+        return "/severity?" + urlencode({"year": rng.choice(YEARS), "speed": rng.choice(SPEEDS), **filters})
+    if kind < 0.65:
+        return "/regions?" + urlencode({"year": rng.choice(YEARS), **filters})
+    if kind < 0.85:
+        return "/table/speed-severity?" + urlencode(filters)
+    return "/table/by-year?" + urlencode(filters)
+
+
+def run_client(host, port, queries, deadline, seed, results):
+    """Send random queries of the pool until the deadline, keep ETags seen for revalidation."""
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    etags = {}
+    latencies, statuses, failures = [], {}, []
+    while time.perf_counter() < deadline:
+        path = rng.choice(queries)
+        headers = {"If-None-Match": etags[path]} if path in etags and rng.random() < 0.5 else {}
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as error:
+            failures.append(f"{path}: {error!r}")
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=60)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.status == 200 and response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+        elif response.status == 503:
+            time.sleep(float(response.getheader("Retry-After", "1")) / 10) #back off a little
+        elif response.status != 304:
+            failures.append(f"{path}: HTTP {response.status}")
+    connection.close()
+    results.append({"latencies": latencies, "statuses": statuses, "failures": failures})
+
+
+def get_json(host, port, path):
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        connection.request("GET", path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(host, port, server, timeout=300):
+    """Wait for /health (the server loads the dataset before listening)."""
+    stop = time.monotonic() + timeout
+    while time.monotonic() < stop:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError("query server stopped before it was ready")
+        try:
+            return get_json(host, port, "/health")
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("query server did not answer /health in time")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent client load test of the query server")
+    parser.add_argument("--url", default=None, help="running server (default: start one on a free port)")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--distinct", type=int, default=200, help="size of the query pool")
+    parser.add_argument("--no-maps", action="store_true", help="leave map.png out of the mix")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port
+    else:
+        host, port = "127.0.0.1", free_port()
+        server = subprocess.Popen([sys.executable, "query_server.py", "--port", str(port)], stdout=subprocess.DEVNULL)
+    try:
+        health = wait_until_ready(host, port, server)
+        rng = random.Random(args.seed)
+        queries = [random_query(rng, not args.no_maps) for _ in range(args.distinct)]
+        results = []
+        deadline = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=run_client, args=(host, port, queries, deadline, args.seed + i + 1, results))
+                   for i in range(args.clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        server_stats = get_json(host, port, "/stats")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(ms for r in results for ms in r["latencies"])
+    statuses = {}
+    for r in results:
+        for status, n in r["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + n
+    failures = [f for r in results for f in r["failures"]]
+    summary = {
+        "rows": health["rows"],
+        "clients": args.clients,
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 2) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)], 2) if latencies else None,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "failures": len(failures),
+        "server": server_stats,
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        cache = server_stats["responses"]
+        print(f"{summary['requests']} requests from {args.clients} clients in {elapsed:.1f}s "
+              f"({summary['requests_per_s']}/s) on {summary['rows']} rows")
+        print(f"latency p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms")
+        print(f"status {summary['statuses']}, response cache hits={cache['hits']} misses={cache['misses']} "
+              f"entries={cache['entries']}, shared computations={server_stats['shared_computations']}")
+        for failure in failures[:10]:
+            print(f"    {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Load test: N concurrent dashboard sessions changing filters.
+
+Purpose:
+Show how host memory grows with the number of sessions when every session loads its own
+copy of the data ('private') compared to sessions attached to one shared dataset ('shared').
+
+Each session is a separate process which gets the dataset, then applies random weather/speed/severity
+filters, builds the count table and the region counts like the dashboard does.
+Every session reports its private memory (Private_Clean + Private_Dirty from /proc/self/smaps_rollup)
+and its request latencies.
+
+Usage (from project folder, Linux):
+python -m benchmarks.load_test_sessions --sessions 8 --requests 200
+
+Output: one line per mode with total private MB of all sessions, MB per session and p50/p95 latency (ms).
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import subprocess
+import sys
+import time
+
+from clean_data import load_and_clean
+from crash_cube import load_crash_cube
+from main import calculate_count_table, SEVERITY_ORDER
+from map_plotting import get_region_crash_counts_for_join
+from shared_dataset import attach_dataset, is_published
+
+
+def private_memory_mb():
+    """Private (not shared) resident memory of this process in MB, Linux only."""
+    total_kb = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total_kb += int(line.split()[1])
+    return total_kb / 1024
+
+
+def run_session(mode, prefix, requests, seed, ready, queue):
+    """One simulated dashboard session."""
+    baseline = private_memory_mb()
+    if mode == "shared":
+        dataset = attach_dataset(prefix)
+        frame, cube = dataset.frame(), dataset.cube()
+    else:
+        frame, cube = load_and_clean(), load_crash_cube()
+    frame["crashYear"].sum() #touch row data, like a row-level view would
+    ready.wait() #all sessions hold their data at the same time
+
+    rng = random.Random(seed)
+    weathers = [w for w in cube.observed_values("weatherA") if w != "Null"]
+    speeds = cube.observed_values("effectiveSpeed")
+    years = cube.observed_values("crashYear")
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        filtered = cube.filter(weatherA=rng.sample(weathers, rng.randint(1, len(weathers))),
+                               effectiveSpeed=rng.sample(speeds, rng.randint(1, len(speeds))),
+                               crashSeverity=rng.sample(SEVERITY_ORDER, rng.randint(1, 4)))
+        calculate_count_table(filtered, SEVERITY_ORDER)
+        get_region_crash_counts_for_join(filtered, rng.choice(years))
+        latencies.append((time.perf_counter() - start) * 1000)
+    queue.put({"private_mb": private_memory_mb() - baseline, "latencies": latencies})
+
+
+def run_mode(mode, sessions, requests, prefix):
+    """Start all sessions of one mode and collect their results."""
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(sessions)
+    queue = context.Queue()
+    processes = [context.Process(target=run_session, args=(mode, prefix, requests, i, ready, queue))
+                 for i in range(sessions)]
+    for p in processes:
+        p.start()
+    results = [queue.get() for _ in processes]
+    for p in processes:
+        p.join()
+    latencies = sorted(ms for r in results for ms in r["latencies"])
+    total = sum(r["private_mb"] for r in results)
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "total_private_mb": round(total, 1),
+        "private_mb_per_session": round(total / sessions, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent dashboard session load test")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="filter changes per session")
+    parser.add_argument("--mode", choices=["both", "shared", "private"], default="both")
+    parser.add_argument("--name", default="crashdata_loadtest", help="shared memory dataset name")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.mode in ("both", "private"):
+        results.append(run_mode("private", args.sessions, args.requests, args.name))
+    if args.mode in ("both", "shared"):
+        #separate loader process, same as server mode (sessions must not be children of the publisher,
+        #they would share its resource tracker)
+        loader = subprocess.Popen([sys.executable, "shared_dataset.py", "serve", "--name", args.name],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            while not is_published(args.name):
+                if loader.poll() is not None:
+                    raise RuntimeError("loader process stopped before publishing the dataset")
+                time.sleep(0.2)
+            results.append(run_mode("shared", args.sessions, args.requests, args.name))
+        finally:
+            loader.terminate()
+            loader.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{r['mode']:8} sessions={r['sessions']} total_private={r['total_private_mb']}MB "
+                  f"per_session={r['private_mb_per_session']}MB p50={r['p50_ms']}ms p95={r['p95_ms']}ms")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Peak memory benchmark for loading and cleaning the CAS csv.
+
+Purpose:
+Compare peak RSS of the one-shot loader (load_raw_dataframe + prepare_clean_df)
+with the chunked streaming loader (stream_clean_df).
+Each mode runs in a fresh process, so peak memory of one mode does not hide the other.
+
+Usage (from project folder):
+python -m benchmarks.memory_benchmark --file data/CAS.csv --chunksize 200000
+
+Output: one line per mode with time, rows, peak RSS and RSS increase over the import baseline (MB).
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from clean_data import DATA_FILE, DEFAULT_CHUNKSIZE, load_raw_dataframe, prepare_clean_df, stream_clean_df
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(mode, filename, chunksize, queue):
+    """Run one loader mode in a child process and put its measurements on queue."""
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "full":
+        cleaned_df = prepare_clean_df(load_raw_dataframe(filename))
+    else:
+        cleaned_df = stream_clean_df(filename, chunksize)
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    queue.put({
+        "mode": mode,
+        "chunksize": chunksize if mode == "chunked" else None,
+        "rows": len(cleaned_df),
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": round(peak, 1),
+        "rss_increase_mb": round(peak - baseline, 1),
+        "frame_mb": round(cleaned_df.memory_usage(deep=True).sum() / 1e6, 1),
+    })
+
+
+def measure(mode, filename, chunksize):
+    """Start a fresh (spawned) process for one mode and return its result dict."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_mode, args=(mode, filename, chunksize, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak memory of full vs chunked csv cleaning")
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--chunksize", type=int, action="append",
+                        help=f"rows per chunk, repeat for several sizes (default {DEFAULT_CHUNKSIZE})")
+    parser.add_argument("--json", action="store_true", help="print results as json list")
+    args = parser.parse_args(argv)
+
+    results = [measure("full", args.file, None)]
+    for chunksize in args.chunksize or [DEFAULT_CHUNKSIZE]:
+        results.append(measure("chunked", args.file, chunksize))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{r['mode']:8} chunksize={r['chunksize']} rows={r['rows']} time={r['seconds']}s "
+                  f"peak={r['peak_rss_mb']}MB increase={r['rss_increase_mb']}MB frame={r['frame_mb']}MB")
+    return results
+
+
+if __name__ == "__main__":
+    main()
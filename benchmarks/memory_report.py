@@ -0,0 +1,97 @@
+"""
+Memory report of the cleaned df storage model.
+
+Purpose:
+Show bytes per row of every cleaned column before (Int64 speed, int64 OBJECTID,
+own category dictionaries per load) and after the compact model of clean_data
+(uint8 speed, int32 OBJECTID, shared category registry), and the total for several loads
+held at the same time (e.g. dashboard sessions or batch workers in one process).
+
+Usage (from project folder):
+python -m benchmarks.memory_report --file data/CAS.csv --loads 8
+python -m benchmarks.memory_report --rows 1000000   #synthetic data
+
+Output: table of bytes/row per column and totals, or json with --json.
+"""
+
+import argparse
+import json
+import pandas as pd
+from benchmarks.synthetic_data import get_synthetic_csv
+from clean_data import CATEGORY_COLUMNS, CLEAN_COLUMNS, load_and_clean
+
+def to_previous_model(cleaned_df):
+    """The cleaned df as prepare_clean_df returned it before the compact model (for comparison)."""
+    columns = {}
+    for col in CLEAN_COLUMNS:
+        if col in CATEGORY_COLUMNS: #new dictionary object per load, as read_csv/read_parquet created them
+            categories = pd.Index(list(cleaned_df[col].cat.categories), dtype=object)
+            columns[col] = pd.Categorical.from_codes(cleaned_df[col].cat.codes.to_numpy().copy(), categories=categories)
+        elif col == "effectiveSpeed":
+            columns[col] = cleaned_df[col].astype("Int64")
+        else:
+            columns[col] = cleaned_df[col].to_numpy()
+    return pd.DataFrame(columns, index=cleaned_df.index.astype("int64"))
+
+def column_bytes(cleaned_df):
+    """Return dict column -> (row bytes, dictionary bytes), index included as 'OBJECTID'."""
+    result = {"OBJECTID": (cleaned_df.index.nbytes, 0)}
+    for col in CLEAN_COLUMNS:
+        series = cleaned_df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.nbytes
+            result[col] = (codes, int(series.memory_usage(deep=True, index=False)) - codes)
+        else:
+            result[col] = (int(series.memory_usage(deep=True, index=False)), 0)
+    return result
+
+def memory_report(cleaned_df, loads=1):
+    """
+    Compare both models.
+
+    Parameters:
+    - cleaned_df: output of load_and_clean (compact model)
+    - loads: number of frames of the same data held at once,
+      previous model repeats the dictionaries per frame, the registry keeps one per process
+
+    Returns: dict with per column bytes/row and totals in MB
+    """
+    rows = max(len(cleaned_df), 1)
+    before, after = column_bytes(to_previous_model(cleaned_df)), column_bytes(cleaned_df)
+    report = {"rows": len(cleaned_df), "loads": loads, "columns": {}}
+    for col in before:
+        report["columns"][col] = {"before_bytes_per_row": round(before[col][0] / rows, 2),
+                                  "after_bytes_per_row": round(after[col][0] / rows, 2),
+                                  "dictionary_bytes": after[col][1]}
+    dictionaries = sum(d for _, d in after.values())
+    before_total = sum(r + d for r, d in before.values()) * loads
+    after_total = sum(r for r, _ in after.values()) * loads + dictionaries
+    report["before_bytes_per_row"] = round(sum(r for r, _ in before.values()) / rows, 2)
+    report["after_bytes_per_row"] = round(sum(r for r, _ in after.values()) / rows, 2)
+    report["before_total_mb"] = round(before_total / 1e6, 2)
+    report["after_total_mb"] = round(after_total / 1e6, 2)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes per row of the cleaned df, previous vs compact model")
+    parser.add_argument("--file", default=None, help="CAS csv path (default: synthetic data)")
+    parser.add_argument("--rows", type=int, default=200_000, help="rows of synthetic data")
+    parser.add_argument("--loads", type=int, default=1, help="frames held at the same time")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    cleaned_df = load_and_clean(args.file or get_synthetic_csv(args.rows))
+    report = memory_report(cleaned_df, args.loads)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+    print(f"{'column':16}{'before B/row':>14}{'after B/row':>14}")
+    for col, values in report["columns"].items():
+        print(f"{col:16}{values['before_bytes_per_row']:>14}{values['after_bytes_per_row']:>14}")
+    print(f"{'total':16}{report['before_bytes_per_row']:>14}{report['after_bytes_per_row']:>14}")
+    print(f"{report['rows']} rows x {args.loads} load(s): {report['before_total_mb']} MB -> {report['after_total_mb']} MB "
+          "(incl. category dictionaries)")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Partition pruning check: reports on the partitioned store vs the full data.
+
+Purpose:
+Write the partitioned store (partitioned_store.py) of a synthetic CAS file, then for a set of filters
+compare rows and report outputs read through the store with the same queries on load_and_clean / the cube,
+and show how much of the store each query opened and how long it took.
+
+Usage (from project folder):
+python -m benchmarks.partition_pruning --rows 1000000
+
+Exit code is 1 when an output differs.
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_data import get_synthetic_csv
+from clean_data import load_and_clean
+from crash_cube import build_crash_cube
+from main import get_crash_severity_summary
+from map_plotting import get_region_crash_counts_for_join
+from partitioned_store import PartitionedStore, write_partitioned_store
+
+def same(expected, actual):
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    return expected.equals(actual)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare partitioned store reads with full data reads")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows of the synthetic csv")
+    parser.add_argument("--year", type=int, default=2015)
+    parser.add_argument("--region", default="Otago Region")
+    parser.add_argument("--speed", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    path = get_synthetic_csv(args.rows)
+    start = time.perf_counter()
+    cleaned_df = load_and_clean(path) #parquet cache after the first run, as in reports
+    full_seconds = time.perf_counter() - start
+    cube = build_crash_cube(cleaned_df)
+    store_dir = tempfile.mkdtemp(prefix="cas_partitions_")
+    failed = False
+    try:
+        start = time.perf_counter()
+        write_partitioned_store(cleaned_df, store_dir)
+        print(f"{len(cleaned_df)} rows, store written in {time.perf_counter() - start:.2f}s, "
+              f"full load_and_clean {full_seconds * 1000:.0f} ms")
+
+        queries = {
+            "year+region rows": ({"crashYear": [args.year], "region": [args.region]}, None),
+            "year rows": ({"crashYear": [args.year]}, None),
+            "year+speed rows": ({"crashYear": [args.year], "effectiveSpeed": [args.speed]}, None),
+            "severity summary": ({}, lambda store: get_crash_severity_summary(args.year, args.speed, store)),
+            "region counts for map": ({}, lambda store: get_region_crash_counts_for_join(store, args.year)),
+        }
+        for name, (selections, report) in queries.items():
+            store = PartitionedStore(store_dir) #fresh counters
+            start = time.perf_counter()
+            if report is None:
+                actual = store.read_rows(**selections)
+                mask = pd.Series(True, index=cleaned_df.index)
+                for column, values in selections.items():
+                    mask &= cleaned_df[column].isin(values)
+                expected = cleaned_df[mask].sort_index()
+            else:
+                actual = report(store)
+                expected = report(cube)
+            seconds = time.perf_counter() - start
+            ok = same(expected, actual)
+            failed = failed or not ok
+            print(f"{name:24} {'OK  ' if ok else 'DIFF'} {store.partitions_read:4} partition(s) "
+                  f"{store.bytes_read / store.total_bytes:7.1%} of the store read, {seconds * 1000:7.1f} ms")
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Benchmark suite for the load, clean, aggregate and render hot paths.
+
+Purpose:
+Time and memory-profile every pipeline step on a synthetic CAS file (benchmarks/synthetic_data.py),
+write the results as json, and compare against a saved run with a regression threshold,
+so every pipeline change can be measured before and after.
+
+Key Functions:
+
+BENCHMARKS: list of (name, setup, run), setup prepares inputs outside the timing.
+
+run_suite: time each step (median/min of repeats after one warm-up) and measure peak traced memory.
+
+compare_results: steps slower (or using more memory) than baseline * (1 + threshold).
+
+Usage (from project folder):
+python -m benchmarks.run_benchmarks --rows 100000 --output reports/bench_base.json
+python -m benchmarks.run_benchmarks --rows 100000 --compare reports/bench_base.json --threshold 0.2
+
+Exit code is 1 when a regression is found, so the command can gate CI.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg") #no display in CI
+import matplotlib.pyplot as plt
+
+from benchmarks.synthetic_data import BENCHMARK_DATA_DIR, get_synthetic_csv
+from clean_data import load_raw_dataframe, filter_effective_speed_series, prepare_clean_df, apply_cleaning_rules
+from map_plotting import get_region_crash_counts_for_join, merge_shp_with_map_data, generate_region_crash_map_by_year
+from main import calculate_count_table, generate_crash_table_by_year, SEVERITY_ORDER
+from spatial_index import PointIndex, RegionIndex, hex_bins, point_arrays
+
+BENCHMARK_YEAR = 2015
+
+def _calculate_count_table(cleaned_df):
+    return calculate_count_table(cleaned_df, SEVERITY_ORDER)
+
+def _render_map(cleaned_df):
+    plt.close(generate_region_crash_map_by_year(cleaned_df, BENCHMARK_YEAR))
+
+def _radius_queries(point_index, n_queries=100, radius=5000):
+    """Fixed set of 5 km radius queries around indexed crashes."""
+    step = max(len(point_index.x) // n_queries, 1)
+    for x, y in zip(point_index.x[::step][:n_queries], point_index.y[::step][:n_queries]):
+        point_index.within_radius(x, y, radius)
+
+#(name, setup, run): setup(csv path, state) returns the argument of run, state keeps earlier outputs
+BENCHMARKS = [
+    ("load_raw_dataframe", lambda path, state: path, load_raw_dataframe),
+    ("filter_effective_speed_series", lambda path, state: state["raw_df"], filter_effective_speed_series),
+    ("prepare_clean_df", lambda path, state: state["raw_df"], prepare_clean_df),
+    ("apply_cleaning_rules", lambda path, state: state["raw_df"], apply_cleaning_rules), #cleaned df + rule report
+    ("generate_crash_table_by_year", lambda path, state: state["cleaned_df"], generate_crash_table_by_year),
+    ("calculate_count_table", lambda path, state: state["cleaned_df"], _calculate_count_table),
+    ("get_region_crash_counts_for_join", lambda path, state: state["cleaned_df"],
+     lambda df: get_region_crash_counts_for_join(df, BENCHMARK_YEAR)),
+    ("merge_shp_with_map_data", lambda path, state: state["region_counts"], merge_shp_with_map_data),
+    ("generate_region_crash_map_by_year", lambda path, state: state["cleaned_df"], _render_map),
+    #warm-up run fills the RegionIndex cell cache, timed runs are repeated assignments (e.g. a new release)
+    ("assign_regions", lambda path, state: (RegionIndex(), point_arrays(state["cleaned_df"])),
+     lambda args: args[0].assign(*args[1])),
+    ("point_index_build", lambda path, state: point_arrays(state["cleaned_df"]), lambda xy: PointIndex(*xy)),
+    ("point_index_100_radius_queries", lambda path, state: PointIndex.from_df(state["cleaned_df"]), _radius_queries),
+    ("hex_bins", lambda path, state: point_arrays(state["cleaned_df"]), lambda xy: hex_bins(*xy)),
+]
+
+def _prepare_state(path):
+    """Inputs shared by the steps, built once outside any timing."""
+    raw_df = load_raw_dataframe(path)
+    cleaned_df = prepare_clean_df(raw_df)
+    return {"raw_df": raw_df, "cleaned_df": cleaned_df,
+            "region_counts": get_region_crash_counts_for_join(cleaned_df, BENCHMARK_YEAR)}
+
+def time_call(run, argument, repeats):
+    """Run once as warm-up (imports, geometry cache), then return the timings of repeats runs."""
+    run(argument)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run(argument)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def peak_memory_mb(run, argument):
+    """Peak memory traced during one run in MB (numpy and pandas buffers are traced)."""
+    tracemalloc.start()
+    try:
+        run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+def git_commit():
+    """Current commit hash, None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(path, repeats=5, only=None):
+    """
+    Run every benchmark on one csv.
+
+    Parameters:
+    - path: CAS-shaped csv
+    - repeats: timed runs per step
+    - only: optional list of step names
+
+    Returns: dict name -> {median_s, min_s, peak_mb}
+    """
+    state = _prepare_state(path)
+    results = {}
+    for name, setup, run in BENCHMARKS:
+        if only and name not in only:
+            continue
+        argument = setup(path, state)
+        timings = time_call(run, argument, repeats)
+        results[name] = {
+            "median_s": round(statistics.median(timings), 6),
+            "min_s": round(min(timings), 6),
+            "peak_mb": round(peak_memory_mb(run, argument), 2),
+        }
+        print(f"{name:36} median={results[name]['median_s'] * 1000:9.2f}ms "
+              f"min={results[name]['min_s'] * 1000:9.2f}ms peak={results[name]['peak_mb']:8.2f}MB", flush=True)
+    return results
+
+def compare_results(current, baseline, threshold=0.2, min_seconds=0.005):
+    """
+    Return list of regressions (dicts) of current vs baseline results.
+
+    A step regresses if its median time is more than threshold (0.2 = 20%) above the baseline
+    and at least min_seconds slower (timer noise of fast steps), or its peak memory is more than
+    threshold above the baseline.
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if (result["median_s"] > base["median_s"] * (1 + threshold)
+                and result["median_s"] - base["median_s"] >= min_seconds):
+            regressions.append({"step": name, "metric": "median_s", "baseline": base["median_s"],
+                                "current": result["median_s"]})
+        if result["peak_mb"] > base["peak_mb"] * (1 + threshold) and result["peak_mb"] - base["peak_mb"] >= 1:
+            regressions.append({"step": name, "metric": "peak_mb", "baseline": base["peak_mb"],
+                                "current": result["peak_mb"]})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the crash data pipeline")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the synthetic csv (10k to 50M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", default=None, help="use this csv instead of synthetic data")
+    parser.add_argument("--data-dir", default=BENCHMARK_DATA_DIR, help="folder of generated csv files")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="only these steps")
+    parser.add_argument("--output", default=None, help="write results json here")
+    parser.add_argument("--compare", default=None, help="baseline results json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    path = args.file or get_synthetic_csv(args.rows, args.seed, args.data_dir)
+    report = {
+        "meta": {"commit": git_commit(), "file": path, "rows": None if args.file else args.rows,
+                 "seed": args.seed, "repeats": args.repeats, "python": platform.python_version(),
+                 "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": run_suite(path, args.repeats, args.only),
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(report["results"], baseline["results"], args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['step']} {r['metric']}: {r['baseline']} -> {r['current']}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression above {args.threshold:.0%} against {args.compare} "
+              f"(commit {baseline['meta'].get('commit')})")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Startup time benchmark for main.py and the dashboard.
+
+Purpose:
+Measure import cost of the entry modules with `python -X importtime` (fresh interpreter per run),
+list the slowest imports and check that heavy libraries are not loaded at startup,
+plus the wall time of `python main.py` until the menu is shown (answered with Exit).
+
+Usage (from project folder):
+python -m benchmarks.startup_benchmark
+python -m benchmarks.startup_benchmark --modules main dashboard_app --repeats 5 --json
+
+Output: per module median import time, heavy libraries loaded, top imports by cumulative time.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_MODULES = ["main", "dashboard_app", "batch_reports"]
+#libraries that should only be imported when a report, plot or map needs them
+HEAVY_MODULES = {
+    "main": ["pandas", "numpy", "matplotlib", "geopandas", "shapely"],
+    "dashboard_app": ["matplotlib", "geopandas", "shapely"], #streamlit needs pandas anyway
+    "batch_reports": ["matplotlib", "geopandas", "shapely"],
+}
+
+def parse_importtime(stderr):
+    """Return list of (module, self_us, cumulative_us, depth) from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def measure_import(module):
+    """Import one module in a fresh interpreter, return parsed importtime rows and wall seconds."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr), seconds
+
+def measure_menu(answer="4\n"):
+    """Wall time of python main.py until it exits through the menu (data file must exist)."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "main.py"], input=answer, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    return seconds if completed.returncode == 0 else None
+
+def benchmark_module(module, repeats):
+    """Median import time of a module and the heavy libraries it loads."""
+    runs = [measure_import(module) for _ in range(repeats)]
+    rows = runs[-1][0]
+    top_level = [row for row in rows if row[0] == module]
+    loaded = {name.split(".")[0] for name, _, _, _ in rows}
+    slowest = sorted((row for row in rows if row[3] <= 1), key=lambda row: row[2], reverse=True)[:8]
+    return {
+        "module": module,
+        "import_ms": round(statistics.median(run[1] for run in runs) * 1000, 1), #whole interpreter run
+        "module_cumulative_ms": round(top_level[0][2] / 1000, 1) if top_level else None,
+        "heavy_loaded": sorted(name for name in HEAVY_MODULES.get(module, []) if name in loaded),
+        "slowest_imports": [{"module": name, "cumulative_ms": round(cum / 1000, 1)} for name, _, cum, _ in slowest],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import/startup time of the entry modules")
+    parser.add_argument("--modules", nargs="*", default=ENTRY_MODULES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args(argv)
+
+    results = [benchmark_module(module, args.repeats) for module in args.modules]
+    baseline = [measure_import("os")[1] for _ in range(args.repeats)] #interpreter start without our code
+    menu = None
+    from main import DATA_FILE
+    if os.path.exists(DATA_FILE):
+        menu = [measure_menu() for _ in range(args.repeats)]
+    report = {
+        "python_startup_ms": round(statistics.median(baseline) * 1000, 1),
+        "time_to_menu_ms": round(statistics.median(menu) * 1000, 1) if menu and None not in menu else None,
+        "modules": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+
+    print(f"python startup: {report['python_startup_ms']} ms")
+    if report["time_to_menu_ms"] is not None:
+        print(f"python main.py until menu + exit: {report['time_to_menu_ms']} ms")
+    for r in results:
+        print(f"\nimport {r['module']}: {r['import_ms']} ms (module {r['module_cumulative_ms']} ms), "
+              f"heavy libraries loaded: {', '.join(r['heavy_loaded']) or 'none'}")
+        for item in r["slowest_imports"]:
+            print(f"    {item['cumulative_ms']:8.1f} ms  {item['module']}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Synthetic CAS-shaped csv for benchmarks.
+
+Purpose:
+The real CAS file is about 200 MB and cannot be shipped to CI, so benchmarks run on a generated file
+with the same columns, value sets and missing rates. Rows are written in chunks,
+so 50M rows can be generated without holding them in memory.
+
+Key Functions:
+
+generate_cas_csv: write a synthetic csv (seeded, same seed gives the same file).
+
+get_synthetic_csv: path of a generated file in the benchmark cache folder, generated if missing.
+
+Usage (from project folder):
+python -m benchmarks.synthetic_data --rows 1000000 --out data/cache/benchmarks/cas_1m.csv
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from clean_data import CACHE_DIR
+
+BENCHMARK_DATA_DIR = os.path.join(CACHE_DIR, "benchmarks")
+
+#value sets and rough frequencies of the CAS release
+REGIONS = ["Auckland Region", "Bay of Plenty Region", "Canterbury Region", "Gisborne Region",
+           "Hawke's Bay Region", "Manawatū-Whanganui Region", "Marlborough Region", "Nelson Region",
+           "Northland Region", "Otago Region", "Southland Region", "Taranaki Region", "Tasman Region",
+           "Waikato Region", "Wellington Region", "West Coast Region"]
+REGION_WEIGHTS = [0.34, 0.06, 0.12, 0.01, 0.04, 0.05, 0.01, 0.01, 0.04, 0.04, 0.02, 0.02, 0.01, 0.12, 0.10, 0.01]
+SEVERITIES = ["Fatal Crash", "Serious Crash", "Minor Crash", "Non-Injury Crash"]
+SEVERITY_WEIGHTS = [0.01, 0.06, 0.23, 0.70]
+WEATHERS = ["Fine", "Light rain", "Heavy rain", "Mist or Fog", "Snow", "Hail or Sleet", "Null"]
+WEATHER_WEIGHTS = [0.73, 0.14, 0.05, 0.02, 0.004, 0.001, 0.055]
+#5, 15 and 25 are invalid speeds, removed by filter_effective_speed_series
+SPEEDS = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 5, 15, 25]
+SPEED_WEIGHTS = [0.01, 0.01, 0.02, 0.01, 0.48, 0.04, 0.05, 0.05, 0.01, 0.29, 0.02, 0.004, 0.003, 0.003]
+TEMPORARY_SPEEDS = [30, 50, 70]
+YEARS = (2000, 2024)
+
+def _chunk(rng, start, n_rows, speed_nan_rate, temporary_speed_rate, region_nan_rate, extra_columns):
+    """One chunk of synthetic rows, OBJECTID continues from start."""
+    speed = rng.choice(SPEEDS, n_rows, p=SPEED_WEIGHTS).astype("float32")
+    speed[rng.random(n_rows) < speed_nan_rate] = np.nan
+    temporary = np.full(n_rows, np.nan, dtype="float32")
+    has_temporary = rng.random(n_rows) < temporary_speed_rate
+    temporary[has_temporary] = rng.choice(TEMPORARY_SPEEDS, int(has_temporary.sum()))
+    region = rng.choice(np.array(REGIONS, dtype=object), n_rows, p=REGION_WEIGHTS)
+    region[rng.random(n_rows) < region_nan_rate] = None
+
+    columns = {
+        "X": rng.uniform(1.09e6, 2.09e6, n_rows).round(4), #NZTM easting/northing, same columns as CAS
+        "Y": rng.uniform(4.75e6, 6.19e6, n_rows).round(4),
+        "OBJECTID": np.arange(start + 1, start + n_rows + 1),
+        "crashYear": rng.integers(YEARS[0], YEARS[1] + 1, n_rows),
+        "crashSeverity": rng.choice(SEVERITIES, n_rows, p=SEVERITY_WEIGHTS),
+        "speedLimit": speed,
+        "temporarySpeedLimit": temporary,
+        "weatherA": rng.choice(WEATHERS, n_rows, p=WEATHER_WEIGHTS),
+        "region": region,
+        "urban": rng.choice(["Urban", "Openroad"], n_rows, p=[0.65, 0.35]),
+    }
+    for i in range(extra_columns): #CAS has about 70 columns, parser cost depends on row width
+        columns[f"extra{i}"] = rng.integers(0, 5, n_rows) if i % 2 == 0 else rng.choice(["None", "Nil", "Yes"], n_rows)
+    return pd.DataFrame(columns)
+
+def generate_cas_csv(path, n_rows, seed=0, speed_nan_rate=0.002, temporary_speed_rate=0.03,
+                     region_nan_rate=0.001, extra_columns=20, chunk_rows=1_000_000):
+    """
+    Write a synthetic CAS csv.
+
+    Parameters:
+    - path: output csv path
+    - n_rows: number of rows (10k to 50M tested)
+    - seed: random seed
+    - speed_nan_rate: share of rows without speedLimit
+    - temporary_speed_rate: share of rows with a temporarySpeedLimit (the rest is NaN)
+    - region_nan_rate: share of rows without region
+    - extra_columns: filler columns, so rows are about as wide as the real file
+    - chunk_rows: rows generated and written per step
+
+    Returns: path
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", newline="", encoding="utf-8") as f:
+        for start in range(0, n_rows, chunk_rows):
+            chunk = _chunk(rng, start, min(chunk_rows, n_rows - start), speed_nan_rate,
+                           temporary_speed_rate, region_nan_rate, extra_columns)
+            chunk.to_csv(f, index=False, header=(start == 0))
+    os.replace(path + ".tmp", path)
+    return path
+
+def get_synthetic_csv(n_rows, seed=0, data_dir=BENCHMARK_DATA_DIR):
+    """Return path of the synthetic csv for (n_rows, seed), generated on first use."""
+    path = os.path.join(data_dir, f"cas_synthetic_{n_rows}_{seed}.csv")
+    if not os.path.exists(path):
+        generate_cas_csv(path, n_rows, seed)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic CAS-shaped csv")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--out", default=None, help="csv path (default: benchmark cache folder)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speed-nan-rate", type=float, default=0.002)
+    parser.add_argument("--temporary-speed-rate", type=float, default=0.03)
+    parser.add_argument("--extra-columns", type=int, default=20)
+    args = parser.parse_args(argv)
+    out = args.out or os.path.join(BENCHMARK_DATA_DIR, f"cas_synthetic_{args.rows}_{args.seed}.csv")
+    generate_cas_csv(out, args.rows, args.seed, args.speed_nan_rate, args.temporary_speed_rate,
+                     extra_columns=args.extra_columns)
+    print(f"{args.rows} rows written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Check and timing of trend_analytics.py against straightforward pandas / Python loop versions.
+
+Purpose:
+1. Point statistics (rate, rate_delta, rolling_rate, rolling_count, count_delta) of every series must equal
+   the same statistics from groupby/rolling on the cleaned rows.
+2. Bootstrap intervals must agree with a plain bootstrap which resamples the crash rows of each series-year
+   with replacement in a Python loop (within Monte Carlo error), checked on a sample of series.
+3. Intervals must not depend on the number of workers (same seed).
+Prints the time of the vectorized bootstrap and of the loop (extrapolated to all series).
+
+Usage (from project folder):
+python -m benchmarks.trend_check --rows 200000 --group-by region effectiveSpeed weatherA
+
+Exit code is 1 when a check fails.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import get_synthetic_csv
+from clean_data import load_and_clean
+from crash_cube import build_crash_cube
+from main import SEVERITY_ORDER
+from trend_analytics import GROUP_COLUMNS, bootstrap_intervals, compute_trends, series_counts, trend_metrics
+
+
+def pandas_metrics(cleaned_df, group_by, years, window):
+    """Point statistics with groupby/unstack/rolling, same long layout as compute_trends."""
+    rows = cleaned_df.dropna(subset=group_by + ["crashYear", "crashSeverity"])
+    counts = rows.groupby(group_by + ["crashYear", "crashSeverity"], observed=True).size().unstack(fill_value=0)
+    counts = counts.reindex(columns=SEVERITY_ORDER, fill_value=0)
+    series = counts.index.droplevel("crashYear").unique() if group_by else [()]
+    if group_by:
+        full_index = pd.MultiIndex.from_tuples([tuple(s if isinstance(s, tuple) else (s,)) + (y,)
+                                                for s in series for y in years], names=group_by + ["crashYear"])
+    else:
+        full_index = pd.Index(years, name="crashYear")
+    counts = counts.reindex(full_index, fill_value=0).astype(float)
+    totals = counts.sum(axis=1)
+    rate = counts.div(totals, axis=0)
+
+    def per_series(frame, func):
+        return frame.groupby(level=group_by, sort=False).transform(func) if group_by else func(frame)
+    rolling = per_series(counts, lambda part: part.rolling(window, min_periods=1).sum())
+    years_in_window = np.tile(np.minimum(np.arange(1, len(years) + 1), window), len(series))
+    metrics = {"count": counts, "rate": rate, "rate_delta": per_series(rate, lambda part: part.diff()),
+               "rolling_rate": rolling.div(rolling.sum(axis=1), axis=0),
+               "rolling_count": rolling.div(years_in_window, axis=0),
+               "count_delta": per_series(counts, lambda part: part.diff())}
+    return {name: frame.stack(future_stack=True) for name, frame in metrics.items()}
+
+
+def loop_bootstrap(cleaned_df, group_by, key, years, resamples, window, confidence, seed):
+    """Bootstrap of one series: resample its rows of every year with replacement, one resample at a time."""
+    rng = np.random.default_rng(seed)
+    rows = cleaned_df
+    for column, value in zip(group_by, key):
+        rows = rows[rows[column] == value]
+    severity_codes = {s: i for i, s in enumerate(SEVERITY_ORDER)}
+    by_year = [rows.loc[rows["crashYear"] == y, "crashSeverity"].map(severity_codes).dropna().to_numpy(dtype=int)
+               for y in years]
+    samples = np.zeros((resamples, len(years), len(SEVERITY_ORDER)))
+    for b in range(resamples):
+        for y, codes in enumerate(by_year):
+            if len(codes):
+                resampled = codes[rng.integers(0, len(codes), len(codes))]
+                samples[b, y] = np.bincount(resampled, minlength=len(SEVERITY_ORDER))
+    alpha = (1 - confidence) / 2
+    return {name: np.quantile(values, [alpha, 1 - alpha], axis=0)
+            for name, values in trend_metrics(samples, window, ["rate", "rate_delta", "rolling_rate"]).items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check trend_analytics against pandas and a loop bootstrap")
+    parser.add_argument("--rows", type=int, default=200_000, help="rows of the synthetic csv")
+    parser.add_argument("--group-by", nargs="*", default=GROUP_COLUMNS)
+    parser.add_argument("--window", type=int, default=3)
+    parser.add_argument("--resamples", type=int, default=2000)
+    parser.add_argument("--series", type=int, default=4, help="series checked with the loop bootstrap")
+    args = parser.parse_args(argv)
+
+    cleaned_df = load_and_clean(get_synthetic_csv(args.rows))
+    cube = build_crash_cube(cleaned_df)
+    failed = False
+
+    trends = compute_trends(cube, args.group_by, args.window, resamples=0)
+    counts, keys, years = series_counts(cube, args.group_by)
+    expected = pandas_metrics(cleaned_df, args.group_by, years, args.window)
+    for name, values in expected.items():
+        same = np.allclose(trends[name].to_numpy(dtype=float), values.to_numpy(dtype=float), equal_nan=True)
+        same = same and len(values) == len(trends)
+        failed = failed or not same
+        print(f"{name:14} {'OK' if same else 'DIFF'} ({len(values)} rows)")
+
+    start = time.perf_counter()
+    intervals = bootstrap_intervals(counts, args.resamples, args.window, seed=1)
+    vector_seconds = time.perf_counter() - start
+    print(f"vectorized bootstrap: {len(counts)} series x {args.resamples} resamples in {vector_seconds:.2f}s")
+
+    #loop check on the biggest series (smallest Monte Carlo error relative to the interval width)
+    checked = np.argsort(counts.sum(axis=(1, 2)))[::-1][:args.series]
+    start = time.perf_counter()
+    worst = 0.0
+    for i in checked:
+        key = tuple(keys.iloc[i]) if args.group_by else ()
+        loop = loop_bootstrap(cleaned_df, args.group_by, key, years, args.resamples, args.window, 0.95, seed=int(i))
+        for name, (low, high) in intervals.items():
+            width = np.nanmax(high[i] - low[i])
+            difference = max(np.nanmax(np.abs(low[i] - loop[name][0])), np.nanmax(np.abs(high[i] - loop[name][1])))
+            worst = max(worst, difference / width)
+    loop_seconds = (time.perf_counter() - start) / len(checked) * len(counts)
+    agree = worst < 0.2 #percentiles of two independent runs, allow 20% of the widest interval
+    failed = failed or not agree
+    print(f"loop bootstrap:       {'OK' if agree else 'DIFF'} largest difference {worst:.1%} of interval width, "
+          f"~{loop_seconds:.0f}s for all series ({loop_seconds / max(vector_seconds, 1e-9):.0f}x slower)")
+
+    pooled = bootstrap_intervals(counts, args.resamples, args.window, seed=1, workers=2)
+    same = all(np.array_equal(intervals[n][k], pooled[n][k], equal_nan=True) for n in intervals for k in (0, 1))
+    failed = failed or not same
+    print(f"workers=2 vs 1:       {'OK' if same else 'DIFF'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
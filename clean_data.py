@@ -1,10 +1,133 @@
 #clean_data.py
 #move load and clean functions for re-use in new features
 
+import hashlib
+import json
+import os
+import numpy as np
 import pandas as pd
+from instrumentation import traced
 
 DATA_FILE = "data/Crash_Analysis_System_(CAS)_data.csv"
+CACHE_DIR = "data/cache"
+CLEANING_VERSION = 4 #bump when load/clean rules change, old cache files are rebuilt automatically
+DEFAULT_CHUNKSIZE = 500_000 #rows per chunk in streaming mode
 
+RAW_COLUMNS = ["X", "Y", "OBJECTID", "crashYear", "speedLimit", "crashSeverity", "temporarySpeedLimit", "weatherA", "region","urban"]
+RAW_DTYPES = {
+    "X": "float32",
+    "Y": "float32",
+    "crashYear": "int16",
+    "speedLimit": "float32",
+    "temporarySpeedLimit": "float32",
+    "crashSeverity": "category",
+    "weatherA": "category",
+    "region": "category",
+    "urban": "category"
+}
+CATEGORY_COLUMNS = ["crashSeverity", "weatherA", "region", "urban"]
+CLEAN_COLUMNS = ["crashYear", "crashSeverity", "effectiveSpeed", "weatherA", "region", "urban", "X", "Y"]
+COORDINATE_COLUMNS = ["X", "Y"] #NZTM easting/northing (EPSG:2193, metres), same CRS as the region shapefile
+
+#compact storage of the cleaned df (about 19 bytes per row: 11 for the report columns instead of 23, 8 for X/Y):
+#year int16, speed uint8 (valid speeds are small multiples of 10, no NaN left after cleaning),
+#OBJECTID int32 index, category columns int8 codes into one shared dictionary per column,
+#X/Y float32 (NZTM values below 1e7 m keep about 0.5 m precision, NaN if the crash has no location).
+YEAR_DTYPE = "int16"
+SPEED_DTYPE = "uint8"
+COORDINATE_DTYPE = "float32"
+OBJECTID_DTYPE = "int32"
+
+REGION_NAME_MAPPING = {'Auckland Region': 'Auckland'} #CAS name -> shapefile name, applied once when cleaning
+UNKNOWN_WEATHER = "Null" #weatherA value of crashes without weather, kept but not in default filters
+MIN_SPEED, MAX_SPEED = 0, 250 #valid range of a speed limit (km/h)
+NZTM_BOUNDS = (1_000_000, 4_700_000, 2_200_000, 6_300_000) #xmin, ymin, xmax, ymax of mainland NZ and islands
+
+#cleaning rules, evaluated together in one pass by evaluate_cleaning_rules, in report column order:
+#reject = row removed (a row counts for the first reject rule it fails), normalize = value rewritten,
+#flag = row kept as is but worth watching. normalize/flag rules count kept rows only.
+CLEANING_RULES = {
+    "speed_missing": ("reject", "no speedLimit and no temporarySpeedLimit"),
+    "speed_out_of_range": ("reject", f"speed limit below {MIN_SPEED} or above {MAX_SPEED}"),
+    "speed_not_multiple_of_10": ("reject", "speed limit not a multiple of 10, e.g. 5 or 11"),
+    "speed_temporary_limit": ("normalize", "temporarySpeedLimit used instead of speedLimit"),
+    "region_renamed": ("normalize", "CAS region name mapped to the shapefile name (REGION_NAME_MAPPING)"),
+    "region_missing": ("flag", "no region, only in totals and not on region maps"),
+    "weather_null": ("flag", f"weatherA is '{UNKNOWN_WEATHER}', left out of the default weather filter"),
+    "weather_missing": ("flag", "no weatherA"),
+    "severity_missing": ("flag", "no crashSeverity"),
+    "urban_missing": ("flag", "no urban/openroad value"),
+    "coordinates_missing": ("flag", "no X/Y, not on point maps"),
+    "coordinates_outside_nz": ("flag", "X/Y outside NZTM_BOUNDS"),
+}
+REJECT_RULES = [name for name, (action, _) in CLEANING_RULES.items() if action == "reject"]
+MISSING_REGION = "(missing)" #region label of rows without region in the quality report
+
+#category registry: one CategoricalDtype per column shared by every cleaned df of the process
+#(cache loads, streaming chunks, incremental deltas, shared memory), so dictionaries are not repeated
+#per load and codes mean the same everywhere. Lists are sorted like read_csv categories.
+CATEGORY_REGISTRY = {
+    "crashSeverity": ["Fatal Crash", "Minor Crash", "Non-Injury Crash", "Serious Crash"],
+    "weatherA": ["Fine", "Hail or Sleet", "Heavy rain", "Light rain", "Mist or Fog", "Null", "Snow"],
+    "region": ["Auckland", "Bay of Plenty Region", "Canterbury Region", "Gisborne Region", "Hawke's Bay Region",
+               "Manawatū-Whanganui Region", "Marlborough Region", "Nelson Region", "Northland Region",
+               "Otago Region", "Southland Region", "Taranaki Region", "Tasman Region", "Waikato Region",
+               "Wellington Region", "West Coast Region"],
+    "urban": ["Openroad", "Urban"],
+}
+_category_dtypes = {}
+
+def get_category_dtype(column, values=()):
+    """
+    Return the shared CategoricalDtype of a category column.
+    Values not in the registry yet (e.g. a new weather type in a release) are appended at the end,
+    so codes of known values never change.
+    """
+    dtype = _category_dtypes.get(column)
+    if dtype is None:
+        dtype = pd.CategoricalDtype(CATEGORY_REGISTRY[column])
+    new_values = [value for value in pd.unique(pd.Index(values).dropna()) if value not in dtype.categories]
+    if new_values or column not in _category_dtypes:
+        dtype = pd.CategoricalDtype(list(dtype.categories) + sorted(new_values))
+        _category_dtypes[column] = dtype
+    return dtype
+
+def to_registry_categorical(series, mapping=None):
+    """
+    Recode a categorical Series to the shared dtype of its column, without going through strings.
+    mapping (old value -> new value) renames values first, e.g. REGION_NAME_MAPPING.
+    """
+    values = [mapping.get(value, value) for value in series.cat.categories] if mapping else list(series.cat.categories)
+    dtype = get_category_dtype(series.name, values)
+    if not mapping and series.cat.categories.equals(dtype.categories): #same order, not only same set (dtype ==)
+        codes = series.cat.codes.to_numpy()
+    else:
+        translate = np.append(dtype.categories.get_indexer(values), -1).astype(np.int8 if len(dtype.categories) < 127 else np.int16)
+        codes = translate[series.cat.codes.to_numpy()] #code -1 (missing) picks the last item
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=series.index, name=series.name)
+
+def compact_clean_df(cleaned_df):
+    """
+    Convert a cleaned df to the compact storage model: small ints, int32 OBJECTID,
+    shared category dictionaries, region names normalized (REGION_NAME_MAPPING).
+    Also used after reading the parquet cache, parquet gives every load its own dictionaries.
+    """
+    columns = {}
+    for col in CLEAN_COLUMNS:
+        if col in CATEGORY_COLUMNS:
+            columns[col] = to_registry_categorical(cleaned_df[col], REGION_NAME_MAPPING if col == "region" else None)
+        elif col == "effectiveSpeed":
+            columns[col] = cleaned_df[col].astype(SPEED_DTYPE)
+        elif col in COORDINATE_COLUMNS:
+            columns[col] = cleaned_df[col].astype(COORDINATE_DTYPE)
+        else:
+            columns[col] = cleaned_df[col].astype(YEAR_DTYPE)
+    index = cleaned_df.index
+    if len(index) == 0 or index.max() <= np.iinfo(OBJECTID_DTYPE).max:
+        index = index.astype(OBJECTID_DTYPE)
+    return pd.DataFrame(columns, index=index)
+
+@traced("load.read_csv")
 def load_raw_dataframe(filename=DATA_FILE):
     """
     Load raw crash data from csv file with given columns and data types.
@@ -15,66 +138,473 @@ def load_raw_dataframe(filename=DATA_FILE):
     Returns:
     - Raw DataFrame with specified columns and types, indexed by OBJECTID.
     """
-    columns = ["OBJECTID", "crashYear", "speedLimit", "crashSeverity", "temporarySpeedLimit", "weatherA", "region","urban"]
-    dtypes = {
-        "crashYear": "int16",
-        "speedLimit": "float32",
-        "temporarySpeedLimit": "float32",
-        "crashSeverity": "category",
-        "weatherA": "category",
-        "region": "category",
-        "urban": "category"
-    }
     #review note: select columns from oringal data and set types
-    return pd.read_csv(filename, usecols=columns, dtype=dtypes, index_col="OBJECTID")
+    return pd.read_csv(filename, usecols=RAW_COLUMNS, dtype=RAW_DTYPES, index_col="OBJECTID")
+
+def _effective_speed_array(df):
+    """Return (effective speed float array, temporary limit used mask): temporarySpeedLimit first, then speedLimit."""
+    temporary = df['temporarySpeedLimit'].to_numpy(dtype=np.float32, na_value=np.nan)
+    has_temporary = ~np.isnan(temporary)
+    return np.where(has_temporary, temporary, df['speedLimit'].to_numpy(dtype=np.float32, na_value=np.nan)), has_temporary
+
+def _speed_reject_masks(effective_speed):
+    """Reject masks of the speed rules, exclusive (a row fails only its first rule)."""
+    missing = np.isnan(effective_speed)
+    out_of_range = (effective_speed < MIN_SPEED) | (effective_speed > MAX_SPEED) #False for NaN
+    in_range = ~missing & ~out_of_range
+    whole = np.where(in_range, effective_speed, 0).astype(np.int16) #integer test is cheaper than float modulo
+    not_multiple = in_range & ((whole != effective_speed) | (whole % 10 != 0))
+    return {"speed_missing": missing, "speed_out_of_range": out_of_range, "speed_not_multiple_of_10": not_multiple}
 
 def filter_effective_speed_series(df):
     """Filter and return a series of effective speed limits by prioritising temporary limits.
 
     - Prioritises 'temporarySpeedLimit' over 'speedLimit',
     - Filters out missing values and those not divisible by 10,
-    - Returns a Series of valid effective speeds with integer type ('Int64').
+    - Returns a Series of valid effective speeds with small integer type (SPEED_DTYPE, no NaN left).
 
     Parameters:
         df : Input raw dataframe which has 'temporarySpeedLimit' and 'speedLimit' columns.
     Returns:
         pd.Series of valid speeds (multiples of 10), with original index preserved.
     """
-    processed = df['temporarySpeedLimit'].combine_first(df['speedLimit']) 
-    #first, prioritize temporary speed limit
-    effective_speed = processed[(processed.notna()) & (processed % 10 == 0)] 
-    #then, remove invalid speeds (nan, illegal value like 5,11)
-    return effective_speed.astype('Int64') #float in raw data, due to Nan
+    effective_speed, _ = _effective_speed_array(df) #first, prioritize temporary speed limit
+    rejected = _speed_reject_masks(effective_speed)
+    keep = ~(rejected["speed_missing"] | rejected["speed_out_of_range"] | rejected["speed_not_multiple_of_10"])
+    #then, remove invalid speeds (nan, illegal value like 5,11, values out of range of a speed limit)
+    positions = np.flatnonzero(keep)
+    return pd.Series(effective_speed[positions].astype(SPEED_DTYPE), index=df.index[positions])
+
+def _category_value_mask(series, values):
+    """Rows of a categorical (or plain) Series whose value is in values, compared on codes."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.isin(values).to_numpy()
+    lookup = np.append(series.cat.categories.isin(values), False) #code -1 (missing) picks the last item
+    return lookup[series.cat.codes.to_numpy()]
+
+def evaluate_cleaning_rules(raw_df):
+    """
+    Evaluate every rule of CLEANING_RULES over the raw columns, each column is read once.
+
+    Parameters:
+    - raw_df: raw df (load_raw_dataframe or a chunk of it)
+
+    Returns:
+    - keep: boolean array of rows which pass all reject rules
+    - effective_speed: float32 array of effective speed limits (valid where keep)
+    - masks: dict rule name -> boolean array of rows the rule applies to
+    """
+    effective_speed, has_temporary = _effective_speed_array(raw_df)
+    masks = _speed_reject_masks(effective_speed)
+    keep = ~np.logical_or.reduce([masks[name] for name in REJECT_RULES])
+    x = raw_df["X"].to_numpy(dtype=np.float32, na_value=np.nan)
+    y = raw_df["Y"].to_numpy(dtype=np.float32, na_value=np.nan)
+    no_coordinates = np.isnan(x) | np.isnan(y)
+    xmin, ymin, xmax, ymax = NZTM_BOUNDS
+    with np.errstate(invalid="ignore"):
+        outside = ~no_coordinates & ((x < xmin) | (x > xmax) | (y < ymin) | (y > ymax))
+    kept_masks = {
+        "speed_temporary_limit": has_temporary,
+        "region_renamed": _category_value_mask(raw_df["region"], list(REGION_NAME_MAPPING)),
+        "region_missing": raw_df["region"].isna().to_numpy(),
+        "weather_null": _category_value_mask(raw_df["weatherA"], [UNKNOWN_WEATHER]),
+        "weather_missing": raw_df["weatherA"].isna().to_numpy(),
+        "severity_missing": raw_df["crashSeverity"].isna().to_numpy(),
+        "urban_missing": raw_df["urban"].isna().to_numpy(),
+        "coordinates_missing": no_coordinates,
+        "coordinates_outside_nz": outside,
+    }
+    for name, mask in kept_masks.items():
+        masks[name] = mask & keep
+    return keep, effective_speed, {name: masks[name] for name in CLEANING_RULES}
+
+def cleaning_report(raw_df, rules=None):
+    """
+    Rows each cleaning rule removed or touched, by crashYear and region.
 
+    Parameters:
+    - raw_df: raw df (or chunk)
+    - rules: output of evaluate_cleaning_rules for raw_df (computed if not given)
+
+    Returns:
+    - DataFrame indexed by (crashYear, region), columns rows_in, one per rule (CLEANING_RULES order), rows_out.
+      Region is the normalized name, MISSING_REGION for rows without region, only groups with rows are listed.
+
+    Review note: one bincount per rule over a combined (year, region) code, no groupby per rule.
+    """
+    keep, _, masks = rules if rules is not None else evaluate_cleaning_rules(raw_df)
+    years = raw_df["crashYear"].to_numpy()
+    first_year = int(years.min()) if len(years) else 0
+    year_codes = years.astype(np.int64) - first_year #years are a short range, offset instead of np.unique (sort)
+    year_values = np.arange(first_year, first_year + (int(year_codes.max()) + 1 if len(years) else 0))
+    region = to_registry_categorical(raw_df["region"], REGION_NAME_MAPPING) #raw region is categorical (RAW_DTYPES)
+    regions = list(region.cat.categories) + [MISSING_REGION]
+    region_codes = region.cat.codes.to_numpy().astype(np.int64)
+    region_codes[region_codes < 0] = len(regions) - 1
+    groups = year_codes * len(regions) + region_codes
+    size = len(year_values) * len(regions)
+    columns = {"rows_in": np.bincount(groups, minlength=size)}
+    for name, mask in masks.items():
+        columns[name] = np.bincount(groups[mask], minlength=size)
+    columns["rows_out"] = np.bincount(groups[keep], minlength=size)
+    index = pd.MultiIndex.from_product([year_values, regions], names=["crashYear", "region"])
+    report = pd.DataFrame(columns, index=index)
+    return report[report["rows_in"] > 0].sort_index() #same order as combine_cleaning_reports
+
+def combine_cleaning_reports(reports):
+    """Sum reports of several chunks/files into one (same layout as cleaning_report)."""
+    if not reports:
+        return pd.DataFrame(columns=["rows_in", *CLEANING_RULES, "rows_out"], dtype=np.int64,
+                            index=pd.MultiIndex.from_arrays([[], []], names=["crashYear", "region"]))
+    return pd.concat(reports).groupby(level=["crashYear", "region"], sort=True).sum()
+
+def take_kept_rows(raw_df, rules):
+    """
+    Cleaned df from evaluated rules: the kept rows of the CLEAN_COLUMNS are taken once
+    (positional, no full raw copy), effectiveSpeed inserted, then compact_clean_df (also renames regions).
+    """
+    keep, effective_speed, _ = rules
+    positions = np.flatnonzero(keep)
+    cleaned_df = raw_df[[col for col in CLEAN_COLUMNS if col != "effectiveSpeed"]].iloc[positions]
+    cleaned_df.insert(CLEAN_COLUMNS.index("effectiveSpeed"), "effectiveSpeed", effective_speed[positions].astype(SPEED_DTYPE))
+    return compact_clean_df(cleaned_df)
+
+@traced("clean.apply_cleaning_rules")
+def apply_cleaning_rules(raw_df):
+    """
+    Rule based cleaning in one pass: cleaned df plus the report of what each rule did.
+    Use it where the report is kept (cache writes), prepare_clean_df skips the report.
+
+    steps:
+    1. evaluate_cleaning_rules: all masks and the effective speed from the raw columns
+    2. take_kept_rows: cleaned df
+    3. cleaning_report from the same masks
+
+    Parameters:
+        raw_df (raw df or chunk)
+
+    Returns:
+        (cleaned df same as before the rule stage, report DataFrame of cleaning_report)
+    """
+    rules = evaluate_cleaning_rules(raw_df)
+    return take_kept_rows(raw_df, rules), cleaning_report(raw_df, rules)
+
+@traced("clean.prepare_clean_df")
 def prepare_clean_df(raw_df):
     """
     Prepare a cleaned DataFrame by using filters:
     - effective speed limits , insert a new column 'effectiveSpeed'.
 
-    steps:
-    1. Call filter function
-    2. Filter by index for the rows which are valid in filter
-    3. Inserts a new column 'effectiveSpeed' into the cleaned DataFrame.
-    4. Create a new cleaned df (adding weatherA and region for new features)
+    steps: evaluate_cleaning_rules (all CLEANING_RULES in one pass) and take_kept_rows,
+    no rule report (it costs about a third of the cleaning and callers here do not keep it).
 
     Parameters:
         df (raw df)
-        -other filteres will be extended
 
     Returns:
         new cleaned with effectiveSpeed, index is OBJECTID
     """
-    effective_speed = filter_effective_speed_series(raw_df)
-    cleaned_df = raw_df.loc[effective_speed.index].copy() 
-    #generate new df, avioding only generates a view on original df, align row with index which is ObjectID
-    #review note: slice of df didn't change index value, slice all rows with effective speed.
-    cleaned_df["effectiveSpeed"] = effective_speed #add new column and relate data
-    return cleaned_df[["crashYear", "crashSeverity", "effectiveSpeed", "weatherA", "region", "urban"]]
+    return take_kept_rows(raw_df, evaluate_cleaning_rules(raw_df))
+
+def count_data_rows(filename, block_size=1 << 20):
+    """
+    Count data rows of a csv without parsing it (line breaks minus header).
+    Used as upper bound to preallocate output arrays in streaming mode.
+    """
+    lines = 0
+    last = b"\n"
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1 #last line without line break
+    return max(lines - 1, 0)
 
-def load_and_clean():
+def iter_raw_chunks(filename=DATA_FILE, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield raw DataFrame chunks with the same columns and types as load_raw_dataframe."""
+    return pd.read_csv(filename, usecols=RAW_COLUMNS, dtype=RAW_DTYPES, index_col="OBJECTID", chunksize=chunksize)
+
+def _map_chunk_codes(chunk_col, categories, lookup):
+    """
+    Translate category codes of one chunk to codes of the global category list.
+
+    Parameters:
+    - chunk_col: categorical Series of the chunk
+    - categories: global list of category values, extended in place with new values
+    - lookup: dict value -> global code, extended in place
+
+    Returns:
+    - numpy int32 array of global codes, -1 for missing value
+    """
+    chunk_categories = chunk_col.cat.categories
+    for value in chunk_categories:
+        if value not in lookup:
+            lookup[value] = len(categories)
+            categories.append(value)
+    translate = np.array([lookup[value] for value in chunk_categories] + [-1], dtype=np.int32)
+    return translate[chunk_col.cat.codes.to_numpy()] #code -1 picks the last item, which is -1 again
+
+def _build_sorted_categorical(codes, categories):
+    """
+    Build a Categorical with sorted categories from global codes.
+    read_csv sorts categories of a category column, so this keeps streaming output identical.
+    """
+    order = sorted(range(len(categories)), key=lambda i: categories[i])
+    remap = np.empty(len(categories) + 1, dtype=np.int32)
+    remap[order] = np.arange(len(categories), dtype=np.int32)
+    remap[-1] = -1
+    sorted_categories = [categories[i] for i in order]
+    return pd.Categorical.from_codes(remap[codes], categories=sorted_categories)
+
+def stream_clean_with_report(filename=DATA_FILE, chunksize=DEFAULT_CHUNKSIZE, with_report=True):
+    """
+    Streaming version of apply_cleaning_rules(load_raw_dataframe(filename)).
+
+    steps:
+    1. Count rows once and preallocate output arrays (index, year, speed, category codes).
+    2. Read csv chunk by chunk, evaluate the cleaning rules and project columns for each chunk.
+    3. Category values of every chunk are added to one global list per column,
+       chunk codes are translated so all chunks share one category dictionary.
+    4. Build the cleaned df from the filled part of the arrays, sum the chunk reports.
+
+    Parameters:
+    - filename: CSV file path
+    - chunksize: rows per chunk, bounds the temporary memory of the raw data
+    - with_report: False skips the rule report (stream_clean_df)
+
+    Returns:
+    - (cleaned df, rule report or None), same content and types as apply_cleaning_rules
+
+    Review note: peak memory is roughly the final frame plus one raw chunk,
+    instead of full raw df + .loc copy + combine_first Series.
+    """
+    capacity = count_data_rows(filename)
+    object_ids = np.empty(capacity, dtype=np.int64)
+    years = np.empty(capacity, dtype=np.int16)
+    speeds = np.empty(capacity, dtype=SPEED_DTYPE) #valid speeds are small multiples of 10
+    coordinates = {col: np.empty(capacity, dtype=COORDINATE_DTYPE) for col in COORDINATE_COLUMNS}
+    codes = {col: np.empty(capacity, dtype=np.int16) for col in CATEGORY_COLUMNS} #few categories per column
+    categories = {col: [] for col in CATEGORY_COLUMNS}
+    lookups = {col: {} for col in CATEGORY_COLUMNS}
+    reports = []
+
+    filled = 0
+    for chunk in iter_raw_chunks(filename, chunksize):
+        rules = evaluate_cleaning_rules(chunk)
+        keep, effective_speed, _ = rules
+        positions = np.flatnonzero(keep) #row positions in chunk, no copy of the chunk needed
+        end = filled + len(positions)
+        object_ids[filled:end] = chunk.index.to_numpy()[positions]
+        years[filled:end] = chunk["crashYear"].to_numpy()[positions]
+        speeds[filled:end] = effective_speed[positions]
+        for col in COORDINATE_COLUMNS:
+            coordinates[col][filled:end] = chunk[col].to_numpy()[positions]
+        for col in CATEGORY_COLUMNS:
+            #map the whole chunk, so categories of dropped rows are still kept (same as full load)
+            chunk_codes = _map_chunk_codes(chunk[col], categories[col], lookups[col])
+            codes[col][filled:end] = chunk_codes[positions]
+        if with_report:
+            reports.append(cleaning_report(chunk, rules))
+        filled = end
+
+    cleaned_df = pd.DataFrame({
+        "crashYear": years[:filled],
+        "crashSeverity": _build_sorted_categorical(codes["crashSeverity"][:filled], categories["crashSeverity"]),
+        "effectiveSpeed": speeds[:filled],
+        "weatherA": _build_sorted_categorical(codes["weatherA"][:filled], categories["weatherA"]),
+        "region": _build_sorted_categorical(codes["region"][:filled], categories["region"]),
+        "urban": _build_sorted_categorical(codes["urban"][:filled], categories["urban"]),
+        "X": coordinates["X"][:filled],
+        "Y": coordinates["Y"][:filled],
+    }, index=pd.Index(object_ids[:filled], name="OBJECTID"))
+    return compact_clean_df(cleaned_df), combine_cleaning_reports(reports) if with_report else None
+
+@traced("clean.stream_clean_df")
+def stream_clean_df(filename=DATA_FILE, chunksize=DEFAULT_CHUNKSIZE):
+    """Streaming version of prepare_clean_df(load_raw_dataframe(filename)), see stream_clean_with_report."""
+    return stream_clean_with_report(filename, chunksize, with_report=False)[0]
+
+def file_content_hash(filename, block_size=1 << 20):
+    """Return sha256 hex digest of a file, read block by block to keep memory flat."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_cache_paths(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """Return (parquet path, meta json path) of the cleaned cache for a source csv."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return (os.path.join(cache_dir, f"{stem}.cleaned.parquet"),
+            os.path.join(cache_dir, f"{stem}.cleaned.meta.json"))
+
+def get_source_fingerprint(filename=DATA_FILE, previous=None):
+    """
+    Build the cache key of a source csv: size, mtime, content hash and cleaning version.
+
+    Parameters:
+    - filename: CSV file path
+    - previous: fingerprint stored with the cache (optional)
+
+    Returns:
+    - dict fingerprint
+
+    Review note: hashing 200 MB on every start costs more than the cached load itself,
+    so the stored hash is reused when size and mtime are unchanged. 
+    Hash is only recomputed if the file was touched, e.g. re-downloaded with same content.
+    """
+    stat = os.stat(filename)
+    fingerprint = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "cleaning_version": CLEANING_VERSION,
+    }
+    if previous and all(previous.get(key) == value for key, value in fingerprint.items()):
+        fingerprint["sha256"] = previous["sha256"]
+    else:
+        fingerprint["sha256"] = file_content_hash(filename)
+    return fingerprint
+
+def read_cache_meta(meta_path):
+    """Return stored fingerprint dict, or None if no usable meta file."""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_cache_valid(stored, current):
+    """Cache is valid when content and cleaning rules match, mtime alone is not a change."""
+    return (stored is not None
+            and stored.get("sha256") == current["sha256"]
+            and stored.get("size") == current["size"]
+            and stored.get("cleaning_version") == current["cleaning_version"])
+
+def write_cleaned_cache_meta(fingerprint, meta_path):
+    """Rewrite only the meta file of an existing cache."""
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(fingerprint, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+@traced("load.read_parquet_cache")
+def read_cleaned_cache(parquet_path):
+    """Read the cleaned parquet cache, categories are mapped to the shared registry dtypes."""
+    return compact_clean_df(pd.read_parquet(parquet_path, memory_map=True))
+
+def get_quality_report_paths(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """Return (report csv path, report csv path of the previous release) beside the cleaned cache."""
+    parquet_path, _ = get_cache_paths(filename, cache_dir)
+    return (parquet_path.replace(".cleaned.parquet", ".quality.csv"),
+            parquet_path.replace(".cleaned.parquet", ".quality.previous.csv"))
+
+def write_quality_report(report, filename=DATA_FILE, cache_dir=CACHE_DIR, keep_previous=False):
+    """
+    Save the cleaning rule report as csv (small, readable, diffable between releases).
+    keep_previous: the existing report belongs to the previous release, keep it as .quality.previous.csv for drift checks.
+    """
+    report_path, previous_path = get_quality_report_paths(filename, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    if keep_previous and os.path.exists(report_path):
+        os.replace(report_path, previous_path)
+    report.to_csv(report_path + ".tmp")
+    os.replace(report_path + ".tmp", report_path)
+
+def read_quality_report(report_path):
+    """Return a saved cleaning rule report, or None if missing/broken."""
+    try:
+        return pd.read_csv(report_path, index_col=["crashYear", "region"])
+    except (OSError, ValueError):
+        return None
+
+def write_cleaned_cache(cleaned_df, fingerprint, filename=DATA_FILE, cache_dir=CACHE_DIR, report=None):
+    """
+    Save cleaned df as parquet (columnar, keeps category and small int types) with its fingerprint,
+    and the cleaning rule report if given.
+    Files are written to temp names first, so a crash in the middle never leaves a half cache.
+    """
+    parquet_path, meta_path = get_cache_paths(filename, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    if report is not None:
+        stored = read_cache_meta(meta_path)
+        new_release = stored is not None and stored.get("sha256") != fingerprint["sha256"]
+        write_quality_report(report, filename, cache_dir, keep_previous=new_release)
+    cleaned_df.to_parquet(parquet_path + ".tmp")
+    os.replace(parquet_path + ".tmp", parquet_path)
+    write_cleaned_cache_meta(fingerprint, meta_path) #meta is written last, it marks the parquet as complete
+
+def build_clean_df(filename=DATA_FILE, chunksize=None):
+    """Parse and clean the csv, in one go or streamed by chunks if chunksize is given, returns (cleaned df, report)."""
+    if chunksize:
+        return stream_clean_with_report(filename, chunksize)
+    return apply_cleaning_rules(load_raw_dataframe(filename))
+
+@traced("load.load_and_clean")
+def load_and_clean(filename=DATA_FILE, use_cache=True, cache_dir=CACHE_DIR, chunksize=None):
     """
     prepare for future use in main() features
     return a cleaned df ready for use later
+
+    Parameters:
+    - filename: CSV file path
+    - use_cache: read/write the parquet cache in cache_dir (default True)
+    - cache_dir: folder for cache files
+    - chunksize: if given, csv is streamed in chunks of this many rows (bounded memory)
+
+    Review note: parsing the csv dominates start time of cli and dashboard.
+    The cleaned df is cached as parquet and only rebuilt if source file or CLEANING_VERSION changed.
+    If pyarrow is not installed the cache is skipped and csv is parsed as before.
+    """
+    if not use_cache:
+        return build_clean_df(filename, chunksize)[0]
+
+    parquet_path, meta_path = get_cache_paths(filename, cache_dir)
+    stored = read_cache_meta(meta_path)
+    fingerprint = get_source_fingerprint(filename, previous=stored)
+
+    if is_cache_valid(stored, fingerprint) and os.path.exists(parquet_path):
+        try:
+            cleaned_df = read_cleaned_cache(parquet_path)
+            if stored != fingerprint: #file touched but same content, refresh meta to skip hashing next time
+                write_cleaned_cache_meta(fingerprint, meta_path)
+            return cleaned_df
+        except ImportError:
+            return build_clean_df(filename, chunksize)[0]
+        except (OSError, ValueError):
+            pass #broken cache file, rebuild below
+
+    cleaned_df, report = build_clean_df(filename, chunksize)
+    try:
+        write_cleaned_cache(cleaned_df, fingerprint, filename, cache_dir, report)
+    except (ImportError, OSError):
+        pass #no parquet engine or read-only folder, still return cleaned data
+    return cleaned_df
+
+def load_quality_report(filename=DATA_FILE, cache_dir=CACHE_DIR, previous=False):
+    """
+    Cleaning rule report of a csv (see cleaning_report), cached beside the cleaned parquet.
+
+    Parameters:
+    - previous: report of the release before the current csv instead (None if there is none)
+
+    Review note: the report is written with the cleaned cache, so it normally costs one csv read.
+    If it is missing (cache written without it, read-only folder) only the rules are run, no cleaned df is built.
     """
-    raw_df = load_raw_dataframe()
-    return prepare_clean_df(raw_df)
\ No newline at end of file
+    report_path, previous_path = get_quality_report_paths(filename, cache_dir)
+    if previous:
+        return read_quality_report(previous_path)
+    _, meta_path = get_cache_paths(filename, cache_dir)
+    stored = read_cache_meta(meta_path)
+    if not is_cache_valid(stored, get_source_fingerprint(filename, previous=stored)):
+        load_and_clean(filename, cache_dir=cache_dir) #rebuilds the cleaned cache together with the report
+        stored = read_cache_meta(meta_path)
+    if is_cache_valid(stored, get_source_fingerprint(filename, previous=stored)):
+        report = read_quality_report(report_path)
+        if report is not None:
+            return report
+    report = cleaning_report(load_raw_dataframe(filename))
+    try:
+        write_quality_report(report, filename, cache_dir)
+    except OSError:
+        pass
+    return report
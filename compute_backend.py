@@ -0,0 +1,161 @@
+"""
+Compute backends for counting cleaned rows.
+
+Purpose:
+generate_crash_table_by_year, calculate_count_table, get_crash_severity_summary and
+get_region_crash_counts_for_join all answer from the count cube (crash_cube.py); when they get a cleaned
+df, the cube is built first. This module makes that row -> count step pluggable:
+
+numpy: bincount over combined category codes (default, previous build_crash_cube code, no grouping step)
+pandas: DataFrame.groupby(...).size()
+arrow: pyarrow Table.group_by (multithreaded, Arrow thread pool)
+polars: polars group_by (multithreaded, optional, pip install polars)
+
+Every backend returns the group keys and counts; dense_counts turns them into the same cube,
+so all reports are identical whichever backend counted. Parity and timing:
+python -m benchmarks.backend_parity
+
+Key Functions:
+
+get_backend / set_backend: selected backend, default from environment variable CRASH_COMPUTE_BACKEND.
+
+count_rows: (counts array, labels, categorical columns) of a cleaned df, used by build_crash_cube.
+
+Usage:
+CRASH_COMPUTE_BACKEND=arrow python main.py table
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+BACKEND_ENV = "CRASH_COMPUTE_BACKEND"
+DEFAULT_BACKEND = "numpy"
+
+def axis_labels(cleaned_df, dimensions):
+    """
+    Labels of every cube axis and the categorical columns: category columns keep all categories
+    (unobserved too, as groupby observed=False), number columns the sorted observed values.
+    """
+    labels, categorical = {}, []
+    for column in dimensions:
+        series = cleaned_df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            labels[column] = list(series.cat.categories)
+            categorical.append(column)
+        else:
+            labels[column] = [int(x) for x in np.unique(series.dropna().to_numpy())] #years and speeds are whole numbers
+    return labels, categorical
+
+def dense_counts(group_keys, group_counts, labels, dimensions):
+    """
+    Dense count array from grouped results.
+
+    Parameters:
+    - group_keys: dict column -> array of group values (None/NaN for missing)
+    - group_counts: array of row counts per group
+    - labels: axis labels (axis_labels), every axis has an extra last slot for missing values
+
+    Returns: int32 array, one axis per dimension
+    """
+    shape = tuple(len(labels[column]) + 1 for column in dimensions)
+    positions = []
+    for column in dimensions:
+        codes = pd.Index(labels[column]).get_indexer(pd.Index(group_keys[column]))
+        codes[codes < 0] = len(labels[column]) #missing
+        positions.append(codes)
+    flat = np.ravel_multi_index(positions, shape)
+    counts = np.bincount(flat, weights=np.asarray(group_counts, dtype=np.float64), minlength=int(np.prod(shape)))
+    return counts.reshape(shape).astype(np.int32)
+
+def column_codes(series):
+    """Return (codes, labels, is_categorical) for one column, missing values get code len(labels)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        labels = list(series.cat.categories)
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+        is_categorical = True
+    else:
+        values = series.dropna().to_numpy()
+        labels, inverse = np.unique(values, return_inverse=True)
+        labels = [int(x) for x in labels] #years and speeds are whole numbers
+        codes = np.full(len(series), -1, dtype=np.int64)
+        codes[series.notna().to_numpy()] = inverse
+        is_categorical = False
+    codes[codes < 0] = len(labels)
+    return codes, labels, is_categorical
+
+def count_numpy(cleaned_df, dimensions):
+    """One bincount over combined codes, no grouping step (previous build_crash_cube)."""
+    codes, labels, categorical = [], {}, []
+    for column in dimensions:
+        column_codes_, labels[column], is_categorical = column_codes(cleaned_df[column])
+        codes.append(column_codes_)
+        if is_categorical:
+            categorical.append(column)
+    shape = tuple(len(labels[column]) + 1 for column in dimensions)
+    flat = np.ravel_multi_index(codes, shape)
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape).astype(np.int32)
+    return counts, labels, categorical
+
+def count_pandas(cleaned_df, dimensions):
+    labels, categorical = axis_labels(cleaned_df, dimensions)
+    grouped = cleaned_df.groupby(dimensions, observed=True, dropna=False, sort=False).size()
+    keys = {column: grouped.index.get_level_values(column) for column in dimensions}
+    return dense_counts(keys, grouped.to_numpy(), labels, dimensions), labels, categorical
+
+def _to_arrow(cleaned_df, dimensions):
+    import pyarrow as pa
+    return pa.Table.from_pandas(cleaned_df[dimensions], preserve_index=False)
+
+def count_arrow(cleaned_df, dimensions):
+    labels, categorical = axis_labels(cleaned_df, dimensions)
+    grouped = _to_arrow(cleaned_df, dimensions).group_by(dimensions, use_threads=True).aggregate([([], "count_all")])
+    keys = {column: grouped.column(column).to_pandas() for column in dimensions}
+    return dense_counts(keys, grouped.column("count_all").to_numpy(), labels, dimensions), labels, categorical
+
+def count_polars(cleaned_df, dimensions):
+    import polars as pl
+    labels, categorical = axis_labels(cleaned_df, dimensions)
+    grouped = pl.from_arrow(_to_arrow(cleaned_df, dimensions)).group_by(dimensions).len()
+    keys = {column: grouped[column].to_pandas() for column in dimensions}
+    return dense_counts(keys, grouped["len"].to_numpy(), labels, dimensions), labels, categorical
+
+BACKENDS = {"numpy": count_numpy, "pandas": count_pandas, "arrow": count_arrow, "polars": count_polars}
+#backend -> module it needs, checked when selected
+REQUIRED_MODULES = {"arrow": "pyarrow", "polars": "polars"}
+
+_selected = os.environ.get(BACKEND_ENV, DEFAULT_BACKEND)
+
+def available_backends():
+    """Backends whose libraries are installed."""
+    import importlib.util
+    return [name for name in BACKENDS
+            if name not in REQUIRED_MODULES or importlib.util.find_spec(REQUIRED_MODULES[name]) is not None]
+
+def set_backend(name):
+    """Select the backend for later cube builds (e.g. set_backend('arrow'))."""
+    global _selected
+    get_backend(name) #raises if unknown or not installed
+    _selected = name
+
+def get_backend(name=None):
+    """Return the count function of a backend (default: the selected one)."""
+    name = name or _selected
+    if name not in BACKENDS:
+        raise ValueError(f"unknown compute backend {name!r}, choose from {list(BACKENDS)}")
+    if name not in available_backends():
+        raise ImportError(f"compute backend {name!r} needs {REQUIRED_MODULES[name]}, pip install {REQUIRED_MODULES[name]}")
+    return BACKENDS[name]
+
+def count_rows(cleaned_df, dimensions, backend=None):
+    """
+    Count cleaned rows over dimensions.
+
+    Parameters:
+    - cleaned_df: output of load_and_clean
+    - dimensions: columns, one cube axis each
+    - backend: backend name (default: selected backend)
+
+    Returns: (int32 counts array, labels dict, categorical columns)
+    """
+    return get_backend(backend)(cleaned_df, dimensions)
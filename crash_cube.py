@@ -0,0 +1,268 @@
+"""
+Aggregate cube of crash counts.
+
+Purpose:
+Count crashes once over crashYear, effectiveSpeed, crashSeverity, weatherA, region and urban,
+and keep the counts as a dense NumPy array (one axis per column, indexed by category codes).
+Reports and dashboard views slice and sum the cube instead of scanning row-level data again.
+
+Key Functions:
+
+build_crash_cube: one pass over the cleaned df, np.bincount over the combined codes (or another compute_backend).
+
+CrashCube.filter: same meaning as df[df[col].isin(values)], unselected cells are set to 0.
+
+CrashCube.count_table: same meaning as df.groupby(columns, observed=False).size().unstack().
+
+load_crash_cube: cube saved as .npz beside the cleaned parquet cache, rebuilt with the same fingerprint.
+
+Note: every axis has one extra last slot for missing values (NaN), so totals still match the row count.
+The slot is never selected by filter and never shown in tables, same as isin/groupby on the df.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+from compute_backend import column_codes as _column_codes, count_rows #_column_codes also used by filter_engine
+from clean_data import DATA_FILE, CACHE_DIR, get_cache_paths, read_cache_meta, get_source_fingerprint, load_and_clean
+
+CUBE_DIMENSIONS = ["crashYear", "effectiveSpeed", "crashSeverity", "weatherA", "region", "urban"]
+CUBE_VERSION = 1 #bump when cube layout changes
+
+class CrashCube:
+    """
+    Dense count array with one axis per column in CUBE_DIMENSIONS.
+
+    Attributes:
+    - counts: numpy int32 array, shape is (number of labels + 1) per dimension
+    - labels: dict column -> list of values along the axis (missing slot not included)
+    - categorical: set of columns which were categorical in the df (all categories are kept in groupby)
+    """
+    def __init__(self, counts, labels, categorical):
+        self.counts = counts
+        self.labels = labels
+        self.categorical = set(categorical)
+
+    def axis(self, column):
+        """Return axis number of a column."""
+        return CUBE_DIMENSIONS.index(column)
+
+    def total(self):
+        """Number of rows counted in the cube (incl. missing values)."""
+        return int(self.counts.sum())
+
+    def filter(self, **selections):
+        """
+        Keep only rows whose value is in the given list for each column, e.g.
+        cube.filter(weatherA=["Fine"], effectiveSpeed=[50, 100])
+
+        Returns a new cube with the same axes, counts of unselected values are 0.
+        """
+        mask = np.ones(self.counts.shape, dtype=bool)
+        for column, values in selections.items():
+            axis = self.axis(column)
+            wanted = set(values)
+            keep = np.array([label in wanted for label in self.labels[column]] + [False]) #missing slot never matches isin
+            shape = [1] * self.counts.ndim
+            shape[axis] = len(keep)
+            mask = mask & keep.reshape(shape)
+        return CrashCube(np.where(mask, self.counts, 0), self.labels, self.categorical)
+
+    def marginal(self, column, include_missing=False):
+        """Return counts along one column as a numpy array (sum over all other axes)."""
+        axis = self.axis(column)
+        other_axes = tuple(i for i in range(self.counts.ndim) if i != axis)
+        totals = self.counts.sum(axis=other_axes, dtype=np.int64)
+        return totals if include_missing else totals[:-1]
+
+    def observed_values(self, column):
+        """Return values of a column which have at least one row, same as sorted(df[col].dropna().unique())."""
+        totals = self.marginal(column)
+        return sorted(label for label, count in zip(self.labels[column], totals) if count > 0)
+
+    def counts_by(self, column):
+        """
+        Same as df.groupby(column, observed=False).size():
+        categorical columns keep every category (0 if not observed), other columns only observed values.
+        """
+        return format_counts(self.marginal(column, include_missing=True), column, self.labels, self.categorical)
+
+    def count_table(self, row_column, col_column):
+        """
+        Same as df.groupby([row_column, col_column], observed=False).size().unstack(fill_value=0).
+
+        Rows of a non-categorical row_column are values observed in the cube (missing values of
+        col_column included, as groupby sees the row before dropping the NaN group).
+        """
+        row_axis, col_axis = self.axis(row_column), self.axis(col_column)
+        other_axes = tuple(i for i in range(self.counts.ndim) if i not in (row_axis, col_axis))
+        table = self.counts.sum(axis=other_axes, dtype=np.int64)
+        if row_axis > col_axis:
+            table = table.T
+        return format_count_table(table, row_column, col_column, self.labels, self.categorical)
+
+def format_counts(totals, column, labels, categorical):
+    """
+    Series of counts for one column from totals along its axis (missing slot included).
+    Shared by CrashCube and filter_engine, so both give the same output as groupby.
+    """
+    series = pd.Series(totals[:-1], index=pd.Index(labels[column], name=column))
+    if column not in categorical:
+        series = series[series > 0] #only observed values, labels are sorted
+    return series
+
+def format_count_table(table, row_column, col_column, labels, categorical):
+    """DataFrame of a 2D count table (missing slots included as last row/column), see CrashCube.count_table."""
+    row_totals = table.sum(axis=1)[:-1]
+    table = table[:-1, :-1] #drop missing slots
+
+    rows = labels[row_column]
+    if row_column not in categorical:
+        keep = row_totals > 0
+        table = table[keep]
+        rows = [label for label, k in zip(rows, keep) if k]
+    return pd.DataFrame(table, index=pd.Index(rows, name=row_column),
+                        columns=pd.Index(labels[col_column], name=col_column))
+
+
+@traced("cube.build")
+def build_crash_cube(cleaned_df, backend=None):
+    """
+    Build the count cube from cleaned df (output of load_and_clean).
+
+    Parameters:
+    - cleaned_df: cleaned df with columns in CUBE_DIMENSIONS
+    - backend: compute backend name (numpy/pandas/arrow/polars, default: compute_backend selection)
+
+    Return: CrashCube
+
+    Review note: one bincount over combined codes replaces a groupby per report,
+    the counting itself is pluggable (compute_backend.py), every backend gives the same cube.
+    """
+    counts, labels, categorical = count_rows(cleaned_df, CUBE_DIMENSIONS, backend)
+    return CrashCube(counts, labels, categorical)
+
+def _encode_rows(df, labels):
+    """Return flat cube positions of every row of df for the given axis labels."""
+    codes = []
+    for column in CUBE_DIMENSIONS:
+        column_codes = pd.Index(labels[column]).get_indexer(df[column].astype(object)) #missing or unknown -> -1
+        column_codes[column_codes < 0] = len(labels[column])
+        codes.append(column_codes)
+    shape = tuple(len(labels[column]) + 1 for column in CUBE_DIMENSIONS)
+    return np.ravel_multi_index(codes, shape)
+
+def update_crash_cube(cube, removed_df, added_df):
+    """
+    Apply a row delta to the cube without recounting unchanged rows.
+
+    Parameters:
+    - cube: CrashCube of the previous data
+    - removed_df: cleaned rows which are deleted or replaced
+    - added_df: cleaned rows which are inserted or replaced, its category dtypes are the new ones
+
+    Returns:
+    - new CrashCube, same as build_crash_cube on the updated cleaned df
+
+    Review note: labels can change between releases (new year, new speed, new category),
+    so old counts are copied into the new axes before the delta is applied.
+    """
+    labels = {}
+    for column in CUBE_DIMENSIONS:
+        if column in cube.categorical:
+            labels[column] = list(added_df[column].cat.categories)
+        else:
+            added_values = {int(x) for x in added_df[column].dropna().unique()}
+            labels[column] = sorted(set(cube.labels[column]) | added_values)
+
+    old_positions, new_positions = [], []
+    for column in CUBE_DIMENSIONS:
+        lookup = {label: i for i, label in enumerate(labels[column])}
+        pairs = [(i, lookup[label]) for i, label in enumerate(cube.labels[column]) if label in lookup]
+        pairs.append((len(cube.labels[column]), len(labels[column]))) #missing slot
+        old_positions.append([old for old, _ in pairs])
+        new_positions.append([new for _, new in pairs])
+
+    shape = tuple(len(labels[column]) + 1 for column in CUBE_DIMENSIONS)
+    counts = np.zeros(shape, dtype=np.int64)
+    counts[np.ix_(*new_positions)] = cube.counts[np.ix_(*old_positions)]
+    #categories dropped in new release have no rows left after removing deleted/changed rows
+
+    size = counts.size
+    flat = counts.reshape(-1)
+    flat -= np.bincount(_encode_rows(removed_df, labels), minlength=size)
+    flat += np.bincount(_encode_rows(added_df, labels), minlength=size)
+
+    #years/speeds without any row left are dropped, same as a fresh build
+    for column in CUBE_DIMENSIONS:
+        if column in cube.categorical:
+            continue
+        axis = CUBE_DIMENSIONS.index(column)
+        other_axes = tuple(i for i in range(counts.ndim) if i != axis)
+        keep = counts.sum(axis=other_axes) > 0
+        keep[-1] = True
+        counts = np.compress(keep, counts, axis=axis)
+        labels[column] = [label for label, k in zip(labels[column], keep[:-1]) if k]
+
+    return CrashCube(counts.astype(np.int32), labels, cube.categorical)
+
+def as_crash_cube(data):
+    """
+    Return data if it is a cube already, otherwise build the cube from a cleaned df.
+    Objects with the same query API (filter_engine.BitmapIndex / BitmapSelection,
+    partitioned_store.PartitionedStore) are returned as they are.
+    """
+    if isinstance(data, CrashCube) or hasattr(data, "count_table"):
+        return data
+    return build_crash_cube(data)
+
+def get_cube_path(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """Cube file lives beside the parquet cache of the same csv."""
+    parquet_path, _ = get_cache_paths(filename, cache_dir)
+    return parquet_path.replace(".cleaned.parquet", ".cube.npz")
+
+def save_crash_cube(cube, path, fingerprint):
+    """Save counts and labels (as json) with the source fingerprint into one npz file."""
+    meta = {
+        "fingerprint": fingerprint,
+        "cube_version": CUBE_VERSION,
+        "labels": cube.labels,
+        "categorical": sorted(cube.categorical),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        np.savez_compressed(f, counts=cube.counts, meta=np.array(json.dumps(meta)))
+    os.replace(path + ".tmp", path)
+
+def read_crash_cube(path):
+    """Return (cube, meta dict) from an npz file, or (None, None) if missing/broken."""
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return CrashCube(data["counts"], meta["labels"], meta["categorical"]), meta
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+@traced("cube.load")
+def load_crash_cube(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """
+    Return the cube for a csv, read from cache if the source fingerprint still matches.
+    Otherwise build from load_and_clean (which uses its own parquet cache) and save it.
+    """
+    _, meta_path = get_cache_paths(filename, cache_dir)
+    fingerprint = get_source_fingerprint(filename, previous=read_cache_meta(meta_path))
+    cube_path = get_cube_path(filename, cache_dir)
+    cube, meta = read_crash_cube(cube_path)
+    if (cube is not None and meta.get("cube_version") == CUBE_VERSION
+            and meta["fingerprint"].get("sha256") == fingerprint["sha256"]
+            and meta["fingerprint"].get("cleaning_version") == fingerprint["cleaning_version"]):
+        return cube
+
+    cube = build_crash_cube(load_and_clean(filename, cache_dir=cache_dir))
+    try:
+        save_crash_cube(cube, cube_path, fingerprint)
+    except OSError:
+        pass #read-only folder, cube is still usable in memory
+    return cube
@@ -8,7 +8,8 @@ to visualize crash data as stacked bar charts and geographic maps.
 
 Key Functions:
 
-calculate_count_table: Generates a crash count table by speed and severity.
+calculate_count_table (from main.py, so the query server and benchmarks use it without streamlit):
+Generates a crash count table by speed and severity.
 
 get_weather_filter, get_dashboard_filter: Provides filter options for weather, speed, and severity categories.
 
@@ -17,37 +18,37 @@ run_dashboard: Combines the dashboard logic into two tabs:
 Tab 1: Displays the crash count table and stacked bar chart.
 
 Tab 2: Displays crash map for selected years and a summary crash count table by region.
+Map frames are served from map_render_cache, all slider years are prerendered in background.
+All years can also be shown at once as small multiples (map_animation) with a shared colour scale,
+and crash coordinates as a hexagon density map (spatial_index) for the selected year and filters.
+Dataset, filter results, tables and figures are shared by all sessions through dashboard_cache.
+The sidebar profiling panel shows timing spans (instrumentation.py) and can cProfile one rerun.
+Default views are precomputed in background after every data refresh (warmup.py), progress is shown in the sidebar.
 """
 
 
+import io
+import json
 import streamlit as st
-import matplotlib.pyplot as plt
-from map_plotting import generate_region_crash_map_by_year
+import instrumentation
+from instrumentation import capture_profile, traced
+from dashboard_cache import DashboardCache
+from shared_dataset import shared_or_local_cube
 from map_plotting import get_region_crash_counts_for_join #generic function, use to slice df by region and year
-from clean_data import load_and_clean
+from map_render_cache import MapRenderCache, map_render_jobs, region_counts_records, YEAR_RANGE
+from map_animation import region_counts_long_table, render_small_multiples, sequence_key
+from main import calculate_count_table, generate_crash_table_by_year
+from warmup import WarmupScheduler, default_selections
+from crash_cube import as_crash_cube
+from clean_data import UNKNOWN_WEATHER
+from partitioned_store import load_partitioned_store
+from spatial_index import plot_crash_density, point_arrays
 
 SEVERITY_ORDER = ["Fatal Crash", "Serious Crash", "Minor Crash", "Non-Injury Crash"]
 
-def calculate_count_table(df, SEVERITY_ORDER):
-    """
-    refactor from proportion calculate function. now similar to main calculation function.
-    retain for better adjustment and documentation.
-    
-    Note: original design was    
-    Group by weather and severity, then calculate and generate percentage table with 'div' method.
-    """
-    grouped = df.groupby(['effectiveSpeed','crashSeverity'], observed=False).size().unstack(fill_value=0)
-    #size for count every sev category by each speed
-    #unstack to transfer sev to columns
-    grouped = grouped.reindex(columns=SEVERITY_ORDER, fill_value=0)
-    return grouped
-
 def get_weather_filter(df):
     """a subfunction for select 'weatherA' for another dimension to study weather impact"""
-    filtered_weatherA = df.loc[
-    df['weatherA'].notna() & (df['weatherA'] != 'Null'),
-    'weatherA']
-    weathers = sorted(filtered_weatherA.unique())
+    weathers = [w for w in as_crash_cube(df).observed_values('weatherA') if w != UNKNOWN_WEATHER] #flagged by clean_data rule weather_null
     selected = st.sidebar.multiselect("Select weather status", weathers, default=weathers) #as tested, side bar is tab-wised, cannot delete from other tabs.
     # the filter still works in new tab!!!
     return selected
@@ -56,52 +57,173 @@ def get_dashboard_filter(df, column_name, label):
     """
     General filter function for any categorical column. combine speed and severity filter
     """
-    unique_values = sorted(df[column_name].dropna().unique())
+    unique_values = as_crash_cube(df).observed_values(column_name)
     selected = st.sidebar.multiselect(label, unique_values, default=unique_values)
     return selected
 
+@traced("render.stacked_bar_png", rows=None)
+def render_stacked_bar_png(crash_count_table):
+    """Plot the stacked bar chart of a count table and return it as png bytes (cached per filter selection)."""
+    import matplotlib.pyplot as plt #loaded with the first chart, not at app start
+    fig, axes = plt.subplots(figsize = (10,6)) #plot a sub graph under crash count table
+    crash_count_table.plot (kind = 'bar', stacked = True, ax = axes)
+    axes.set_xlabel("Speed Limit")
+    axes.set_ylabel("Crash Counts")
+    axes.set_title('Crash Count Table')
+    axes.legend(title = 'Crash Severity')
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig) #figure is kept as bytes only
+    return buffer.getvalue()
+
+@traced("render.density_png", rows=None)
+def render_density_png(store, year, selections):
+    """Hexagon density map of the selected crashes of one year as png bytes (cached per year and selection)."""
+    import matplotlib.pyplot as plt
+    rows = store.read_rows(crashYear=[year], **selections) #only partitions of this year are read
+    fig = plot_crash_density(*point_arrays(rows), title=f"Crash Density of {year}")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+@st.cache_resource(max_entries=1)
+def get_partitioned_store(reloads):
+    """Year/region partitioned rows (with X/Y) for the density map, no row is held in memory.
+    reloads is the dashboard_cache reload count, after a data refresh the store is checked (and rebuilt) again."""
+    return load_partitioned_store()
+
+@st.cache_resource
+def get_map_render_cache():
+    """One render cache per server process, shared by all sessions and reruns."""
+    return MapRenderCache()
+
+@st.cache_resource
+def get_dashboard_cache():
+    """One dataset and memo set per server process, cache_resource returns the object itself (no copy).
+    In server mode (CRASH_SHARED_NAME set) the dataset is attached from shared memory instead of loaded."""
+    return DashboardCache(loader=shared_or_local_cube)
+
+def build_warmup_tasks(dashboard_cache, render_cache):
+    """
+    Default views of both tabs for the warm-up scheduler, in default order:
+    count table of tab 1, table by year, then the map of every slider year (rendered in the process pool).
+    Names are the ones run_dashboard passes to touch().
+    The stacked bar is left out, pyplot must not draw in two threads at once.
+    """
+    def build(dataset):
+        selections = default_selections(dataset)
+        tasks = [("table:speed_severity", lambda: dashboard_cache.count_table(
+                      lambda d: calculate_count_table(d, SEVERITY_ORDER), name="speed_severity", **selections)),
+                 ("table:by_year", lambda: dashboard_cache.count_table(generate_crash_table_by_year, name="by_year"))]
+        for year in YEAR_RANGE:
+            tasks.append((f"map:{year}", lambda year=year: render_cache.prerender(
+                [(region_counts_records(dashboard_cache.filtered(**selections), year), year, "OrRd", "png")])))
+        return tasks
+    return build
+
+@st.cache_resource
+def get_warmup_scheduler():
+    """One warm-up thread per server process, started with the first session and kept running."""
+    return WarmupScheduler(get_dashboard_cache(), build_warmup_tasks(get_dashboard_cache(), get_map_render_cache())).start()
+
+def show_warmup_progress(scheduler):
+    """Sidebar progress bar while default views are being prepared."""
+    progress = scheduler.progress()
+    if progress["total"] and not progress["warm"]:
+        st.sidebar.progress(progress["fraction"], text=f"Preparing views in background {progress['done']}/{progress['total']}")
+
+def show_cache_debug_panel(dashboard_cache, render_cache, scheduler=None):
+    """Sidebar panel with hit/miss counters, hidden unless ticked."""
+    if st.sidebar.checkbox("Show cache debug panel", value=False):
+        st.sidebar.subheader("Cache statistics")
+        stats = {"dashboard": dashboard_cache.stats(), "map frames": render_cache.stats()}
+        if scheduler is not None:
+            stats["warm-up"] = scheduler.progress()
+        st.sidebar.json(stats)
+        if st.sidebar.button("Clear dashboard caches"):
+            dashboard_cache.invalidate()
+            if scheduler is not None:
+                scheduler.refresh() #warm the default views again
+
+def _toggle_profiling():
+    instrumentation.enable(st.session_state["profiling"]) #process-wide, sessions that never tick it do not change it
+
+def _request_cprofile():
+    st.session_state["capture_cprofile"] = True
+
+def show_profiling_panel():
+    """Sidebar panel with timing spans of this server process, recording runs while ticked (or CRASH_PROFILE=1)."""
+    st.sidebar.checkbox("Show profiling panel", value=instrumentation.is_enabled(), key="profiling", on_change=_toggle_profiling)
+    if not st.session_state["profiling"]:
+        return
+    st.sidebar.subheader("Profiling (all sessions)")
+    st.sidebar.dataframe(instrumentation.summary(), hide_index=True)
+    st.sidebar.download_button("Download trace (Chrome json)", json.dumps(instrumentation.chrome_trace()),
+                               file_name="dashboard_trace.json", mime="application/json")
+    st.sidebar.button("cProfile next rerun", on_click=_request_cprofile)
+    if st.sidebar.button("Clear spans"):
+        instrumentation.clear()
+
+def run_dashboard_profiled():
+    """Entry point, runs run_dashboard under cProfile once when the profiling panel asked for it."""
+    if not st.session_state.pop("capture_cprofile", False):
+        run_dashboard()
+        return
+    with capture_profile(limit=40) as profile:
+        run_dashboard()
+    with st.expander("cProfile of this rerun", expanded=True):
+        st.code(profile["stats"])
+
 def run_dashboard():
     """a function to generate dashboard for users.
     The dashboard shows the proportion of severity types under different weatherA conditons
     """
-    df = load_and_clean()
+    dashboard_cache = get_dashboard_cache()
+    render_cache = get_map_render_cache()
+    scheduler = get_warmup_scheduler()
+    df = dashboard_cache.dataset() #shared count cube, all views are sliced from it, no row-level rescans
     tab1, tab2 = st.tabs(["Crash Count Visual Report", "Annual Crash Amounts by Region"])
 
     with tab1:
         weather_types = get_weather_filter(df) #use sub-function for filter application
-        df = df[df["weatherA"].isin(weather_types)] #slice
+        df = dashboard_cache.filtered(weatherA=weather_types) #slice, memoized per selection
         speed_types = get_dashboard_filter(df, 'effectiveSpeed', "Select speed limit")
-        df = df[df["effectiveSpeed"].isin(speed_types)]
+        df = dashboard_cache.filtered(weatherA=weather_types, effectiveSpeed=speed_types)
         selected_severities = get_dashboard_filter(df, 'crashSeverity', "Select Crash Severity Types")
-        df = df[df['crashSeverity'].isin(selected_severities)]
+        selections = {"weatherA": weather_types, "effectiveSpeed": speed_types, "crashSeverity": selected_severities}
+        df = dashboard_cache.filtered(**selections)
 
-        if df.empty: #use boolean
+        if df.total() == 0: #use boolean
             #for plotting, error appears if no data selected
             #add warning to remind user, aviod error output
             st.warning("No data available for the selected filters. Please select at least one criteria.")
         else:
-            crash_count_table = calculate_count_table(df, SEVERITY_ORDER)
+            scheduler.touch("table:speed_severity")
+            crash_count_table = dashboard_cache.count_table(lambda d: calculate_count_table(d, SEVERITY_ORDER),
+                                                            name="speed_severity", **selections)
 
             st.title("Crash Count Visual Report")
             st.subheader("Crash Count Table")
             st.dataframe(crash_count_table) #print the crash count table
 
             st.subheader("Stacked Bar Chart")
-            fig, axes = plt.subplots(figsize = (10,6)) #plot a sub graph under crash count table
-            crash_count_table.plot (kind = 'bar', stacked = True, ax = axes)
-            axes.set_xlabel("Speed Limit")
-            axes.set_ylabel("Crash Counts")
-            axes.set_title('Crash Count Table')
-            axes.legend(title = 'Crash Severity')
-            st.pyplot(fig)
+            bar_png = dashboard_cache.figure("stacked_bar", lambda: render_stacked_bar_png(crash_count_table), **selections)
+            st.image(bar_png)
+
+        with st.expander("Crash Count by Year (all data)"):
+            scheduler.touch("table:by_year")
+            st.dataframe(dashboard_cache.count_table(generate_crash_table_by_year, name="by_year"))
 
     with tab2:
         st.title("Annual Crash Amounts by Region")
-        selected_year = st.slider("Select year for crash map", min_value=2000, max_value=2024, value=2000) #defalut step is 1
+        selected_year = st.slider("Select year for crash map", min_value=YEAR_RANGE.start, max_value=YEAR_RANGE.stop - 1, value=2000) #defalut step is 1
         st.caption(f"Displaying crash counts for year {selected_year}")
-        fig = generate_region_crash_map_by_year(df, selected_year, cmap="OrRd") 
+        scheduler.touch(f"map:{selected_year}") #warmed first after the next data refresh
+        map_png = render_cache.get_or_render(region_counts_records(df, selected_year), selected_year, cmap="OrRd")
         #pass selected year to plotting function, color from orange to red
-        st.pyplot(fig)
+        st.image(map_png)
+        render_cache.prerender(map_render_jobs(df, YEAR_RANGE, cmap="OrRd", fmt="png")) #other years in background, cached ones are skipped
 
         # generate and display crash table sorted by region, use as legend
         region_df = get_region_crash_counts_for_join(df, selected_year)
@@ -109,9 +231,30 @@ def run_dashboard():
         st.subheader("Crash Count by Region")
         st.dataframe(region_df_sorted.rename(columns={"region": "Region", "CrashCount": "Crash Count"}))
 
+        if st.checkbox("Show crash density (hexagons)", value=False):
+            store = get_partitioned_store(dashboard_cache.reloads)
+            density_png = dashboard_cache.figure(f"density:{selected_year}",
+                                                 lambda: render_density_png(store, selected_year, selections), **selections)
+            st.image(density_png)
+
+        if st.checkbox("Show all years (same colour scale)", value=False):
+            long_table = region_counts_long_table(df, YEAR_RANGE)
+            grid_key = sequence_key(long_table, "grid")
+            grid_png = render_cache.get(grid_key)
+            if grid_png is None: #one image for all years, kept in the same frame cache
+                grid_png = render_small_multiples(long_table, io.BytesIO()).getvalue()
+                render_cache.put(grid_key, grid_png)
+            st.image(grid_png)
+            st.download_button("Download region counts of all years (csv)", long_table.to_csv(index=False),
+                               file_name=f"region_counts_{YEAR_RANGE.start}_{YEAR_RANGE.stop - 1}.csv", mime="text/csv")
+
+    show_warmup_progress(scheduler)
+    show_cache_debug_panel(dashboard_cache, render_cache, scheduler)
+    show_profiling_panel()
+
 
 
 if __name__ == "__main__":
-    run_dashboard()
+    run_dashboard_profiled()
 
 #streamlit run dashboard_app.py
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+Caching layer for the dashboard.
+
+Purpose:
+Keep one dataset per server process (shared by all sessions and reruns, never copied),
+and memoize filter results, count tables and figures per filter selection.
+All memos are bounded and cleared when the data file changes.
+
+Key Functions:
+
+MemoCache: small thread-safe LRU with hit/miss counters and optional byte budget.
+
+DashboardCache.dataset: the shared crash cube, reloaded if size or mtime of the csv changed.
+
+DashboardCache.filtered / count_table / figure: memoized views keyed on the multiselect selections.
+
+Note: this module does not import streamlit, dashboard_app wraps one DashboardCache
+in st.cache_resource so the same object is returned to every session.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from clean_data import DATA_FILE
+from crash_cube import load_crash_cube
+from instrumentation import span
+
+class MemoCache:
+    """
+    Bounded LRU memo.
+
+    Parameters:
+    - maxsize: max number of entries
+    - max_bytes: optional budget, entry size is given by sizeof
+    - sizeof: function value -> bytes (default: len for bytes, else 0)
+    """
+    def __init__(self, maxsize=128, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: len(value) if isinstance(value, (bytes, bytearray)) else 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_or_compute(self, key, compute):
+        """Return cached value for key, or compute(), store and return it."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = compute() #outside the lock, slow work does not block other sessions
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self.bytes += self.sizeof(value)
+                self._evict()
+        return value
+
+    def get(self, key, default=None):
+        """Return cached value (counted as hit) or default (counted as miss), nothing is computed."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Store a value computed elsewhere (e.g. in an async task)."""
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self.sizeof(self._entries.pop(key))
+            self._entries[key] = value
+            self.bytes += self.sizeof(value)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > 1 and (len(self._entries) > self.maxsize or
+                                          (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, value = self._entries.popitem(last=False)
+            self.bytes -= self.sizeof(value)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "bytes": self.bytes}
+
+def _counts_nbytes(view):
+    """Memory of a filtered view, count array of a cube or bitmap of a filter_engine selection."""
+    return view.nbytes if hasattr(view, "nbytes") else view.counts.nbytes
+
+def selection_key(**selections):
+    """Normalise multiselect selections into a hashable key, order of chosen items does not matter."""
+    return tuple((column, tuple(sorted(values))) for column, values in selections.items())
+
+class DashboardCache:
+    """
+    Process-wide dataset plus memoized dashboard views.
+
+    Parameters:
+    - filename: CAS csv path, watched for changes
+    - loader: function filename -> dataset (default load_crash_cube)
+    """
+    def __init__(self, filename=DATA_FILE, loader=load_crash_cube):
+        self.filename = filename
+        self.loader = loader
+        self.filters = MemoCache(maxsize=256, max_bytes=128 * 1024 * 1024, sizeof=_counts_nbytes)
+        self.tables = MemoCache(maxsize=256)
+        self.figures = MemoCache(maxsize=64, max_bytes=32 * 1024 * 1024)
+        self.reloads = 0
+        self._dataset = None
+        self._file_state = None
+        self._lock = threading.Lock()
+
+    def _current_file_state(self):
+        stat = os.stat(self.filename)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _clear_memos(self):
+        for memo in (self.filters, self.tables, self.figures):
+            memo.clear()
+
+    def invalidate(self):
+        """Drop dataset and every memo, next call reloads."""
+        with self._lock:
+            self._dataset = None
+            self._file_state = None
+            self._clear_memos()
+
+    def dataset(self):
+        """
+        Return the shared dataset, reload and clear memos if the data file changed.
+        Only os.stat per call, the loader itself checks the content hash.
+        """
+        state = self._current_file_state()
+        with self._lock: #other sessions wait for the reload instead of loading their own copy
+            if state != self._file_state:
+                self._clear_memos()
+                self._dataset = self.loader(self.filename)
+                self._file_state = state
+                self.reloads += 1
+            return self._dataset
+
+    def _key(self, *parts, **selections):
+        #reload count is part of the key, a result computed from an old dataset is never served
+        return (self.reloads,) + parts + selection_key(**selections)
+
+    def filtered(self, **selections):
+        """Memoized dataset.filter(**selections), e.g. filtered(weatherA=[...], effectiveSpeed=[...])."""
+        dataset = self.dataset()
+        with span("dashboard.filter", columns=",".join(selections)) as record: #one span per filter step, memo hits included
+            result = self.filters.get_or_compute(self._key(**selections), lambda: dataset.filter(**selections))
+            record["rows"] = result.total()
+        return result
+
+    def count_table(self, compute, name="count_table", **selections):
+        """Memoized table for a filter selection, compute gets the filtered dataset.
+        name tells different tables of the same selection apart."""
+        filtered = self.filtered(**selections)
+        with span("dashboard.count_table", table=name):
+            return self.tables.get_or_compute(self._key(name, **selections), lambda: compute(filtered))
+
+    def figure(self, name, compute, **selections):
+        """Memoized figure bytes for a filter selection, compute returns image bytes."""
+        self.dataset() #reload check
+        with span("dashboard.figure", figure=name):
+            return self.figures.get_or_compute(self._key(name, **selections), compute)
+
+    def stats(self):
+        """Counters for the debug panel."""
+        return {"reloads": self.reloads, "filters": self.filters.stats(),
+                "tables": self.tables.stats(), "figures": self.figures.stats()}
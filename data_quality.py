@@ -0,0 +1,105 @@
+"""
+Data quality report of the cleaning rules, and drift between CAS releases.
+
+Purpose:
+clean_data.apply_cleaning_rules counts what every rule of CLEANING_RULES did (rows rejected, values normalized,
+rows flagged) by crashYear and region, and the report is cached beside the cleaned parquet. When a new
+release replaces the csv the old report is kept as .quality.previous.csv. This module prints the report and
+compares the share of rows each rule touches between the two releases, so a change in the NZTA export
+(e.g. many more rows without speed limit for one year) is seen before it shows up in the reports.
+
+Key Functions:
+
+rule_totals: rows and share of rows_in per rule.
+
+rule_shares: share of rows_in per rule by year or region.
+
+compare_reports: share per rule and group in the previous and current release, largest change first.
+
+Usage (from project folder):
+python data_quality.py                       #rule totals of the current csv
+python data_quality.py --by region           #shares per region
+python data_quality.py --drift --threshold 0.5   #compare with the previous release, exit 1 above 0.5 points
+"""
+
+import argparse
+import sys
+import pandas as pd
+from clean_data import CACHE_DIR, CLEANING_RULES, DATA_FILE, load_quality_report
+
+RULE_COLUMNS = list(CLEANING_RULES)
+
+def rule_totals(report):
+    """DataFrame indexed by rule: action, rows and percent of rows_in over the whole report."""
+    rows_in = int(report["rows_in"].sum())
+    totals = report[RULE_COLUMNS].sum()
+    return pd.DataFrame({"action": [CLEANING_RULES[rule][0] for rule in RULE_COLUMNS], "rows": totals.astype(int),
+                         "percent": (totals / max(rows_in, 1) * 100).round(3)}, index=pd.Index(RULE_COLUMNS, name="rule"))
+
+def rule_shares(report, by="crashYear"):
+    """Percent of rows_in touched by each rule, one row per value of by (crashYear or region)."""
+    grouped = report.groupby(level=by).sum()
+    return grouped[RULE_COLUMNS].div(grouped["rows_in"].where(grouped["rows_in"] > 0), axis=0) * 100
+
+def compare_reports(previous, current, by="crashYear"):
+    """
+    Share change per rule and group between two releases.
+
+    Parameters:
+    - previous / current: reports (load_quality_report)
+    - by: crashYear or region
+
+    Returns:
+    - long DataFrame with columns by, rule, previous_percent, current_percent, change (percentage points),
+      sorted by absolute change. Groups only present in one release compare with 0.
+    """
+    before, after = rule_shares(previous, by), rule_shares(current, by)
+    before, after = before.align(after, fill_value=0)
+    drift = pd.DataFrame({"previous_percent": before.stack(), "current_percent": after.stack()})
+    drift.index.names = [by, "rule"]
+    drift["change"] = drift["current_percent"] - drift["previous_percent"]
+    drift = drift.reset_index()
+    return drift.reindex(drift["change"].abs().sort_values(ascending=False, kind="stable").index).reset_index(drop=True)
+
+def print_rule_totals(report):
+    """Print rule totals in report style."""
+    rows_in, rows_out = int(report["rows_in"].sum()), int(report["rows_out"].sum())
+    print("Cleaning Rule Report")
+    print(f"Rows read: {rows_in}")
+    print(f"Rows kept: {rows_out} ({rows_out / max(rows_in, 1):.2%})\n")
+    print(rule_totals(report).to_string())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cleaning rule report and drift between releases")
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--by", choices=["crashYear", "region"], default=None, help="percent per year or region")
+    parser.add_argument("--drift", action="store_true", help="compare with the report of the previous release")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="with --drift: exit code 1 if a share changed more than this many percentage points")
+    parser.add_argument("--top", type=int, default=20, help="rows of the drift table")
+    args = parser.parse_args(argv)
+
+    report = load_quality_report(args.file, args.cache_dir)
+    if not args.drift:
+        print_rule_totals(report)
+        if args.by:
+            print(f"\nPercent of rows by {args.by}")
+            print(rule_shares(report, args.by).round(2).to_string())
+        return 0
+
+    previous = load_quality_report(args.file, args.cache_dir, previous=True)
+    if previous is None:
+        print("No report of a previous release yet (it is kept when the csv is replaced and cleaned again).")
+        return 0
+    drift = compare_reports(previous, report, args.by or "crashYear")
+    print(f"Largest changes of rule shares (percentage points) by {args.by or 'crashYear'}")
+    print(drift.head(args.top).round(3).to_string(index=False))
+    if args.threshold is not None:
+        above = drift[drift["change"].abs() > args.threshold]
+        print(f"\n{len(above)} share(s) changed more than {args.threshold} points")
+        return 1 if len(above) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Bitmap filter engine for row-level queries.
+
+Purpose:
+Index the cleaned df once with one packed bitmap (1 bit per row) for every value of
+crashYear, effectiveSpeed, crashSeverity, weatherA, region and urban.
+Filters of any AND/OR/NOT combination are bitwise operations on the bitmaps,
+counts and group counts are read from the selected codes, rows are never copied.
+
+Key Functions:
+
+Q: filter expression, Q(weatherA=["Fine"], effectiveSpeed=[50, 100]) means the same as chained isin filters,
+expressions combine with & (and), | (or) and ~ (not).
+
+BitmapIndex: per-value bitmaps and code arrays of the cleaned df, select(query) returns a BitmapSelection.
+The index itself answers the CrashCube queries for all rows, so it can be the dataset of
+DashboardCache(loader=load_filter_index) or be passed to the main.py reports.
+
+BitmapSelection: same query API as CrashCube (filter, total, observed_values, counts_by, count_table),
+so main.py reports and dashboard functions accept it, plus row_ids/rows for row-level output.
+
+load_filter_index: BitmapIndex of the cached cleaned data.
+
+parse_filter_terms: "column=value1,value2" command line terms -> Q, used by batch_reports --where/--exclude.
+
+Note: the cube answers AND-of-isin filters faster (no row scan at all), use this engine
+for OR/NOT combinations or when the matching rows themselves are needed.
+"""
+
+import numpy as np
+from clean_data import DATA_FILE, CACHE_DIR, load_and_clean
+from crash_cube import CUBE_DIMENSIONS, CrashCube, _column_codes, format_counts, format_count_table
+
+if hasattr(np, "bitwise_count"): #numpy 2.0+
+    def popcount(bitmap):
+        """Number of set bits in a packed bitmap."""
+        return int(np.bitwise_count(bitmap).sum(dtype=np.int64))
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(bitmap):
+        """Number of set bits in a packed bitmap."""
+        return int(_POPCOUNT_TABLE[bitmap].sum(dtype=np.int64))
+
+class Q:
+    """
+    Filter expression.
+
+    Q(col=[values], ...) keeps rows whose value is in the list for every given column
+    (missing values never match, same as isin). Q() matches every row.
+    """
+    def __init__(self, **selections):
+        self.op = "isin"
+        self.selections = selections
+        self.children = ()
+
+    @classmethod
+    def _combine(cls, op, *children):
+        expression = cls()
+        expression.op = op
+        expression.children = children
+        return expression
+
+    def __and__(self, other):
+        return Q._combine("and", self, other)
+
+    def __or__(self, other):
+        return Q._combine("or", self, other)
+
+    def __invert__(self):
+        return Q._combine("not", self)
+
+    def __repr__(self):
+        if self.op == "isin":
+            return f"Q({', '.join(f'{col}={values!r}' for col, values in self.selections.items())})"
+        if self.op == "not":
+            return f"~{self.children[0]!r}"
+        return f"({self.children[0]!r} {'&' if self.op == 'and' else '|'} {self.children[1]!r})"
+
+class BitmapIndex:
+    """
+    Packed bitmaps of every column value.
+
+    Attributes:
+    - n_rows: number of rows of the indexed df
+    - labels / categorical: same axis labels as build_crash_cube, so outputs match the cube
+    - codes: dict column -> int16/int32 code per row (missing value = len(labels))
+    - bitmaps: dict column -> uint8 array (number of labels, ceil(n_rows / 8))
+    """
+    def __init__(self, cleaned_df):
+        self.df = cleaned_df #kept for rows(), not copied
+        self.n_rows = len(cleaned_df)
+        self.labels, self.codes, self.bitmaps = {}, {}, {}
+        self.categorical = set()
+        for column in CUBE_DIMENSIONS:
+            codes, self.labels[column], is_categorical = _column_codes(cleaned_df[column])
+            n_labels = len(self.labels[column])
+            codes = codes.astype(np.int16 if n_labels < np.iinfo(np.int16).max else np.int32)
+            self.codes[column] = codes
+            #built value by value, the temporary bool array is one byte per row instead of one per row and value
+            bitmaps = np.zeros((n_labels, (self.n_rows + 7) // 8), dtype=np.uint8)
+            for i in range(n_labels):
+                bitmaps[i] = np.packbits(codes == i)
+            self.bitmaps[column] = bitmaps
+            if is_categorical:
+                self.categorical.add(column)
+        self.all_rows = np.packbits(np.ones(self.n_rows, dtype=bool)) #padding bits of the last byte stay 0
+        self._everything = None #selection of all rows, made on first query
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.codes.values()) + sum(b.nbytes for b in self.bitmaps.values())
+
+    def everything(self):
+        """Selection of all rows, kept so its mask is unpacked only once."""
+        if self._everything is None:
+            self._everything = self.select()
+        return self._everything
+
+    #CrashCube query API over all rows, same results as on the cube of the indexed df
+    def total(self):
+        return self.n_rows
+
+    def observed_values(self, column):
+        return self.everything().observed_values(column)
+
+    def counts_by(self, column):
+        return self.everything().counts_by(column)
+
+    def count_table(self, row_column, col_column):
+        return self.everything().count_table(row_column, col_column)
+
+    def to_crash_cube(self):
+        return self.everything().to_crash_cube()
+
+    def isin(self, column, values):
+        """Bitmap of rows whose value of column is in values."""
+        if column not in self.bitmaps:
+            raise KeyError(f"{column} is not indexed, indexed columns are {CUBE_DIMENSIONS}")
+        wanted = set(values)
+        positions = [i for i, label in enumerate(self.labels[column]) if label in wanted]
+        if not positions:
+            return np.zeros_like(self.all_rows)
+        return np.bitwise_or.reduce(self.bitmaps[column][positions], axis=0)
+
+    def evaluate(self, query):
+        """Packed bitmap of the rows matching a Q expression."""
+        if query.op == "isin":
+            bitmap = self.all_rows
+            for column, values in query.selections.items():
+                bitmap = bitmap & self.isin(column, values)
+            return bitmap
+        if query.op == "not":
+            return ~self.evaluate(query.children[0]) & self.all_rows
+        left, right = (self.evaluate(child) for child in query.children)
+        return left & right if query.op == "and" else left | right
+
+    def select(self, query=None, **selections):
+        """Return a BitmapSelection for a Q expression and/or column selections (combined with AND)."""
+        bitmap = self.all_rows if query is None else self.evaluate(query)
+        if selections:
+            bitmap = bitmap & self.evaluate(Q(**selections))
+        return BitmapSelection(self, bitmap)
+
+    def filter(self, **selections):
+        """Same as CrashCube.filter."""
+        return self.select(**selections)
+
+class BitmapSelection:
+    """Rows of a BitmapIndex selected by a bitmap, with the CrashCube query API."""
+    def __init__(self, index, bitmap):
+        self.index = index
+        self.bitmap = bitmap
+        self._mask = None
+
+    @property
+    def labels(self):
+        return self.index.labels
+
+    @property
+    def categorical(self):
+        return self.index.categorical
+
+    @property
+    def nbytes(self):
+        return self.bitmap.nbytes
+
+    def mask(self):
+        """Boolean mask of selected rows (unpacked once per selection)."""
+        if self._mask is None:
+            self._mask = np.unpackbits(self.bitmap, count=self.index.n_rows).view(bool)
+        return self._mask
+
+    def filter(self, **selections):
+        """Narrow the selection, same meaning as CrashCube.filter."""
+        return BitmapSelection(self.index, self.bitmap & self.index.evaluate(Q(**selections)))
+
+    def query(self, query):
+        """Narrow the selection with a Q expression."""
+        return BitmapSelection(self.index, self.bitmap & self.index.evaluate(query))
+
+    def total(self):
+        """Number of selected rows."""
+        return popcount(self.bitmap)
+
+    def row_ids(self):
+        """Positions of selected rows in the indexed df."""
+        return np.flatnonzero(self.mask())
+
+    def rows(self):
+        """Selected rows as a DataFrame (the only method that copies row data)."""
+        return self.index.df.iloc[self.row_ids()]
+
+    def _column_totals(self, column):
+        codes = self.index.codes[column][self.mask()]
+        return np.bincount(codes, minlength=len(self.labels[column]) + 1)
+
+    def observed_values(self, column):
+        """Same as CrashCube.observed_values."""
+        totals = self._column_totals(column)[:-1]
+        return sorted(label for label, count in zip(self.labels[column], totals) if count > 0)
+
+    def counts_by(self, column):
+        """Same as CrashCube.counts_by."""
+        return format_counts(self._column_totals(column), column, self.labels, self.categorical)
+
+    def count_table(self, row_column, col_column):
+        """Same as CrashCube.count_table, one bincount over the selected code pairs."""
+        mask = self.mask()
+        n_cols = len(self.labels[col_column]) + 1
+        shape = (len(self.labels[row_column]) + 1, n_cols)
+        flat = self.index.codes[row_column][mask].astype(np.int64) * n_cols + self.index.codes[col_column][mask]
+        table = np.bincount(flat, minlength=shape[0] * n_cols).reshape(shape)
+        return format_count_table(table, row_column, col_column, self.labels, self.categorical)
+
+    def to_crash_cube(self):
+        """Count cube of the selected rows (e.g. to reuse cube-based caches)."""
+        mask = self.mask()
+        shape = tuple(len(self.labels[column]) + 1 for column in CUBE_DIMENSIONS)
+        flat = np.ravel_multi_index([self.index.codes[column][mask] for column in CUBE_DIMENSIONS], shape)
+        counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape).astype(np.int32)
+        return CrashCube(counts, self.labels, self.categorical)
+
+def load_filter_index(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """BitmapIndex of the cleaned data (load_and_clean reads the parquet cache)."""
+    return BitmapIndex(load_and_clean(filename, cache_dir=cache_dir))
+
+def parse_filter_terms(index, terms):
+    """
+    Command line filter terms -> Q (terms combined with AND).
+
+    Parameters:
+    - index: BitmapIndex, values are matched against its labels as text (so "50" finds speed 50)
+    - terms: list like ["weatherA=Fine,Light rain", "urban=Urban"]
+
+    Returns: Q, or None for no terms. Raises ValueError for a malformed term, unknown column or value.
+    """
+    query = None
+    for term in terms or []:
+        column, sep, values = term.partition("=")
+        column = column.strip()
+        if not sep or column not in index.labels:
+            raise ValueError(f"filter '{term}' should be column=value[,value...], columns are {CUBE_DIMENSIONS}")
+        by_text = {str(label): label for label in index.labels[column]}
+        wanted = [v.strip() for v in values.split(",") if v.strip()]
+        unknown = [v for v in wanted if v not in by_text]
+        if unknown:
+            raise ValueError(f"unknown {column} value(s) {unknown}")
+        term_query = Q(**{column: [by_text[v] for v in wanted]})
+        query = term_query if query is None else query & term_query
+    return query
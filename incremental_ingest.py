@@ -0,0 +1,195 @@
+"""
+Incremental ingest of a new CAS release.
+
+Purpose:
+NZTA republishes the CAS csv regularly. Instead of re-cleaning every row, compare the new release
+with a snapshot of the previous one (keyed on OBJECTID) and only clean and count the changed rows.
+
+Key Functions:
+
+compute_row_hashes: one 64-bit hash per OBJECTID over the raw columns, stored as the snapshot.
+
+diff_snapshots: inserted, changed and deleted OBJECTIDs between two snapshots.
+
+ingest_release: apply the delta to the cleaned parquet cache and to the crash cube,
+then save the new snapshot and a change summary (json).
+Derived tables such as generate_crash_table_by_year are answered from the cube, so they are updated too.
+
+Usage (from project folder, after replacing the csv with the new release):
+python incremental_ingest.py [csv path]
+
+Note: the new csv is still parsed and hashed once (linear, cheap),
+cleaning and aggregation only run on the changed rows.
+"""
+
+import json
+import os
+import sys
+import pandas as pd
+from clean_data import (DATA_FILE, CACHE_DIR, load_raw_dataframe, prepare_clean_df, apply_cleaning_rules, cleaning_report,
+                        get_cache_paths, read_cache_meta, get_source_fingerprint, is_cache_valid, read_cleaned_cache,
+                        write_cleaned_cache)
+from crash_cube import build_crash_cube, update_crash_cube, get_cube_path, read_crash_cube, save_crash_cube
+
+def get_snapshot_paths(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """Return (snapshot parquet path, change summary json path) for a csv."""
+    parquet_path, _ = get_cache_paths(filename, cache_dir)
+    return (parquet_path.replace(".cleaned.parquet", ".snapshot.parquet"),
+            parquet_path.replace(".cleaned.parquet", ".changes.json"))
+
+def compute_row_hashes(raw_df):
+    """
+    Hash each raw row (all loaded columns) into one uint64, index stays OBJECTID.
+    Categorical columns are hashed by value, so different category lists still give equal hashes.
+    """
+    return pd.Series(pd.util.hash_pandas_object(raw_df, index=False).to_numpy(),
+                     index=raw_df.index, name="rowHash")
+
+def save_snapshot(row_hashes, fingerprint, snapshot_path):
+    """Save row hashes with the source fingerprint (stored in parquet key-value metadata)."""
+    frame = row_hashes.to_frame()
+    frame.attrs["fingerprint"] = fingerprint
+    frame.to_parquet(snapshot_path + ".tmp")
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+
+def read_snapshot(snapshot_path):
+    """Return (row hashes Series, fingerprint dict) or (None, None) if no snapshot."""
+    try:
+        frame = pd.read_parquet(snapshot_path)
+    except (OSError, ValueError):
+        return None, None
+    return frame["rowHash"], frame.attrs.get("fingerprint")
+
+def is_same_release(a, b):
+    """Two fingerprints describe the same csv content and cleaning rules (mtime is ignored)."""
+    return (a is not None and b is not None and a.get("sha256") == b.get("sha256")
+            and a.get("cleaning_version") == b.get("cleaning_version"))
+
+def diff_snapshots(old_hashes, new_hashes):
+    """
+    Compare two snapshots by OBJECTID.
+
+    Returns:
+    - dict of pd.Index: 'inserted', 'changed', 'deleted'
+    """
+    inserted = new_hashes.index.difference(old_hashes.index)
+    deleted = old_hashes.index.difference(new_hashes.index)
+    common = new_hashes.index.intersection(old_hashes.index)
+    changed_mask = new_hashes.loc[common].to_numpy() != old_hashes.loc[common].to_numpy()
+    return {"inserted": inserted, "changed": common[changed_mask], "deleted": deleted}
+
+def apply_delta_to_cleaned(cleaned_df, raw_df, delta):
+    """
+    Update the cleaned df with a delta of raw rows.
+
+    Parameters:
+    - cleaned_df: cleaned df of the previous release
+    - raw_df: raw df of the new release (for new rows and category lists)
+    - delta: output of diff_snapshots
+
+    Returns:
+    - (updated cleaned df, removed cleaned rows, added cleaned rows)
+
+    Review note: result keeps row order of the new csv and its category lists,
+    so it is the same df as a full prepare_clean_df run.
+    """
+    replaced_ids = delta["deleted"].union(delta["changed"])
+    removed_mask = cleaned_df.index.isin(replaced_ids)
+    removed_rows = cleaned_df[removed_mask]
+    kept_rows = cleaned_df[~removed_mask]
+
+    added_rows = prepare_clean_df(raw_df.loc[delta["inserted"].union(delta["changed"])])
+    kept_rows = kept_rows.assign(**{
+        col: kept_rows[col].cat.set_categories(added_rows[col].cat.categories)
+        for col in kept_rows.columns if isinstance(added_rows[col].dtype, pd.CategoricalDtype)
+    })
+
+    updated = pd.concat([kept_rows, added_rows])
+    release_order = raw_df.index[raw_df.index.isin(updated.index)]
+    return updated.loc[release_order], removed_rows, added_rows
+
+def summarize_changes(delta, removed_rows, added_rows, mode):
+    """Build a json friendly change summary, incl. years touched by the cleaned delta."""
+    years = sorted({int(y) for y in removed_rows["crashYear"]} | {int(y) for y in added_rows["crashYear"]})
+    return {
+        "mode": mode,
+        "inserted": len(delta["inserted"]),
+        "changed": len(delta["changed"]),
+        "deleted": len(delta["deleted"]),
+        "cleaned_rows_removed": len(removed_rows),
+        "cleaned_rows_added": len(added_rows),
+        "years_affected": years,
+    }
+
+def full_rebuild(raw_df, filename, cache_dir, fingerprint):
+    """Clean everything (first run, or previous cache cannot be trusted) and save caches."""
+    cleaned_df, report = apply_cleaning_rules(raw_df)
+    write_cleaned_cache(cleaned_df, fingerprint, filename, cache_dir, report)
+    save_crash_cube(build_crash_cube(cleaned_df), get_cube_path(filename, cache_dir), fingerprint)
+    return cleaned_df
+
+def ingest_release(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """
+    Bring the cleaned cache, crash cube and snapshot up to date with the csv.
+
+    steps:
+    1. Skip if the csv fingerprint equals the cached one.
+    2. Parse the csv and hash every row.
+    3. If snapshot, cleaned cache and cube all belong to the same previous release,
+       diff the snapshots and apply only the delta. Otherwise do a full rebuild.
+    4. Save caches (load_and_clean/load_crash_cube will hit them) and the change summary.
+
+    Returns: change summary dict
+    """
+    parquet_path, meta_path = get_cache_paths(filename, cache_dir)
+    snapshot_path, summary_path = get_snapshot_paths(filename, cache_dir)
+    stored = read_cache_meta(meta_path)
+    fingerprint = get_source_fingerprint(filename, previous=stored)
+    old_hashes, snapshot_fingerprint = read_snapshot(snapshot_path)
+
+    if is_cache_valid(stored, fingerprint) and is_same_release(snapshot_fingerprint, stored):
+        return {"mode": "unchanged", "inserted": 0, "changed": 0, "deleted": 0,
+                "cleaned_rows_removed": 0, "cleaned_rows_added": 0, "years_affected": []}
+
+    raw_df = load_raw_dataframe(filename)
+    new_hashes = compute_row_hashes(raw_df)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    old_cube, cube_meta = read_crash_cube(get_cube_path(filename, cache_dir))
+    previous_is_consistent = (
+        old_hashes is not None and os.path.exists(parquet_path)
+        and is_same_release(snapshot_fingerprint, stored)
+        and stored.get("cleaning_version") == fingerprint["cleaning_version"]
+        and old_cube is not None and is_same_release(cube_meta["fingerprint"], stored)
+    )
+
+    if previous_is_consistent:
+        delta = diff_snapshots(old_hashes, new_hashes)
+        cleaned_df, removed_rows, added_rows = apply_delta_to_cleaned(read_cleaned_cache(parquet_path), raw_df, delta)
+        #rule report of the whole release: rules only (vectorized masks), no rows are cleaned again
+        write_cleaned_cache(cleaned_df, fingerprint, filename, cache_dir, cleaning_report(raw_df))
+        save_crash_cube(update_crash_cube(old_cube, removed_rows, added_rows),
+                        get_cube_path(filename, cache_dir), fingerprint)
+        summary = summarize_changes(delta, removed_rows, added_rows, "incremental")
+    else:
+        cleaned_df = full_rebuild(raw_df, filename, cache_dir, fingerprint)
+        delta = {"inserted": raw_df.index, "changed": pd.Index([]), "deleted": pd.Index([])}
+        summary = summarize_changes(delta, cleaned_df.iloc[:0], cleaned_df, "full")
+
+    save_snapshot(new_hashes, fingerprint, snapshot_path)
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def print_change_summary(summary):
+    """Print the change summary in report style."""
+    print("CAS Release Change Summary")
+    print(f"Mode: {summary['mode']}")
+    print(f"Inserted: {summary['inserted']}")
+    print(f"Changed: {summary['changed']}")
+    print(f"Deleted: {summary['deleted']}")
+    print(f"Cleaned rows removed/added: {summary['cleaned_rows_removed']}/{summary['cleaned_rows_added']}")
+    print(f"Years affected: {summary['years_affected']}")
+
+if __name__ == "__main__":
+    print_change_summary(ingest_release(sys.argv[1] if len(sys.argv) > 1 else DATA_FILE))
@@ -0,0 +1,210 @@
+"""
+Timing spans and profiling hooks for the hot paths (load, clean, filter, report, render).
+
+Purpose:
+Find out where a slow report or dashboard interaction spends its time: csv parsing, cleaning,
+filtering, count tables, geometry merge or figure rendering. Each span records duration,
+row count and change of resident memory. Recording is off by default and then costs one
+flag check per call.
+
+Key Functions:
+
+enable / is_enabled: switch recording on (also with environment variable CRASH_PROFILE=1).
+
+span: context manager around a block, `with span("name") as record: ... record["rows"] = n`.
+
+traced: decorator version of span, rows taken from the result (DataFrame length or cube total).
+
+summary / format_summary: per span name count, total/mean/max ms, rows and memory.
+
+export_chrome_trace: spans as Chrome trace json (open in chrome://tracing or https://ui.perfetto.dev).
+
+capture_profile: cProfile of one block (one report or one dashboard rerun), returns the top functions.
+
+Usage (from project folder):
+python main.py --profile table          #summary printed, trace written to reports/profile/
+CRASH_PROFILE=1 streamlit run dashboard_app.py   #or tick "Show profiling panel" in the sidebar
+"""
+
+import functools
+import io
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PROFILE_ENV = "CRASH_PROFILE"
+PROFILE_DIR = os.path.join("reports", "profile")
+DEFAULT_MAX_SPANS = 20_000 #oldest spans are dropped, a long running dashboard keeps bounded memory
+
+_enabled = os.environ.get(PROFILE_ENV, "") not in ("", "0")
+_spans = deque(maxlen=DEFAULT_MAX_SPANS)
+_local = threading.local() #depth of open spans per thread (streamlit runs sessions in threads)
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def enable(on=True, max_spans=None):
+    """Switch recording on or off, max_spans changes the ring buffer size (recorded spans are kept)."""
+    global _enabled, _spans
+    _enabled = on
+    if max_spans is not None and max_spans != _spans.maxlen:
+        _spans = deque(_spans, maxlen=max_spans)
+
+def is_enabled():
+    return _enabled
+
+def clear():
+    _spans.clear()
+
+def get_spans():
+    """Recorded spans (list of dicts, oldest first)."""
+    return list(_spans)
+
+def current_rss_bytes():
+    """Resident memory of this process (Linux /proc), None where not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _row_count(result):
+    """Rows of a result: DataFrame/Series length, total() of a cube or filter selection, else None."""
+    if hasattr(result, "total") and callable(result.total):
+        return int(result.total())
+    if hasattr(result, "shape") and len(getattr(result, "shape", ())) > 0:
+        return int(result.shape[0])
+    return None
+
+@contextmanager
+def span(name, **args):
+    """
+    Time a block. Yields the record dict, set record["rows"] (or other keys) inside the block.
+    Nothing is recorded while instrumentation is disabled.
+    """
+    record = {"name": name, "args": args}
+    if not _enabled:
+        yield record
+        return
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    rss_before = current_rss_bytes()
+    start_ns = time.perf_counter_ns()
+    try:
+        yield record
+    finally:
+        duration_ns = time.perf_counter_ns() - start_ns
+        rss_after = current_rss_bytes()
+        _local.depth = depth
+        record.update({
+            "start_us": start_ns / 1000,
+            "duration_ms": duration_ns / 1e6,
+            "memory_delta_mb": None if rss_before is None or rss_after is None else (rss_after - rss_before) / 1e6,
+            "depth": depth,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        })
+        record.setdefault("rows", None)
+        _spans.append(record)
+
+def traced(name=None, rows=_row_count):
+    """
+    Decorator: record a span per call of the function.
+
+    Parameters:
+    - name: span name (default module.function)
+    - rows: function result -> row count (None to skip)
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(span_name) as record:
+                result = func(*args, **kwargs)
+                record["rows"] = rows(result) if rows else None
+            return result
+        return wrapper
+    return decorator
+
+def summary(spans=None):
+    """
+    Aggregate spans by name.
+
+    Returns: list of dicts (name, calls, total_ms, mean_ms, max_ms, rows, memory_delta_mb), slowest total first
+    """
+    groups = {}
+    for record in get_spans() if spans is None else spans:
+        item = groups.setdefault(record["name"], {"name": record["name"], "calls": 0, "total_ms": 0.0,
+                                                  "max_ms": 0.0, "rows": None, "memory_delta_mb": 0.0})
+        item["calls"] += 1
+        item["total_ms"] += record["duration_ms"]
+        item["max_ms"] = max(item["max_ms"], record["duration_ms"])
+        if record.get("rows") is not None:
+            item["rows"] = record["rows"] #last seen row count
+        item["memory_delta_mb"] += record.get("memory_delta_mb") or 0.0
+    result = []
+    for item in groups.values():
+        item["mean_ms"] = item["total_ms"] / item["calls"]
+        for key in ("total_ms", "mean_ms", "max_ms", "memory_delta_mb"):
+            item[key] = round(item[key], 2)
+        result.append(item)
+    return sorted(result, key=lambda item: item["total_ms"], reverse=True)
+
+def format_summary(rows=None):
+    """Summary as a text table for the console."""
+    rows = summary() if rows is None else rows
+    lines = [f"{'span':40}{'calls':>7}{'total ms':>11}{'mean ms':>10}{'max ms':>10}{'rows':>10}{'mem MB':>9}"]
+    for item in rows:
+        lines.append(f"{item['name'][:39]:40}{item['calls']:>7}{item['total_ms']:>11.1f}{item['mean_ms']:>10.2f}"
+                     f"{item['max_ms']:>10.1f}{'' if item['rows'] is None else item['rows']:>10}{item['memory_delta_mb']:>9.1f}")
+    return "\n".join(lines)
+
+def chrome_trace(spans=None):
+    """Spans as a Chrome trace event dict (complete events 'X', times in microseconds)."""
+    events = []
+    for record in get_spans() if spans is None else spans:
+        args = {key: str(value) for key, value in record.get("args", {}).items()}
+        if record.get("rows") is not None:
+            args["rows"] = record["rows"]
+        if record.get("memory_delta_mb") is not None:
+            args["memory_delta_mb"] = round(record["memory_delta_mb"], 3)
+        events.append({"name": record["name"], "cat": record["name"].split(".")[0], "ph": "X",
+                       "ts": record["start_us"], "dur": record["duration_ms"] * 1000,
+                       "pid": record["pid"], "tid": record["tid"], "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def export_chrome_trace(path=None, spans=None):
+    """Write the trace json, default path reports/profile/trace_<time>.json. Returns the path."""
+    if path is None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    import json #kept out of module import, main.py imports this module at startup
+    with open(path, "w") as f:
+        json.dump(chrome_trace(spans), f)
+    return path
+
+@contextmanager
+def capture_profile(sort="cumulative", limit=30, dump_path=None):
+    """
+    cProfile the block. Yields a dict, after the block it holds "stats" (text of the top `limit` functions)
+    and "profile" (pstats.Stats). dump_path also saves the raw profile (snakeviz, pstats).
+    """
+    import cProfile #only when a capture is asked for, pstats alone adds ~15 ms to startup
+    import pstats
+    result = {}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        if dump_path:
+            profiler.dump_stats(dump_path)
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buffer).sort_stats(sort)
+        stats.print_stats(limit)
+        result["profile"] = stats
+        result["stats"] = buffer.getvalue()
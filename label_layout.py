@@ -0,0 +1,118 @@
+"""
+Label placement for the region map (replaces adjust_text).
+
+Purpose:
+Place one text label per region near its label point without overlaps, in one deterministic pass.
+adjust_text moved labels iteratively with randomness and took seconds per map;
+here every label tries a fixed grid of candidate offsets (nearest first) and takes the first
+free one, overlap checks are numpy operations over all candidates at once.
+
+Key Functions:
+
+measure_labels: width/height of every label in pixels from the font, no figure drawing needed.
+
+candidate_offsets: the candidate grid, offsets around the anchor sorted by distance.
+
+place_labels: greedy placement in pixel space, returns label centres.
+
+compute_label_layout: data coordinates in, data coordinates out, using the axes transform.
+
+Usage:
+from label_layout import compute_label_layout
+positions = compute_label_layout(axes, xs, ys, names, fontsize=6)
+for (x, y), name in zip(positions, names):
+    axes.text(x, y, name, ha='center', va='center', fontsize=6)
+"""
+
+import numpy as np
+
+LABEL_PADDING = 2 #pixels kept free around each label
+ANCHOR_SIZE = 3 #pixels, label points of other regions are kept free too
+
+def measure_labels(labels, fontsize, dpi):
+    """Return array (n, 2) of label width and height in pixels."""
+    from matplotlib.textpath import TextPath #same font metrics as axes.text, without a renderer
+    sizes = []
+    for label in labels:
+        extents = TextPath((0, 0), str(label), size=fontsize).get_extents()
+        sizes.append((extents.width, fontsize * 1.1)) #line height incl. descent, as the rendered text box
+    return np.asarray(sizes, dtype=float) * dpi / 72 #points -> pixels
+
+def candidate_offsets(step, rings=6, directions=16):
+    """
+    Candidate centre offsets (pixels) around an anchor, nearest first: the anchor itself,
+    then rings of `directions` points every `step` pixels. Order is fixed, so layouts are repeatable.
+    """
+    angles = np.arange(directions) * (2 * np.pi / directions)
+    radii = np.arange(1, rings + 1) * step
+    ring_x = (radii[:, None] * np.cos(angles)[None, :]).ravel()
+    ring_y = (radii[:, None] * np.sin(angles)[None, :]).ravel()
+    offsets = np.vstack([[0.0, 0.0], np.column_stack([ring_x, ring_y])])
+    order = np.lexsort((np.abs(offsets[:, 0]), np.hypot(offsets[:, 0], offsets[:, 1]).round(6))) #ties: vertical moves first
+    return offsets[order]
+
+def _overlap_area(boxes, others):
+    """Overlap area of every box (m, 4) with every other box (k, 4), boxes as x0, y0, x1, y1. Returns (m,)."""
+    if len(others) == 0:
+        return np.zeros(len(boxes))
+    width = np.minimum(boxes[:, None, 2], others[None, :, 2]) - np.maximum(boxes[:, None, 0], others[None, :, 0])
+    height = np.minimum(boxes[:, None, 3], others[None, :, 3]) - np.maximum(boxes[:, None, 1], others[None, :, 1])
+    return (np.clip(width, 0, None) * np.clip(height, 0, None)).sum(axis=1)
+
+def place_labels(anchors, sizes, bounds=None, padding=LABEL_PADDING, rings=6, directions=16):
+    """
+    Greedy placement in pixel space.
+
+    Parameters:
+    - anchors: array (n, 2) anchor points (label point of each region)
+    - sizes: array (n, 2) label width and height
+    - bounds: (x0, y0, x1, y1) area labels must stay in, None for no limit
+    - padding: free pixels around every label
+    - rings / directions: shape of the candidate grid
+
+    Returns:
+    - array (n, 2) label centres, in the order of anchors
+    Labels are placed from the most crowded anchor to the least crowded one (ties by input order),
+    each takes the nearest candidate without overlap, or the one with least overlap if none is free.
+    """
+    anchors = np.asarray(anchors, dtype=float)
+    sizes = np.asarray(sizes, dtype=float) + 2 * padding
+    n = len(anchors)
+    positions = anchors.copy()
+    if n == 0:
+        return positions
+    offsets = candidate_offsets(max(float(np.median(sizes[:, 1])), 1.0), rings, directions)
+    half = ANCHOR_SIZE / 2
+    anchor_boxes = np.column_stack([anchors - half, anchors + half])
+
+    distance = np.hypot(*(anchors[:, None, :] - anchors[None, :, :]).transpose(2, 0, 1))
+    crowding = (distance < sizes[:, 0].max()).sum(axis=1) #neighbours within one label width
+    order = sorted(range(n), key=lambda i: (-crowding[i], i))
+
+    placed = np.empty((0, 4))
+    for i in order:
+        centres = anchors[i] + offsets
+        boxes = np.column_stack([centres - sizes[i] / 2, centres + sizes[i] / 2])
+        cost = _overlap_area(boxes, placed) + _overlap_area(boxes, np.delete(anchor_boxes, i, axis=0))
+        if bounds is not None:
+            x0, y0, x1, y1 = bounds
+            outside = ((boxes[:, 0] < x0) | (boxes[:, 1] < y0) | (boxes[:, 2] > x1) | (boxes[:, 3] > y1))
+            cost = cost + outside * sizes[i].prod() #leaving the axes is as bad as a full overlap
+        best = int(np.argmax(cost == 0)) if (cost == 0).any() else int(np.argmin(cost)) #first free candidate
+        positions[i] = centres[best]
+        placed = np.vstack([placed, boxes[best]])
+    return positions
+
+def compute_label_layout(axes, xs, ys, labels, fontsize=6, padding=LABEL_PADDING):
+    """
+    Label centres in data coordinates for labels anchored at (xs, ys) on axes.
+    Axes limits and figure size must be final (after plotting and tight_layout).
+    Returns list of (x, y), draw the labels with ha='center', va='center'.
+    """
+    axes.apply_aspect() #equal aspect (geopandas) moves the axes box only when drawn, apply it before transforming
+    transform = axes.transData
+    anchors = transform.transform(np.column_stack([xs, ys]))
+    sizes = measure_labels(labels, fontsize, axes.figure.dpi)
+    bounds = axes.get_window_extent().extents if len(anchors) else None
+    positions = place_labels(anchors, sizes, bounds, padding)
+    return [tuple(point) for point in transform.inverted().transform(positions)]
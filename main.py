@@ -47,21 +47,31 @@ on new lib (folium? plotly?) study still pending
 """
 
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
+import sys
 import time
-from clean_data import load_and_clean
+from instrumentation import traced
+#review note: pandas, matplotlib and the data are imported/loaded on first use (see _as_crash_cube,
+#get_crash_cube, plot_trends_over_time), so the menu shows without waiting for them.
+#check with: python -m benchmarks.startup_benchmark
 
 DATA_FILE = "data/Crash_Analysis_System_(CAS)_data.csv"
 # Define fixed severity order for consistent report form
 SEVERITY_ORDER = ["Fatal Crash", "Serious Crash", "Minor Crash", "Non-Injury Crash"]
 
-if not os.path.exists(DATA_FILE):
-    raise FileNotFoundError(
-        f"Data file not found: {DATA_FILE}\n"
-        "Please download the CAS dataset (CSV) from NZTA Open Data Portal "
-        "and place it inside the /data folder."
-    )
+def _as_crash_cube(data):
+    """crash_cube.as_crash_cube, imported on first call (it pulls in numpy and pandas)."""
+    from crash_cube import as_crash_cube
+    return as_crash_cube(data)
+
+_crash_cube = None
+
+def get_crash_cube():
+    """Count cube of the cleaned data, loaded when the first report needs it and kept for the session."""
+    global _crash_cube
+    if _crash_cube is None:
+        from crash_cube import load_crash_cube
+        _crash_cube = load_crash_cube() #counts of cleaned data from clean_data.py, reports only need counts
+    return _crash_cube
 
 def extract_valid_values(cleaned_df, column_name):
     """
@@ -77,9 +87,11 @@ def extract_valid_values(cleaned_df, column_name):
 
     Review note 2: the previous premitive method solved the np.int output problem,
     need to refactor to generate int output year and speed.
+
+    Review note 3: accepts the crash cube as well, values are read from the cube axis.
     """
     result = []
-    for x in cleaned_df[column_name].dropna().unique():
+    for x in _as_crash_cube(cleaned_df).observed_values(column_name):
         result.append(int(x)) #append int to the list
     return sorted(result)
 
@@ -194,42 +206,73 @@ def menu_select(options: list[str]) -> int:
         selection = int(input(prompt))
     return selection
 
+@traced("report.severity_summary", rows=lambda summary: None if summary is None else int(summary.sum()))
+def get_crash_severity_summary(year_of_interest: int, speed_of_interest: int, df):
+    """
+    Crash count by severity (SEVERITY_ORDER) for one year and speed limit.
+    Returns None if there is no record, split from the print function for batch reports.
+    """
+    filtered = _as_crash_cube(df).filter(crashYear=[year_of_interest], effectiveSpeed=[speed_of_interest])
+    if filtered.total() == 0:
+        return None
+    return filtered.counts_by('crashSeverity').reindex(SEVERITY_ORDER, fill_value=0)
+
 def print_crash_severity_report(year_of_interest: int, speed_of_interest: int, df) :
     """
     Prints a table outlining the number of crashes in a given year for a given speed limit
-    based on DataFrame
+    based on DataFrame or crash cube
     """    
-    filtered = df.loc[(df['crashYear'] == year_of_interest) & (df['effectiveSpeed'] == speed_of_interest)]
-    if filtered.empty:
+    summary = get_crash_severity_summary(year_of_interest, speed_of_interest, df)
+    if summary is None:
         print(f"Warning: No records found for year {year_of_interest} and speed {speed_of_interest}.")
         return
     print("Crash Severity by Classification")
     print(f"Year: {year_of_interest}")
     print(f"Speed Limit: {speed_of_interest}\n")
-    summary = filtered['crashSeverity'].value_counts().reindex(SEVERITY_ORDER, fill_value=0)
     for severity, count in summary.items():
         print(f"{severity}: {count}")
 
+@traced("report.crash_table_by_year", rows=lambda table: int(table['Total'].sum()))
 def generate_crash_table_by_year(df):
     """Gerenate a crash count table by year and severity type.
     Replace original design through accumulator and list of tuples.
 
-    Parameter: cleaned df
+    Parameter: cleaned df or crash cube
 
     Return: DataFrame contains Year and Severity
     """
-    crash_summary = df.groupby(['crashYear', 'crashSeverity'],observed=False).size().unstack(fill_value=0) 
-    #group by two categories, count each category with size(), unstack to two dimension use severity as column.
+    crash_summary = _as_crash_cube(df).count_table('crashYear', 'crashSeverity')
+    #sum cube over other columns, same table as groupby two categories and unstack severity as column.
     #fill 0 for a cell which has no accident record, add speed limit as another filter in displaying?
     crash_summary = crash_summary.reindex(columns = SEVERITY_ORDER, fill_value = 0) #reindex by pre-set order, fill missing value with 0
     crash_summary['Total'] = crash_summary.sum(axis = 1) # add total by row
     return crash_summary
 
-def plot_trends_over_time (years, selected_types, counts_lists):
+@traced("report.calculate_count_table", rows=lambda table: int(table.to_numpy().sum()))
+def calculate_count_table(df, SEVERITY_ORDER):
+    """
+    refactor from proportion calculate function. now similar to main calculation function.
+    retain for better adjustment and documentation.
+    
+    Note: original design was    
+    Group by weather and severity, then calculate and generate percentage table with 'div' method.
+
+    Note 2: df can be the crash cube, table is summed from the cube instead of groupby on rows.
+    Note 3: moved here from dashboard_app, so scripts and the query server use it without importing streamlit.
+    """
+    grouped = _as_crash_cube(df).count_table('effectiveSpeed', 'crashSeverity')
+    #count every sev category by each speed, sev as columns
+    grouped = grouped.reindex(columns=SEVERITY_ORDER, fill_value=0)
+    return grouped
+
+@traced("render.trend_plot", rows=None)
+def plot_trends_over_time (years, selected_types, counts_lists, output_path=None):
     """
     plot trend line over user's time range by selected severity type
+    - output_path: save the figure there (png/svg/pdf by extension) instead of showing it, for batch reports
     """
-    axes = plt.axes()
+    import matplotlib.pyplot as plt #only loaded when a plot is drawn
+    fig, axes = plt.subplots()
 
     for i in range(len(selected_types)):
         xs = years
@@ -242,19 +285,70 @@ def plot_trends_over_time (years, selected_types, counts_lists):
     axes.set_title("Crash Over Time by Severity Type")
     axes.legend()
     axes.grid(True)
-    plt.show()
+    if output_path:
+        fig.savefig(output_path)
+        plt.close(fig) #batch runs draw many plots in one process
+    else:
+        plt.show()
+
+def require_data_file(filename=DATA_FILE):
+    """Raise with download instructions if the CAS csv is missing."""
+    if not os.path.exists(filename): #checked at start of a run, report functions can be imported without the data file
+        raise FileNotFoundError(
+            f"Data file not found: {filename}\n"
+            "Please download the CAS dataset (CSV) from NZTA Open Data Portal "
+            "and place it inside the /data folder."
+        )
+
+PROFILE_FLAGS = ("--profile", "--cprofile")
+
+def run_profiled(argv):
+    """
+    Run main with instrumentation on, started by --profile or --cprofile anywhere in the arguments
+    (e.g. python main.py --profile table, or python main.py --profile for the menu).
+    --profile: span summary printed at exit, chrome trace written to reports/profile/
+    --cprofile: also cProfile of the whole run (top functions printed, .prof file saved)
+    Batch worker processes are not traced, use --workers 1 to see every report.
+    """
+    import instrumentation
+    use_cprofile = "--cprofile" in argv
+    argv = [arg for arg in argv if arg not in PROFILE_FLAGS]
+    instrumentation.enable()
+    try:
+        if use_cprofile:
+            os.makedirs(instrumentation.PROFILE_DIR, exist_ok=True)
+            prof_path = os.path.join(instrumentation.PROFILE_DIR, f"main_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+            with instrumentation.capture_profile(dump_path=prof_path) as profile:
+                result = main(argv)
+            print(profile["stats"])
+            print(f"cProfile saved to {prof_path}")
+        else:
+            result = main(argv)
+    finally:
+        print(instrumentation.format_summary())
+        print(f"Trace saved to {instrumentation.export_chrome_trace()} (open in chrome://tracing or ui.perfetto.dev)")
+    return result
 
-def main():
+def main(argv=None):
     """Small application that presents tables and graphs based on crash data
     Process steps:
     1. Read raw data as a list of tuples containing (crashYear, speedLimit, crashSeverity, temporarySpeedLimit).
     2. Generate a cleaned list of tuples containing (crashYear, crashSeverity, effectiveSpeedLimit).
     3. Extract legal year and speed limit from clean_data
     4. Perform reporting and visualization functions based on the cleaned data.
+
+    With command line arguments (e.g. python main.py severity --year 2020 --speed 50) the reports run
+    without menu, see batch_reports.py, and the exit code of the report run is returned.
+    --profile / --cprofile time the run, see run_profiled.
     """
-    cleaned_df = load_and_clean() #call from clean_data.py
-    crash_years = extract_valid_values(cleaned_df, column_name='crashYear') 
-    speed_limits = extract_valid_values(cleaned_df, column_name='effectiveSpeed') 
+    argv = sys.argv[1:] if argv is None else argv
+    if any(arg in PROFILE_FLAGS for arg in argv):
+        return run_profiled(argv)
+    if argv:
+        from batch_reports import main as batch_main
+        return batch_main(argv)
+
+    require_data_file()
     
     menu_options = [
         "Crash Severity Report (single year and single speed limit)",
@@ -267,31 +361,45 @@ def main():
     while True:
         option = menu_select(menu_options)
 
+        if option in (0, 1, 2): #data is loaded by the first report, not before the menu
+            crash_cube = get_crash_cube()
+            crash_years = extract_valid_values(crash_cube, column_name='crashYear') 
+            speed_limits = extract_valid_values(crash_cube, column_name='effectiveSpeed') 
+
         if option == 0:
             #this is to read user input year
             year_of_interest = read_valid_int("Please enter crash year.", crash_years, "Year")
             #this is to read user input speed limit
             speed_of_interest = read_valid_int("Please enter speed limit. Value should be multiple of 10", speed_limits, "Speed Limit")
             #this calls the print function
-            print_crash_severity_report (year_of_interest, speed_of_interest, cleaned_df)
+            print_crash_severity_report (year_of_interest, speed_of_interest, crash_cube)
 
         elif option == 1:
             ###function to generate All Years Crash Severity Report
-            table_df = generate_crash_table_by_year(cleaned_df)
+            table_df = generate_crash_table_by_year(crash_cube)
             print(table_df)
 
         elif option == 2:
-            table_df = generate_crash_table_by_year(cleaned_df)
+            table_df = generate_crash_table_by_year(crash_cube)
             start_year, end_year, selected_types = get_plot_time_and_types(crash_years, SEVERITY_ORDER)
             years, counts_lists = prepare_lists_from_df(table_df, selected_types, start_year, end_year)
             plot_trends_over_time (years, selected_types, counts_lists)
 
         elif option == 3:
             import subprocess 
+            from shared_dataset import DEFAULT_SHARED_NAME, SHARED_NAME_ENV, is_published
             #note: streamlit is web based app, cannot be called directly within main
             #note: subprocess module is used to run external app
             #use Popen method to run app without blocking main, 'run' method will block main
-            subprocess.Popen(["streamlit", "run", "dashboard_app.py"]) 
+            if not is_published(DEFAULT_SHARED_NAME):
+                #one loader process publishes the data in shared memory, every dashboard process attaches to it
+                subprocess.Popen([sys.executable, "shared_dataset.py", "serve", "--name", DEFAULT_SHARED_NAME])
+                for _ in range(60): #wait until published, otherwise the dashboard loads its own copy
+                    if is_published(DEFAULT_SHARED_NAME):
+                        break
+                    time.sleep(0.5)
+            dashboard_env = dict(os.environ, **{SHARED_NAME_ENV: DEFAULT_SHARED_NAME})
+            subprocess.Popen(["streamlit", "run", "dashboard_app.py"], env=dashboard_env) 
             #arguments note: streamlit- call this app, run- start python script, python script name to be called
             print("\n")
             time.sleep(3)
@@ -303,4 +411,5 @@ def main():
 
         print ("\n")
 
-main ()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main()) #exit code of the command line reports (None = 0 after the menu)
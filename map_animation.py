@@ -0,0 +1,262 @@
+"""
+Year sequence of regional crash maps: animation, small multiples, one image per year.
+
+Purpose:
+Render the whole 2000-2024 map sequence in one go instead of a cold render per year.
+Region outlines are converted to matplotlib paths once, one figure is drawn once,
+and every frame only updates the polygon colours (set_array) and the title.
+All frames use one fixed colour scale (0 to the highest region count of all years),
+so colours can be compared between years.
+
+Key Functions:
+
+region_counts_long_table: per year region counts (get_region_crash_counts_for_join) as one long table.
+
+YearMapFigure: the reusable figure, draw_year updates colours for one year.
+
+render_animation: GIF (pillow) or MP4 (needs ffmpeg) of all years.
+
+render_year_frames: yearly map pack, one png/svg per year from the same figure.
+
+render_small_multiples: grid of all years in one image with a shared colour bar.
+
+Usage (from project folder):
+python map_animation.py gif --out reports/maps
+python map_animation.py grid --out reports/maps --cols 5
+python map_animation.py frames --out reports/maps --format svg
+python map_animation.py table --out reports/maps
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from crash_cube import as_crash_cube, load_crash_cube
+from map_plotting import FIGURE_SIZE, LABEL_FONT_SIZE, get_region_crash_counts_for_join, merge_shp_with_map_data
+from map_render_cache import RENDER_VERSION, YEAR_RANGE
+from region_geometry import DEFAULT_TOLERANCE
+#matplotlib, numpy and pandas are imported inside functions, as in map_plotting
+
+REGION_KEY = "REGC2025_1"
+
+def region_geometry_layer(tolerance=DEFAULT_TOLERANCE):
+    """Region outlines in shapefile order (merge_shp_with_map_data without counts)."""
+    import pandas as pd
+    return merge_shp_with_map_data(pd.DataFrame({"region": [], "CrashCount": []}), tolerance=tolerance)
+
+def region_counts_long_table(cube, years=YEAR_RANGE):
+    """
+    Return DataFrame with columns year, region, CrashCount (one row per year and region),
+    regions of the shapefile without crashes in a year are included with 0.
+    """
+    import pandas as pd
+    cube = as_crash_cube(cube)
+    regions = list(region_geometry_layer()[REGION_KEY])
+    frames = []
+    for year in years:
+        counts = get_region_crash_counts_for_join(cube, year).set_index("region")["CrashCount"]
+        frames.append(pd.DataFrame({"year": year, "region": regions,
+                                    "CrashCount": counts.reindex(regions, fill_value=0).to_numpy()}))
+    return pd.concat(frames, ignore_index=True).astype({"year": "int16", "CrashCount": "int64"})
+
+def long_table_records(long_table):
+    """Long table as list of (year, region, count), for cache keys."""
+    return [(int(y), r, int(c)) for y, r, c in zip(long_table["year"], long_table["region"], long_table["CrashCount"])]
+
+def sequence_key(long_table, kind, cmap="OrRd", fmt="png"):
+    """Hash of everything a rendered sequence depends on (see map_render_cache.make_render_key)."""
+    payload = json.dumps([RENDER_VERSION, kind, cmap, fmt, long_table_records(long_table)])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def region_paths(geometries):
+    """One matplotlib Path per region (all parts and holes in one compound path), converted once."""
+    import numpy as np
+    import shapely
+    from matplotlib.path import Path
+    paths = []
+    for geometry in geometries:
+        rings = []
+        for polygon in shapely.get_parts(geometry):
+            rings.append(np.asarray(polygon.exterior.coords))
+            rings.extend(np.asarray(interior.coords) for interior in polygon.interiors)
+        paths.append(Path.make_compound_path(*[Path(ring, closed=True) for ring in rings]))
+    return paths
+
+def region_collection(paths, cmap, norm):
+    """PatchCollection of region paths with colour mapping, face colours come from set_array."""
+    from matplotlib.collections import PatchCollection
+    from matplotlib.patches import PathPatch
+    return PatchCollection([PathPatch(path) for path in paths], cmap=cmap, norm=norm,
+                           linewidth=0.5, edgecolor="black")
+
+class YearMapFigure:
+    """
+    One map figure reused for every year.
+
+    Parameters:
+    - long_table: output of region_counts_long_table
+    - cmap: colour map
+    - tolerance: geometry simplify tolerance (as plot_region_crash_map)
+    - figsize: figure size
+    - labels: draw region names (placed once with label_layout)
+    """
+    def __init__(self, long_table, cmap="OrRd", tolerance=DEFAULT_TOLERANCE, figsize=FIGURE_SIZE, labels=True):
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import Normalize
+        self.table = long_table.pivot(index="year", columns="region", values="CrashCount")
+        geometry = region_geometry_layer(tolerance)
+        self.regions = list(geometry[REGION_KEY])
+        self.table = self.table.reindex(columns=self.regions, fill_value=0)
+        #fixed colour scale over all years, so a colour means the same count in every frame
+        self.norm = Normalize(vmin=0, vmax=max(int(self.table.to_numpy().max()), 1))
+
+        self.fig, self.axes = plt.subplots(figsize=figsize)
+        self.collection = region_collection(region_paths(geometry.geometry), cmap, self.norm)
+        self.collection.set_array(self.table.iloc[0].to_numpy())
+        self.axes.add_collection(self.collection)
+        self.axes.autoscale_view()
+        self.axes.set_aspect("equal")
+        self.axes.axis("off")
+        self.fig.colorbar(self.collection, ax=self.axes)
+        self.title = self.axes.set_title(f"Annual Crash Count by Region of {self.years[0]}") #sized before tight_layout
+        self.fig.tight_layout()
+        if labels:
+            from label_layout import compute_label_layout
+            #own layout, axes box differs from the geopandas figure in map_plotting, once per sequence
+            positions = compute_label_layout(self.axes, geometry['label_x'].to_numpy(), geometry['label_y'].to_numpy(),
+                                             self.regions, fontsize=LABEL_FONT_SIZE)
+            for (x, y), name in zip(positions, self.regions):
+                self.axes.text(x, y, name, ha='center', va='center', fontsize=LABEL_FONT_SIZE, color='black')
+
+    @property
+    def years(self):
+        return [int(year) for year in self.table.index]
+
+    def draw_year(self, year):
+        """Update colours and title for one year, returns the changed artists (for FuncAnimation blit)."""
+        self.collection.set_array(self.table.loc[year].to_numpy())
+        self.title.set_text(f"Annual Crash Count by Region of {year}")
+        return [self.collection, self.title]
+
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+
+def render_animation(long_table, out_path, cmap="OrRd", fps=2, dpi=100):
+    """
+    Save all years as an animation, format from the file extension: .gif (pillow) or .mp4 (ffmpeg).
+    Returns out_path.
+    """
+    from matplotlib import animation
+    writer_name = "ffmpeg" if out_path.lower().endswith(".mp4") else "pillow"
+    if not animation.writers.is_available(writer_name):
+        raise ValueError(f"{writer_name} is not available for {out_path}, use a .gif file or install ffmpeg")
+    figure = YearMapFigure(long_table, cmap)
+    try:
+        anim = animation.FuncAnimation(figure.fig, figure.draw_year, frames=figure.years, blit=False)
+        anim.save(out_path, writer=animation.writers[writer_name](fps=fps), dpi=dpi)
+    finally:
+        figure.close()
+    return out_path
+
+def render_year_frames(long_table, out_dir, cmap="OrRd", fmt="png", dpi=100):
+    """Yearly map pack: one image per year (crash_map_<year>.<fmt>) from one figure. Returns list of paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    figure = YearMapFigure(long_table, cmap)
+    paths = []
+    try:
+        for year in figure.years:
+            figure.draw_year(year)
+            path = os.path.join(out_dir, f"crash_map_{year}.{fmt}")
+            figure.fig.savefig(path, format=fmt, dpi=dpi)
+            paths.append(path)
+    finally:
+        figure.close()
+    return paths
+
+def render_small_multiples(long_table, out, cmap="OrRd", cols=5, fmt="png", dpi=100, tolerance=DEFAULT_TOLERANCE):
+    """
+    All years in one grid image with one shared colour bar (no region names, too small to read).
+
+    Parameters:
+    - out: file path or binary file object (e.g. io.BytesIO for the dashboard)
+    Returns: out
+    """
+    import math
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import Normalize
+    table = long_table.pivot(index="year", columns="region", values="CrashCount")
+    geometry = region_geometry_layer(tolerance)
+    table = table.reindex(columns=list(geometry[REGION_KEY]), fill_value=0)
+    norm = Normalize(vmin=0, vmax=max(int(table.to_numpy().max()), 1))
+    paths = region_paths(geometry.geometry) #converted once, every panel shares the same Path objects
+
+    rows = math.ceil(len(table) / cols)
+    fig, axes_grid = plt.subplots(rows, cols, figsize=(cols * 1.8, rows * 2.4), squeeze=False, layout="constrained")
+    collection = None
+    for axes, (year, counts) in zip(axes_grid.flat, table.iterrows()):
+        collection = region_collection(paths, cmap, norm)
+        collection.set_linewidth(0.2)
+        collection.set_array(counts.to_numpy())
+        axes.add_collection(collection)
+        axes.autoscale_view()
+        axes.set_aspect("equal")
+        axes.set_title(str(year), fontsize=9)
+    for axes in axes_grid.flat:
+        axes.axis("off")
+    if collection is not None:
+        fig.colorbar(collection, ax=axes_grid.ravel().tolist(), shrink=0.6, label="Crash count")
+    fig.suptitle(f"Annual Crash Count by Region {table.index.min()}-{table.index.max()}")
+    try:
+        fig.savefig(out, format=fmt, dpi=dpi)
+    finally:
+        plt.close(fig)
+    return out
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regional crash maps of all years in one run")
+    parser.add_argument("kind", choices=["gif", "mp4", "grid", "frames", "table"])
+    parser.add_argument("--out", default="reports/maps", help="output folder")
+    parser.add_argument("--format", default="png", choices=["png", "svg", "pdf"], help="image format (grid, frames)")
+    parser.add_argument("--cmap", default="OrRd")
+    parser.add_argument("--cols", type=int, default=5, help="columns of the small multiples grid")
+    parser.add_argument("--fps", type=int, default=2)
+    parser.add_argument("--start-year", type=int, default=YEAR_RANGE.start)
+    parser.add_argument("--end-year", type=int, default=YEAR_RANGE.stop - 1)
+    parser.add_argument("--weather", nargs="*", help="only these weatherA values")
+    parser.add_argument("--speed", nargs="*", type=int, help="only these speed limits")
+    parser.add_argument("--severity", nargs="*", help="only these crash severity types")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cube = load_crash_cube()
+    if args.weather:
+        cube = cube.filter(weatherA=args.weather)
+    if args.speed:
+        cube = cube.filter(effectiveSpeed=args.speed)
+    if args.severity:
+        cube = cube.filter(crashSeverity=args.severity)
+    years = range(args.start_year, args.end_year + 1)
+    os.makedirs(args.out, exist_ok=True)
+
+    long_table = region_counts_long_table(cube, years)
+    table_path = os.path.join(args.out, f"region_counts_{years.start}_{years.stop - 1}.csv")
+    long_table.to_csv(table_path, index=False) #counts of every output, also for kind 'table'
+    paths = [table_path]
+    if args.kind != "table":
+        import matplotlib
+        matplotlib.use("Agg") #files only, no window
+    if args.kind in ("gif", "mp4"):
+        paths.append(render_animation(long_table, os.path.join(args.out, f"crash_maps_{years.start}_{years.stop - 1}.{args.kind}"),
+                                      args.cmap, args.fps))
+    elif args.kind == "grid":
+        paths.append(render_small_multiples(long_table, os.path.join(args.out, f"crash_maps_grid_{years.start}_{years.stop - 1}.{args.format}"),
+                                            args.cmap, args.cols, args.format))
+    elif args.kind == "frames":
+        paths.extend(render_year_frames(long_table, args.out, args.cmap, args.format))
+    print(f"{len(paths)} file(s) written to {args.out} in {time.perf_counter() - start:.1f}s")
+    return paths
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,11 @@ New Zealand regions (based on shp) for specific year.
 Key Functions:
 
 get_region_crash_counts_for_join: Counts crashes by region for a specific year.
-* corrected Auckland name
+* Auckland name is corrected once when cleaning (clean_data.REGION_NAME_MAPPING)
 
 merge_shp_with_map_data: Merges shapefile geographic data with crash data, 
 ensuring all regions are represented. Exclude outside region.
+* geometry is read once and simplified in region_geometry.py
 
 generate_region_crash_map_by_year: Plots the crash count map with matplotlib.
 
@@ -22,16 +23,16 @@ Input: Cleaned crash data and shp path.
 Output: Figure object of the map, ready for display or saving.
 """
 
-import geopandas as gpd
-import pandas as pd
-import matplotlib.pyplot as plt
-from adjustText import adjust_text
-from clean_data import load_and_clean
+from clean_data import REGION_NAME_MAPPING
+from crash_cube import as_crash_cube
+from region_geometry import MAP_FILE, DEFAULT_TOLERANCE, load_region_geometry
+from instrumentation import traced
+#matplotlib is imported when a map is plotted (geopandas: in region_geometry),
+#so the count functions can be imported by dashboard and reports without loading them
 
-MAP_FILE = "data/regional-council-2025.shp"
 SEVERITY_ORDER = ["Fatal Crash", "Serious Crash", "Minor Crash", "Non-Injury Crash"]
 
-Auckland_name_mapping = {'Auckland Region': 'Auckland'} #solve the Auckland name anomaly
+Auckland_name_mapping = REGION_NAME_MAPPING #solve the Auckland name anomaly, now applied in clean_data
 
 def get_region_crash_counts_for_join(df, year):
     """Prepare the DataFrame for map function:
@@ -40,21 +41,22 @@ def get_region_crash_counts_for_join(df, year):
     - DataFrame columns are region and 'crashCount'
     
     Parameter:
-    cleaned crash data from clean_data.py
+    cleaned crash data from clean_data.py (or its crash cube)
     int year for planned filter
 
     Return:
     DataFrame of crash count by region    
     """
-    filtered_df = df.loc[df['crashYear'] == year]  
-    grouped = filtered_df.groupby('region', observed= False).size().reset_index(name = 'CrashCount') 
-    grouped['region'] = grouped['region'].astype(str).replace(Auckland_name_mapping)
-    #use group to accumulate by region name using size() and set column name as 'CrashCount'
+    filtered_cube = as_crash_cube(df).filter(crashYear=[year])
+    grouped = filtered_cube.counts_by('region').reset_index(name = 'CrashCount') 
+    grouped['region'] = grouped['region'].astype(str) #names already match the shapefile
+    #sum cube by region name and set column name as 'CrashCount'
     return grouped 
 
 #note: defalut arguments can be automatically passed to main function
 #note: crash_map_data is not good naming, caused confusion when revisiting the sub-function
-def merge_shp_with_map_data (region_crash_counts, shp_path=MAP_FILE, region_key_shp="REGC2025_1", region_key_data="region", count_col="CrashCount"):
+@traced("map.merge_shp_with_map_data")
+def merge_shp_with_map_data (region_crash_counts, shp_path=MAP_FILE, region_key_shp="REGC2025_1", region_key_data="region", count_col="CrashCount", tolerance=DEFAULT_TOLERANCE):
     """Merge map shp data with prepared data for map
     Parameters:
     -introduce shp file
@@ -62,12 +64,13 @@ def merge_shp_with_map_data (region_crash_counts, shp_path=MAP_FILE, region_key_
     -join key from shp file
     -join key from crash map data
     -column name of crash count data
+    -simplify tolerance in metres (0 for full resolution)
 
     Returns:
     gpd dataframe merged with crash count, need to filled 0 if no data for the region record.
     """
-    gpd_df = gpd.read_file(shp_path)
-    gpd_df = gpd_df[gpd_df['REGC2025_1'] != 'Area Outside Region'] #remind from Edward, this region can be excluded
+    layer = load_region_geometry(shp_path, tolerance) #cached, outside region already excluded
+    gpd_df = layer[[region_key_shp, layer.geometry.name, "label_x", "label_y"]]
     merged = gpd_df.merge(region_crash_counts, left_on=region_key_shp, right_on=region_key_data, how="left")
     #why left: maintain integrity of shp data, if data for certain region of a year is 0, nan will be given for the region
     #right join: if one region is 0, shp will not be introduced and cause error
@@ -76,21 +79,36 @@ def merge_shp_with_map_data (region_crash_counts, shp_path=MAP_FILE, region_key_
     #fill nan with 0, transfer to int as nan is float
     return merged
 
-def generate_region_crash_map_by_year(cleaned_df, year, cmap="OrRd"):
+FIGURE_SIZE = (10, 8)
+LABEL_FONT_SIZE = 6
+_label_layouts = {} #(region names, tolerance, figsize) -> label positions
+
+@traced("map.label_layout", rows=None)
+def get_label_layout(axes, merged_gdf, tolerance=DEFAULT_TOLERANCE, figsize=FIGURE_SIZE):
     """
-    generate a crash count in NZ map for a given year, scalable for streamlit based on scroll bar usage.
-    
-    Parameters:
-        df (pd.DataFrame): cleaned crash data
-        year (int): year to filter
-        cmap (str): color map #OrRd - color from orange to red to show data difference
+    Return label positions [(x, y), ...] for the regions in merged_gdf.
 
-    To do: need to include data as legend. Will it be able to show the legend dataframe (region & counts) in streamlit dashboard?
+    Placement only depends on geometry and figure size, not on crash counts or colours,
+    so it runs once per layout and later renders reuse the positions.
     """
-    region_crash_counts = get_region_crash_counts_for_join(cleaned_df, year)
-    merged_gdf = merge_shp_with_map_data(region_crash_counts)
+    key = (tuple(merged_gdf['REGC2025_1']), tolerance, tuple(figsize))
+    if key not in _label_layouts:
+        from label_layout import compute_label_layout
+        #label points are precomputed in geometry layer, greedy placement replaced adjust_text (deterministic, ms instead of s)
+        _label_layouts[key] = compute_label_layout(axes, merged_gdf['label_x'].to_numpy(), merged_gdf['label_y'].to_numpy(),
+                                                   list(merged_gdf['REGC2025_1']), fontsize=LABEL_FONT_SIZE)
+    return _label_layouts[key]
+
+@traced("render.region_map_figure", rows=None)
+def plot_region_crash_map(region_crash_counts, year, cmap="OrRd", tolerance=DEFAULT_TOLERANCE, figsize=FIGURE_SIZE):
+    """
+    Plot the crash count map from prepared region counts (output of get_region_crash_counts_for_join).
+    Split from generate_region_crash_map_by_year, so cached or precomputed counts can be plotted directly.
+    """
+    import matplotlib.pyplot as plt
+    merged_gdf = merge_shp_with_map_data(region_crash_counts, tolerance=tolerance)
 
-    fig, axes = plt.subplots(figsize=(10, 8)) #setup canvas and axes in canvas
+    fig, axes = plt.subplots(figsize=figsize) #setup canvas and axes in canvas
     merged_gdf.plot(
         column="CrashCount",
         cmap=cmap,
@@ -102,19 +120,24 @@ def generate_region_crash_map_by_year(cleaned_df, year, cmap="OrRd"):
     axes.set_title(f"Annual Crash Count by Region of {year}")
     axes.axis("off")
     plt.tight_layout() #auto adjusts the plot layout
-    
-    #use adjusttext to adjust the text locations
-    texts = [] #prepare list for text (region)
-    for idx, row in merged_gdf.iterrows(): #iterate over gdf for each row/region with geo data
-        centroid = row['geometry'].centroid #calculate center of region
-        text = axes.text(centroid.x, centroid.y, row['REGC2025_1'], 
-                         ha='center', fontsize=6, color='black') 
-        #parameter: row name for region, horizontally align in center, font size and color
-        texts.append(text)
-
-    adjust_text(texts, ax=axes, expand_text=(1.5, 1.5), expand_objects=(6, 6))
-    #parameters: object: texts list, axes, max distance to center, space between
+
+    positions = get_label_layout(axes, merged_gdf, tolerance, figsize)
+    for (x, y), name in zip(positions, merged_gdf['REGC2025_1']):
+        axes.text(x, y, name, ha='center', va='center', fontsize=LABEL_FONT_SIZE, color='black')
+        #parameter: row name for region, centred on the placed position, font size and color
 
     return fig
 
-cleaned_df = load_and_clean()
\ No newline at end of file
+def generate_region_crash_map_by_year(cleaned_df, year, cmap="OrRd"):
+    """
+    generate a crash count in NZ map for a given year, scalable for streamlit based on scroll bar usage.
+    
+    Parameters:
+        df (pd.DataFrame): cleaned crash data
+        year (int): year to filter
+        cmap (str): color map #OrRd - color from orange to red to show data difference
+
+    To do: need to include data as legend. Will it be able to show the legend dataframe (region & counts) in streamlit dashboard?
+    """
+    region_crash_counts = get_region_crash_counts_for_join(cleaned_df, year)
+    return plot_region_crash_map(region_crash_counts, year, cmap)
@@ -0,0 +1,356 @@
+"""
+Render cache for regional crash maps.
+
+Purpose:
+Render every map frame (year, filter set, colour map) once, keep the image bytes
+in a memory LRU with disk spill, and let the dashboard serve cached frames instantly.
+Frames can be rendered ahead of time in a background process pool.
+
+Key Functions:
+
+render_region_map: render one frame to PNG/SVG bytes (runs in worker processes).
+
+MapRenderCache: LRU of image bytes bounded by memory size, evicted frames are written to disk
+and read back on the next request. get_or_render serves a frame, prerender fills the cache in background.
+The spill folder is bounded too (max_disk_bytes, least recently used files are deleted), and frames of
+older RENDER_VERSIONs or broken files are removed when the cache starts.
+
+render_all_years: batch command for report generation, writes one image per year.
+
+Usage (from project folder):
+python map_render_cache.py --out reports/maps --format png
+
+Note: the cache key is a hash of the region counts (plus year, cmap, format), not of the filter values,
+so a changed dataset never serves an old frame and equal counts share one frame.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from clean_data import CACHE_DIR
+from crash_cube import as_crash_cube, load_crash_cube
+from map_plotting import get_region_crash_counts_for_join
+from instrumentation import traced
+
+RENDER_DIR = os.path.join(CACHE_DIR, "maps")
+RENDER_VERSION = 1 #bump when map layout changes, old frames are not used any more
+SPILL_NAME = re.compile(rf"v{RENDER_VERSION}-[0-9a-f]{{40}}") #spilled frame of this version: v<version>-<key>
+FRAME_MAGIC = (b"\x89PNG\r\n\x1a\n", b"<?xml", b"<svg") #png / svg start, anything else is a broken file
+YEAR_RANGE = range(2000, 2025) #same range as the dashboard slider
+
+def region_counts_records(cube, year):
+    """Return region counts of a year as a list of (region, count), small and picklable for workers."""
+    region_df = get_region_crash_counts_for_join(cube, year)
+    return [(region, int(count)) for region, count in zip(region_df['region'], region_df['CrashCount'])]
+
+def make_render_key(region_counts, year, cmap="OrRd", fmt="png"):
+    """Hash of everything a frame depends on."""
+    payload = json.dumps([RENDER_VERSION, int(year), cmap, fmt, region_counts])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+@traced("render.region_map_bytes", rows=None) #spans of background workers stay in the worker process
+def render_region_map(region_counts, year, cmap="OrRd", fmt="png", dpi=100):
+    """
+    Render one map frame and return the image bytes.
+
+    Parameters:
+    - region_counts: list of (region, count), from region_counts_records
+    - year: year shown in the title
+    - cmap: colour map
+    - fmt: 'png' or 'svg'
+    - dpi: resolution for png
+    """
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    from map_plotting import plot_region_crash_map
+
+    counts_df = pd.DataFrame(region_counts, columns=["region", "CrashCount"])
+    fig = plot_region_crash_map(counts_df, year, cmap)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi)
+    plt.close(fig) #free figure memory, many frames are rendered in one process
+    return buffer.getvalue()
+
+class MapRenderCache:
+    """
+    Memory LRU of rendered frames with disk spill and a background process pool.
+
+    Parameters:
+    - max_memory_bytes: memory budget for image bytes, least recently used frames are spilled to disk
+    - spill_dir: folder for spilled frames (None = no disk spill, evicted frames are dropped)
+    - max_disk_bytes: budget of the spill folder, files used least recently (mtime, refreshed on a disk hit)
+      are deleted when it is exceeded
+    - max_workers: processes for prerender (default: up to 4)
+
+    Review note: several processes (dashboard, query server, warmup) share the spill folder, so the
+    folder is rescanned when this process' estimate goes over the budget and trimmed to 90% of it.
+    """
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, spill_dir=RENDER_DIR, max_workers=None,
+                 max_disk_bytes=256 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.memory_bytes = 0
+        self.disk_bytes = 0 #estimate, exact after every scan
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self._frames = OrderedDict() #key -> bytes, most recently used at the end
+        self._pending = {} #key -> Future of a background render
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._executor = None
+        if self.spill_dir:
+            self._clean_spill_dir()
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"v{RENDER_VERSION}-{key}")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False #removed by another process already
+
+    def _clean_spill_dir(self):
+        """
+        Startup clean-up: delete leftovers of interrupted writes, frames of other RENDER_VERSIONs
+        (or spilled before the version was in the file name) and files which are not a png/svg frame,
+        then trim to the disk budget.
+        """
+        try:
+            entries = list(os.scandir(self.spill_dir))
+        except OSError:
+            return #folder not created yet
+        total = 0
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            valid = SPILL_NAME.fullmatch(entry.name) is not None
+            if valid:
+                try:
+                    with open(entry.path, "rb") as f:
+                        head = f.read(8)
+                    valid = head.startswith(FRAME_MAGIC)
+                except OSError:
+                    valid = False
+            if not valid:
+                self._remove(entry.path)
+            else:
+                total += entry.stat().st_size
+        self.disk_bytes = total
+        if self.max_disk_bytes is not None and total > self.max_disk_bytes:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete least recently used spill files until the folder is at 90% of max_disk_bytes."""
+        with self._disk_lock:
+            files = []
+            try:
+                for entry in os.scandir(self.spill_dir):
+                    if entry.is_file() and SPILL_NAME.fullmatch(entry.name):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            except OSError:
+                return
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            target = int(self.max_disk_bytes * 0.9)
+            for _, size, path in files:
+                if total <= target:
+                    break
+                if self._remove(path):
+                    self.disk_evictions += 1
+                total -= size
+            self.disk_bytes = total
+
+    def get(self, key):
+        """Return frame bytes from memory or disk, or None."""
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return self._frames[key]
+        path = self._spill_path(key) if self.spill_dir else None
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path) #recently used, kept longest when the folder is trimmed
+            except OSError:
+                return None #trimmed by another process meanwhile
+            if not data.startswith(FRAME_MAGIC):
+                self._remove(path) #broken file, render again
+                return None
+            self.put(key, data) #promote back to memory
+            with self._lock:
+                self.disk_hits += 1
+            return data
+        return None
+
+    def put(self, key, data):
+        """Add a frame, spill least recently used frames while over the memory budget."""
+        evicted = []
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return
+            self._frames[key] = data
+            self.memory_bytes += len(data)
+            while self.memory_bytes > self.max_memory_bytes and len(self._frames) > 1:
+                old_key, old_data = self._frames.popitem(last=False)
+                self.memory_bytes -= len(old_data)
+                evicted.append((old_key, old_data))
+        if self.spill_dir:
+            for old_key, old_data in evicted:
+                self._write_spill(old_key, old_data)
+
+    def _write_spill(self, key, data):
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return #disk spill is best effort, frame can be rendered again
+        with self._disk_lock:
+            self.disk_bytes += len(data)
+            over_budget = self.max_disk_bytes is not None and self.disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._trim_disk()
+
+    def get_or_render(self, region_counts, year, cmap="OrRd", fmt="png"):
+        """Serve a frame: memory, disk, running background render, or render now."""
+        key = make_render_key(region_counts, year, cmap, fmt)
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            self.misses += 1
+            future = self._pending.get(key)
+        if future is not None:
+            return future.result() #already rendering in background, wait for it
+        data = render_region_map(region_counts, year, cmap, fmt)
+        self.put(key, data)
+        return data
+
+    def _get_executor(self):
+        if self._executor is None:
+            #spawn: a clean worker, safe when the parent runs threads (streamlit)
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def prerender(self, jobs):
+        """
+        Render frames in the background process pool, frames already cached or running are skipped.
+
+        Parameter: jobs - iterable of (region_counts, year, cmap, fmt)
+        Return: list of submitted futures
+        """
+        submitted = []
+        for region_counts, year, cmap, fmt in jobs:
+            key = make_render_key(region_counts, year, cmap, fmt)
+            with self._lock:
+                if key in self._frames or key in self._pending:
+                    continue
+            if self.spill_dir and os.path.exists(self._spill_path(key)):
+                continue
+            future = self._get_executor().submit(render_region_map, region_counts, year, cmap, fmt)
+            with self._lock:
+                self._pending[key] = future
+            future.add_done_callback(lambda f, key=key: self._finish(key, f))
+            submitted.append(future)
+        return submitted
+
+    def _finish(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        if future.exception() is None:
+            self.put(key, future.result())
+
+    def spill_all(self):
+        """Write every frame in memory to the spill folder, a restarted dashboard then finds them on disk."""
+        if not self.spill_dir:
+            return 0
+        with self._lock:
+            frames = list(self._frames.items())
+        for key, data in frames:
+            self._write_spill(key, data)
+        return len(frames)
+
+    def stats(self):
+        """Counters for a debug panel."""
+        with self._lock:
+            return {"frames_in_memory": len(self._frames), "memory_bytes": self.memory_bytes,
+                    "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "disk_bytes": self.disk_bytes, "disk_evictions": self.disk_evictions,
+                    "pending": len(self._pending)}
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+def map_render_jobs(cube, years=YEAR_RANGE, cmap="OrRd", fmt="png"):
+    """Prerender jobs for every year of one filter set (cube already filtered)."""
+    cube = as_crash_cube(cube)
+    return [(region_counts_records(cube, year), year, cmap, fmt) for year in years]
+
+def render_all_years(cube, out_dir, years=YEAR_RANGE, cmap="OrRd", fmt="png", max_workers=None):
+    """
+    Batch render one map per year into out_dir (for reports), in a process pool.
+
+    Returns: list of written file paths
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = map_render_jobs(cube, years, cmap, fmt)
+    paths = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(render_region_map, *job) for job in jobs]
+        for (_, year, _, _), future in zip(jobs, futures):
+            path = os.path.join(out_dir, f"crash_map_{year}.{fmt}")
+            with open(path, "wb") as f:
+                f.write(future.result())
+            paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the regional crash map for every year")
+    parser.add_argument("--out", default="reports/maps", help="output folder")
+    parser.add_argument("--format", default="png", choices=["png", "svg"])
+    parser.add_argument("--cmap", default="OrRd")
+    parser.add_argument("--start-year", type=int, default=YEAR_RANGE.start)
+    parser.add_argument("--end-year", type=int, default=YEAR_RANGE.stop - 1)
+    parser.add_argument("--weather", nargs="*", help="only these weatherA values")
+    parser.add_argument("--speed", nargs="*", type=int, help="only these speed limits")
+    parser.add_argument("--severity", nargs="*", help="only these crash severity types")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    cube = load_crash_cube()
+    if args.weather:
+        cube = cube.filter(weatherA=args.weather)
+    if args.speed:
+        cube = cube.filter(effectiveSpeed=args.speed)
+    if args.severity:
+        cube = cube.filter(crashSeverity=args.severity)
+    paths = render_all_years(cube, args.out, range(args.start_year, args.end_year + 1),
+                             args.cmap, args.format, args.workers)
+    print(f"{len(paths)} maps written to {args.out}")
+
+if __name__ == "__main__":
+    main()
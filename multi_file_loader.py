@@ -0,0 +1,192 @@
+"""
+Loader for several CAS extracts (yearly / regional files, or several releases).
+
+Purpose:
+Parse a list or glob of CAS csv files in a process pool and combine them into one cleaned df,
+the same df prepare_clean_df gives for all raw rows together (duplicates removed).
+
+Key Functions:
+
+resolve_columns: map the header of one file to RAW_COLUMNS. Header names are matched
+ignoring case and '_'/' ', plus known renames in COLUMN_ALIASES. Optional columns missing
+in older extracts are filled with NaN, missing required columns raise ValueError.
+
+load_cas_file: read and clean one file (runs in a worker process).
+
+load_cas_files: fan out over files, unify category dictionaries (clean_data registry)
+and deduplicate on OBJECTID (by default the row of the last file wins, list newer releases last).
+
+Usage (from project folder):
+python multi_file_loader.py "data/extracts/*.csv" --workers 8
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+from clean_data import (CATEGORY_COLUMNS, REGION_NAME_MAPPING, RAW_COLUMNS, RAW_DTYPES, compact_clean_df,
+                        get_category_dtype, prepare_clean_df)
+
+#canonical column -> names used by other releases/extracts (compared after normalize_column_name)
+COLUMN_ALIASES = {
+    "X": ["easting", "nztmx"],
+    "Y": ["northing", "nztmy"],
+    "OBJECTID": ["fid", "objectid1", "crashid"],
+    "crashYear": ["year", "crashyr"],
+    "speedLimit": ["speed", "speedlim"],
+    "temporarySpeedLimit": ["tempspeedlimit", "tempspeed", "temporaryspeed"],
+    "crashSeverity": ["severity", "crashsev"],
+    "weatherA": ["weather", "weathera1"],
+    "region": ["regionname", "regionalcouncil", "tlaregion"],
+    "urban": ["urbanrural", "urbanflag"],
+}
+REQUIRED_COLUMNS = ["OBJECTID", "crashYear", "speedLimit", "crashSeverity"]
+
+def normalize_column_name(name):
+    """'Crash_Year ' -> 'crashyear', used to compare header names."""
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+def expand_sources(sources):
+    """Return list of csv paths from a glob pattern, a path, or a list of them (glob results sorted)."""
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    paths = []
+    for source in sources:
+        matches = sorted(glob.glob(str(source)))
+        paths.extend(matches if matches else [str(source)])
+    return paths
+
+def resolve_columns(header, aliases=COLUMN_ALIASES):
+    """
+    Map a file header to RAW_COLUMNS.
+
+    Parameters:
+    - header: column names of the file
+    - aliases: canonical name -> list of other names
+
+    Returns:
+    - dict canonical column -> column name in the file (missing optional columns are left out)
+    """
+    by_normalized = {}
+    for name in header:
+        by_normalized.setdefault(normalize_column_name(name), name) #first one wins if a name repeats
+    mapping = {}
+    for column in RAW_COLUMNS:
+        for candidate in [column] + aliases.get(column, []):
+            found = by_normalized.get(normalize_column_name(candidate))
+            if found is not None:
+                mapping[column] = found
+                break
+    missing = [column for column in REQUIRED_COLUMNS if column not in mapping]
+    if missing:
+        raise ValueError(f"required CAS columns not found: {missing}, header is {list(header)}")
+    return mapping
+
+def read_cas_file(path, aliases=COLUMN_ALIASES):
+    """
+    Read one csv with reconciled schema, same columns and types as load_raw_dataframe.
+    Returns (raw df, mapping canonical -> file column).
+    """
+    mapping = resolve_columns(pd.read_csv(path, nrows=0).columns, aliases)
+    dtypes = {mapping[column]: RAW_DTYPES[column] for column in mapping if column in RAW_DTYPES}
+    raw_df = pd.read_csv(path, usecols=list(mapping.values()), dtype=dtypes)
+    raw_df = raw_df.rename(columns={name: column for column, name in mapping.items()})
+    for column in RAW_COLUMNS:
+        if column not in raw_df.columns: #optional column missing in this extract
+            raw_df[column] = pd.Series(np.nan, index=raw_df.index, dtype=RAW_DTYPES.get(column, "float32"))
+    return raw_df.set_index("OBJECTID")[[c for c in RAW_COLUMNS if c != "OBJECTID"]], mapping
+
+def load_cas_file(path, aliases=COLUMN_ALIASES):
+    """
+    Read and clean one file.
+
+    Returns:
+    - cleaned df (index OBJECTID)
+    - all raw OBJECTIDs of the file (for deduplication across files)
+    - positions of the cleaned rows among the raw rows
+    - column mapping used
+    """
+    raw_df, mapping = read_cas_file(path, aliases)
+    object_ids = raw_df.index.to_numpy()
+    cleaned_df = prepare_clean_df(raw_df.set_axis(pd.RangeIndex(len(raw_df)))) #positional, ids may repeat
+    positions = cleaned_df.index.to_numpy()
+    cleaned_df.index = pd.Index(object_ids[positions], name="OBJECTID")
+    return cleaned_df, object_ids, positions, mapping
+
+def load_cas_files(sources, workers=None, keep="last", aliases=COLUMN_ALIASES, return_report=False):
+    """
+    Load several CAS files into one cleaned df.
+
+    Parameters:
+    - sources: glob pattern, path or list of them, in priority order
+    - workers: processes (None = one per file up to cpu count, 1 = serial)
+    - keep: 'last' or 'first', which row of a repeated OBJECTID is kept
+    - aliases: extra column renames, see COLUMN_ALIASES
+    - return_report: also return a dict with files, rows, duplicates and column mappings
+
+    Returns:
+    - cleaned df, same as prepare_clean_df on all raw rows with duplicated OBJECTIDs dropped
+      (compact types, shared category dictionaries)
+    """
+    paths = expand_sources(sources)
+    if not paths:
+        raise FileNotFoundError(f"no CAS file found for {sources}")
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    if workers == 1 or len(paths) == 1:
+        results = [load_cas_file(path, aliases) for path in paths]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(load_cas_file, paths, [aliases] * len(paths)))
+
+    #deduplicate on raw rows, so a newer row with an invalid speed also removes the older valid one
+    all_ids = np.concatenate([object_ids for _, object_ids, _, _ in results])
+    kept = ~pd.Index(all_ids).duplicated(keep=keep)
+    #register values new in any file first, so every frame gets the same dictionary and concat keeps categories
+    for col in CATEGORY_COLUMNS:
+        values = [v for cleaned_df, _, _, _ in results for v in cleaned_df[col].cat.categories]
+        get_category_dtype(col, [REGION_NAME_MAPPING.get(v, v) for v in values] if col == "region" else values)
+    frames, offset = [], 0
+    for cleaned_df, object_ids, positions, _ in results:
+        file_kept = kept[offset:offset + len(object_ids)]
+        frames.append(compact_clean_df(cleaned_df[file_kept[positions]])) #worker dictionaries -> registry
+        offset += len(object_ids)
+    combined = compact_clean_df(pd.concat(frames)) #concat makes new dtype objects, back to the shared ones
+
+    if not return_report:
+        return combined
+    report = {
+        "files": paths,
+        "raw_rows": int(len(all_ids)),
+        "duplicates_dropped": int((~kept).sum()),
+        "cleaned_rows": len(combined),
+        "columns": {path: mapping for path, (_, _, _, mapping) in zip(paths, results)},
+    }
+    return combined, report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load and clean several CAS csv files")
+    parser.add_argument("sources", nargs="+", help="csv paths or glob patterns, newer releases last")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--keep", default="last", choices=["first", "last"])
+    parser.add_argument("--out", default=None, help="save combined cleaned df as parquet")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cleaned_df, report = load_cas_files(args.sources, args.workers, args.keep, return_report=True)
+    print(f"{len(report['files'])} file(s), {report['raw_rows']} raw rows, "
+          f"{report['duplicates_dropped']} duplicated OBJECTID(s) dropped, {report['cleaned_rows']} cleaned rows "
+          f"in {time.perf_counter() - start:.2f}s")
+    for path, mapping in report["columns"].items():
+        renamed = {column: name for column, name in mapping.items() if name != column}
+        if renamed:
+            print(f"  {path}: renamed {renamed}")
+    if args.out:
+        cleaned_df.to_parquet(args.out)
+        print(f"Saved to {args.out}")
+
+if __name__ == "__main__":
+    main()
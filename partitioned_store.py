@@ -0,0 +1,298 @@
+"""
+Year/region partitioned copy of the cleaned data with partition pruning.
+
+Purpose:
+load_and_clean reads every row of every year, even when a report or view needs one year of one region.
+The partitioned store keeps the cleaned rows as one parquet file per crashYear and region
+(Hive layout: crashYear=2015/region=Otago Region/part-0.parquet) plus a manifest with statistics
+of every partition (rows, bytes, speeds, severity/weather/urban values, X/Y bounds).
+Reads look at the manifest first and open only the partitions a filter can match.
+
+Key Functions:
+
+write_partitioned_store: write the layout and manifest for a cleaned df.
+
+load_partitioned_store: store of a csv, rebuilt when the source fingerprint or CLEANING_VERSION changes.
+
+PartitionedStore.prune: partitions a filter can match (manifest only, no file opened).
+
+PartitionedStore.read_rows: cleaned rows of the matching partitions, same columns and types as load_and_clean.
+
+PartitionedStore.filter: CrashCube of the matching rows, so main.py reports and map functions take the store
+like a cube, e.g. get_region_crash_counts_for_join(store, 2015) reads only the 2015 partitions.
+
+Usage (from project folder):
+python partitioned_store.py build
+python partitioned_store.py query --year 2015 --region "Otago Region"
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from clean_data import (DATA_FILE, CACHE_DIR, CATEGORY_COLUMNS, CLEAN_COLUMNS, COORDINATE_COLUMNS, compact_clean_df,
+                        get_cache_paths, get_category_dtype, get_source_fingerprint, load_and_clean, read_cache_meta)
+from crash_cube import build_crash_cube
+from instrumentation import span, traced
+
+PARTITION_COLUMNS = ["crashYear", "region"]
+STORE_VERSION = 1 #bump when layout or manifest change
+MANIFEST_NAME = "manifest.json"
+MISSING_PARTITION = "__HIVE_DEFAULT_PARTITION__" #Hive name of a missing partition value (crash without region)
+#columns with a value list per partition in the manifest (few values each)
+VALUE_STAT_COLUMNS = ["effectiveSpeed", "crashSeverity", "weatherA", "urban"]
+
+def get_store_dir(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """Store folder lives beside the parquet cache of the same csv."""
+    parquet_path, _ = get_cache_paths(filename, cache_dir)
+    return parquet_path.replace(".cleaned.parquet", ".partitions")
+
+def partition_path(year, region):
+    """Relative folder of one partition, region names are kept as written (no url encoding needed for CAS names)."""
+    region = MISSING_PARTITION if region is None else str(region).replace("/", "_")
+    return os.path.join(f"crashYear={year}", f"region={region}")
+
+def _value_list(series):
+    values = series.dropna().unique()
+    return sorted(int(v) if isinstance(v, (np.integer, int)) else str(v) for v in values)
+
+def partition_stats(part):
+    """Manifest statistics of one partition df."""
+    stats = {"rows": len(part)}
+    for col in VALUE_STAT_COLUMNS:
+        stats[col] = _value_list(part[col])
+        if part[col].isna().any():
+            stats[col + "_missing"] = True
+    located = part[COORDINATE_COLUMNS].dropna()
+    if len(located):
+        stats["bbox"] = [float(located["X"].min()), float(located["Y"].min()),
+                         float(located["X"].max()), float(located["Y"].max())]
+    return stats
+
+@traced("store.write_partitioned_store", rows=None)
+def write_partitioned_store(cleaned_df, store_dir, fingerprint=None):
+    """
+    Write cleaned df as one parquet file per crashYear/region and a manifest.
+
+    Parameters:
+    - cleaned_df: output of load_and_clean
+    - store_dir: target folder (replaced as a whole)
+    - fingerprint: source fingerprint saved in the manifest (load_partitioned_store compares it)
+
+    Returns: manifest dict
+
+    Review note: the folder is written under a temp name and swapped in at the end,
+    readers never see a half written store.
+    """
+    tmp_dir = store_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    partitions = []
+    file_columns = [col for col in CLEAN_COLUMNS if col not in PARTITION_COLUMNS] #partition values are in the path
+    grouped = cleaned_df.groupby(PARTITION_COLUMNS, observed=True, dropna=False, sort=True)
+    for (year, region), part in grouped:
+        region = None if pd.isna(region) else str(region)
+        relative = partition_path(int(year), region)
+        os.makedirs(os.path.join(tmp_dir, relative), exist_ok=True)
+        file_path = os.path.join(relative, "part-0.parquet")
+        part[file_columns].to_parquet(os.path.join(tmp_dir, file_path))
+        partitions.append({"path": file_path, "crashYear": int(year), "region": region,
+                           "bytes": os.path.getsize(os.path.join(tmp_dir, file_path)), **partition_stats(part)})
+    manifest = {"store_version": STORE_VERSION, "fingerprint": fingerprint, "rows": len(cleaned_df),
+                "partition_columns": PARTITION_COLUMNS, "partitions": partitions}
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    old_dir = store_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+def read_manifest(store_dir):
+    """Manifest dict of a store, or None if missing/broken."""
+    try:
+        with open(os.path.join(store_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _matches(partition, column, values):
+    """Can a partition hold rows whose column value is in values? (manifest statistics only)"""
+    wanted = set(values)
+    if column in PARTITION_COLUMNS:
+        return partition[column] in wanted
+    return not wanted.isdisjoint(partition[column])
+
+def _bbox_overlaps(partition, bbox):
+    if "bbox" not in partition:
+        return False
+    xmin, ymin, xmax, ymax = partition["bbox"]
+    return not (xmax < bbox[0] or xmin > bbox[2] or ymax < bbox[1] or ymin > bbox[3])
+
+def _empty_rows():
+    """Cleaned df without rows (a filter matching no partition)."""
+    columns = {col: pd.Categorical([], dtype=get_category_dtype(col)) if col in CATEGORY_COLUMNS else np.array([])
+               for col in CLEAN_COLUMNS}
+    return pd.DataFrame(columns, index=pd.Index(np.array([], dtype=np.int64), name="OBJECTID"))
+
+class PartitionedStore:
+    """
+    Reader of a partitioned store with the CrashCube query API.
+
+    Parameters:
+    - store_dir: folder written by write_partitioned_store
+    - manifest: its manifest (read if not given)
+
+    Attributes:
+    - bytes_read / partitions_read: counters of opened files, to check pruning
+    """
+    def __init__(self, store_dir, manifest=None):
+        self.store_dir = store_dir
+        self.manifest = manifest or read_manifest(store_dir)
+        if self.manifest is None:
+            raise FileNotFoundError(f"no partitioned store in {store_dir}, run: python partitioned_store.py build")
+        self.partitions = self.manifest["partitions"]
+        self.bytes_read = 0
+        self.partitions_read = 0
+        self._cube = None
+
+    @property
+    def total_bytes(self):
+        return sum(p["bytes"] for p in self.partitions)
+
+    def prune(self, bbox=None, **selections):
+        """
+        Partitions which can hold rows of the filter (same meaning as CrashCube.filter, AND of isin).
+
+        Parameters:
+        - bbox: optional (xmin, ymin, xmax, ymax), partitions whose crashes lie outside are skipped
+        - selections: column -> list of values, any cleaned column except X/Y
+        """
+        kept = []
+        for partition in self.partitions:
+            if all(_matches(partition, column, values) for column, values in selections.items()):
+                if bbox is None or _bbox_overlaps(partition, bbox):
+                    kept.append(partition)
+        return kept
+
+    def _read_partitions(self, partitions):
+        """
+        Rows of the partitions as one df, partition values added from the manifest.
+
+        Review note: files are read as arrow tables and converted to pandas once,
+        a read_parquet per file spent most of the time converting small frames.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        tables = [pq.read_table(os.path.join(self.store_dir, p["path"])) for p in partitions]
+        self.bytes_read += sum(p["bytes"] for p in partitions)
+        self.partitions_read += len(partitions)
+        rows = pa.concat_tables(tables).to_pandas()
+        lengths = [table.num_rows for table in tables]
+        rows["crashYear"] = np.repeat([p["crashYear"] for p in partitions], lengths)
+        regions = [p["region"] for p in partitions]
+        dtype = get_category_dtype("region", [r for r in regions if r is not None])
+        codes = dtype.categories.get_indexer(pd.Index(regions, dtype=object)) #missing region -> -1
+        rows["region"] = pd.Categorical.from_codes(np.repeat(codes, lengths), dtype=dtype)
+        return rows
+
+    def read_rows(self, bbox=None, **selections):
+        """
+        Cleaned rows of the filter, reading only matching partitions.
+
+        Returns: df with the columns and types of load_and_clean, rows ordered by OBJECTID
+        """
+        partitions = self.prune(bbox, **selections)
+        with span("store.read_rows", partitions=len(partitions)) as record:
+            rows = self._read_partitions(partitions) if partitions else _empty_rows()
+            rows = compact_clean_df(rows[CLEAN_COLUMNS]).sort_index()
+            mask = np.ones(len(rows), dtype=bool)
+            for column, values in selections.items():
+                mask &= rows[column].isin(values).to_numpy()
+            if bbox is not None:
+                x, y = rows["X"].to_numpy(), rows["Y"].to_numpy()
+                mask &= (x >= bbox[0]) & (x <= bbox[2]) & (y >= bbox[1]) & (y <= bbox[3])
+            rows = rows[mask]
+            record["rows"] = len(rows)
+        return rows
+
+    def filter(self, **selections):
+        """
+        Same as CrashCube.filter, but only the matching partitions are read and counted.
+        Returns a CrashCube, so reports keep working on the result.
+        """
+        return build_crash_cube(self.read_rows(**selections))
+
+    def cube(self):
+        """Cube of all rows (all partitions read once), for queries without a filter."""
+        if self._cube is None:
+            self._cube = build_crash_cube(self.read_rows())
+        return self._cube
+
+    def total(self):
+        return int(self.manifest["rows"])
+
+    def observed_values(self, column):
+        """Values with at least one row, from the manifest where possible (no file opened)."""
+        if column in PARTITION_COLUMNS:
+            return sorted({p[column] for p in self.partitions if p[column] is not None})
+        if column in VALUE_STAT_COLUMNS:
+            return sorted({value for p in self.partitions for value in p[column]})
+        return self.cube().observed_values(column)
+
+    def marginal(self, column, include_missing=False):
+        return self.cube().marginal(column, include_missing)
+
+    def counts_by(self, column):
+        return self.cube().counts_by(column)
+
+    def count_table(self, row_column, col_column):
+        return self.cube().count_table(row_column, col_column)
+
+@traced("store.load_partitioned_store", rows=None)
+def load_partitioned_store(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """
+    Return the store of a csv, rebuilt from load_and_clean (its parquet cache) if the
+    source fingerprint or cleaning version changed since the store was written.
+    """
+    store_dir = get_store_dir(filename, cache_dir)
+    _, meta_path = get_cache_paths(filename, cache_dir)
+    fingerprint = get_source_fingerprint(filename, previous=read_cache_meta(meta_path))
+    manifest = read_manifest(store_dir)
+    if (manifest is not None and manifest.get("store_version") == STORE_VERSION and manifest.get("fingerprint")
+            and manifest["fingerprint"].get("sha256") == fingerprint["sha256"]
+            and manifest["fingerprint"].get("cleaning_version") == fingerprint["cleaning_version"]):
+        return PartitionedStore(store_dir, manifest)
+    manifest = write_partitioned_store(load_and_clean(filename, cache_dir=cache_dir), store_dir, fingerprint)
+    return PartitionedStore(store_dir, manifest)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Year/region partitioned copy of the cleaned CAS data")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--year", type=int, nargs="*", help="query: crash years")
+    parser.add_argument("--region", nargs="*", help="query: region names (shapefile names)")
+    parser.add_argument("--speed", type=int, nargs="*", help="query: speed limits")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    store = load_partitioned_store(args.file)
+    print(f"{len(store.partitions)} partitions, {store.total()} rows, {store.total_bytes / 1e6:.1f} MB "
+          f"({time.perf_counter() - start:.2f}s)")
+    if args.command == "build":
+        return store
+    selections = {column: values for column, values in
+                  (("crashYear", args.year), ("region", args.region), ("effectiveSpeed", args.speed)) if values}
+    start = time.perf_counter()
+    rows = store.read_rows(**selections)
+    print(f"{len(rows)} rows from {store.partitions_read} partition(s), {store.bytes_read / 1e6:.2f} MB read "
+          f"({store.bytes_read / max(store.total_bytes, 1):.1%} of the store) in {time.perf_counter() - start:.3f}s")
+    print(rows["crashSeverity"].value_counts().to_string())
+    return rows
+
+if __name__ == "__main__":
+    main()
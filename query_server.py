@@ -0,0 +1,378 @@
+"""
+Local HTTP query API for crash aggregates.
+
+Purpose:
+Other tools (notebooks, scripts, dashboards) get report numbers and maps as JSON/PNG from one warm process
+instead of scraping the menu or re-implementing the reports. The server keeps one in-memory dataset
+(the crash cube, reloaded when the csv changes, as in the dashboard), caches responses in an LRU keyed
+on the normalized query, answers conditional requests with 304 (ETag), and limits how many responses
+are computed at once. Identical requests arriving together share one computation.
+Only the standard library is used for HTTP (asyncio streams, HTTP/1.1 keep-alive, GET/HEAD).
+
+Endpoints (JSON unless noted):
+/health
+/severity?year=2020&speed=50                    get_crash_severity_summary
+/table/by-year                                  generate_crash_table_by_year
+/table/speed-severity?weather=Fine,Light rain   calculate_count_table of the filtered data
+/regions?year=2020                              get_region_crash_counts_for_join
+/map.png?year=2020                              region map image (map_render_cache)
+/stats                                          request and cache counters
+Filters on every data endpoint: weather, speed, severity, urban (comma separated or repeated).
+
+Usage (from project folder):
+python query_server.py --port 8765
+curl "http://127.0.0.1:8765/severity?year=2020&speed=50"
+python -m benchmarks.load_test_server --clients 32 --seconds 10
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import namedtuple
+from urllib.parse import parse_qsl, urlsplit
+from dashboard_cache import DashboardCache, MemoCache
+from instrumentation import span
+from main import SEVERITY_ORDER, calculate_count_table, generate_crash_table_by_year, get_crash_severity_summary
+from map_plotting import get_region_crash_counts_for_join
+from map_render_cache import MapRenderCache, region_counts_records
+from shared_dataset import shared_or_local_cube
+
+DEFAULT_HOST = "127.0.0.1" #local tools only, no authentication
+DEFAULT_PORT = 8765
+MAX_HEADER_BYTES = 16 * 1024 #request line and header block each, also the stream line limit
+IDLE_TIMEOUT = 30 #seconds a keep-alive connection may wait for its next request
+
+#query parameter -> (dataset column, value type)
+FILTER_PARAMS = {"weather": ("weatherA", str), "speed": ("effectiveSpeed", int),
+                 "severity": ("crashSeverity", str), "urban": ("urban", str)}
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               414: "URI Too Long", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+Response = namedtuple("Response", "body content_type etag")
+
+class HTTPError(Exception):
+    """Error answered to the client as {"error": message} with this status."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def parse_params(query):
+    """Query string -> dict name -> list of values, comma separated values are split (weather=Fine,Snow)."""
+    params = {}
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        params.setdefault(name, []).extend(v.strip() for v in value.split(",") if v.strip())
+    return params
+
+def normalize_params(params):
+    """Hashable key of the parameters, order of names and values does not matter."""
+    return tuple(sorted((name, tuple(sorted(set(values)))) for name, values in params.items()))
+
+def int_param(params, name):
+    values = params.get(name)
+    if not values or len(values) != 1:
+        raise HTTPError(400, f"parameter '{name}' needs exactly one value")
+    try:
+        return int(values[0])
+    except ValueError:
+        raise HTTPError(400, f"parameter '{name}' must be a whole number") from None
+
+def selections_from(params, allowed=()):
+    """Filter parameters as CrashCube.filter selections, unknown parameters are an error."""
+    selections = {}
+    for name, values in params.items():
+        if name in allowed:
+            continue
+        if name not in FILTER_PARAMS:
+            raise HTTPError(400, f"unknown parameter '{name}', filters are {sorted(FILTER_PARAMS)}")
+        column, value_type = FILTER_PARAMS[name]
+        try:
+            selections[column] = sorted({value_type(v) for v in values})
+        except ValueError:
+            raise HTTPError(400, f"parameter '{name}' must be whole numbers") from None
+    return selections
+
+ENTITY_TAG = re.compile(r'\*|(?:W/)?"[^"]*"') #one entry of an If-None-Match list
+
+def etag_matches(etag, if_none_match):
+    """
+    If-None-Match check (weak comparison, RFC 7232): the header is a comma separated list of
+    strong or weak (W/"...") tags, or *. Returns True when one of them is our ETag.
+    """
+    for tag in ENTITY_TAG.findall(if_none_match or ""):
+        if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
+
+async def read_headers(reader):
+    """
+    Read the header block of one request into dict lower-case name -> value.
+    Raises HTTPError(431) when a line or the whole block is longer than MAX_HEADER_BYTES,
+    ConnectionError when the client closes or stops sending in the middle of it.
+    """
+    headers, size = {}, 0
+    while True:
+        try:
+            line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+        except (ValueError, asyncio.LimitOverrunError): #one line longer than the stream limit
+            raise HTTPError(431, f"header line longer than {MAX_HEADER_BYTES} bytes") from None
+        except asyncio.TimeoutError:
+            raise ConnectionError("client stopped sending headers") from None
+        if line == b"":
+            raise ConnectionError("connection closed in the headers")
+        if line in (b"\r\n", b"\n"):
+            return headers
+        size += len(line)
+        if size > MAX_HEADER_BYTES:
+            raise HTTPError(431, f"headers longer than {MAX_HEADER_BYTES} bytes")
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        #repeated header lines are one comma separated list (e.g. several If-None-Match)
+        headers[name] = f"{headers[name]}, {value.strip()}" if name in headers else value.strip()
+
+def _json_default(value):
+    if hasattr(value, "item"): #numpy scalar
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def json_response(payload):
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8"), "application/json"
+
+def table_payload(table):
+    """Count table as {"index": name, "columns": [...], "rows": [{index value, column: count ...}]}."""
+    index_name = table.index.name or "index"
+    return {"index": index_name, "columns": [str(c) for c in table.columns],
+            "rows": table.reset_index().rename(columns=str).to_dict(orient="records")}
+
+class QueryServer:
+    """
+    HTTP front of the report functions.
+
+    Parameters:
+    - dashboard_cache: dataset holder (default: DashboardCache over the shared or local cube)
+    - render_cache: map frame cache (default: MapRenderCache)
+    - max_concurrent: responses computed at the same time (threads), cache hits are not limited
+    - max_queue: requests waiting for a computation slot before new ones get 503
+    - cache_entries / cache_bytes: bounds of the response LRU
+    """
+    def __init__(self, dashboard_cache=None, render_cache=None, max_concurrent=4, max_queue=64,
+                 cache_entries=1024, cache_bytes=64 * 1024 * 1024):
+        self.dashboard_cache = dashboard_cache or DashboardCache(loader=shared_or_local_cube)
+        self.render_cache = render_cache or MapRenderCache()
+        self.responses = MemoCache(maxsize=cache_entries, max_bytes=cache_bytes, sizeof=lambda r: len(r.body))
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.counters = {"requests": 0, "not_modified": 0, "rejected": 0, "errors": 0, "shared_computations": 0}
+        self.routes = {
+            "/health": (self.health, False),
+            "/stats": (self.stats, False),
+            "/severity": (self.severity, True),
+            "/table/by-year": (self.table_by_year, True),
+            "/table/speed-severity": (self.table_speed_severity, True),
+            "/regions": (self.regions, True),
+            "/map.png": (self.region_map, True),
+        }
+        self._slots = None #asyncio.Semaphore, created in the server loop
+        self._waiting = 0
+        self._inflight = {} #cache key -> future of a running computation
+        self._data_checked = 0.0
+
+    #endpoint functions: (dataset, params) -> (body bytes, content type), run in a worker thread
+    def health(self, dataset, params):
+        return json_response({"status": "ok", "rows": dataset.total(), "reloads": self.dashboard_cache.reloads})
+
+    def stats(self, dataset, params):
+        return json_response({**self.counters, "responses": self.responses.stats(),
+                              "dataset": self.dashboard_cache.stats(), "maps": self.render_cache.stats()})
+
+    def severity(self, dataset, params):
+        year, speed = int_param(params, "year"), int_param(params, "speed")
+        view = self._filtered(selections_from(params, allowed=("year", "speed")))
+        summary = get_crash_severity_summary(year, speed, view)
+        counts = {} if summary is None else {str(k): int(v) for k, v in summary.items()}
+        return json_response({"year": year, "speed": speed, "counts": counts, "total": sum(counts.values())})
+
+    def table_by_year(self, dataset, params):
+        return json_response(table_payload(generate_crash_table_by_year(self._filtered(selections_from(params)))))
+
+    def table_speed_severity(self, dataset, params):
+        return json_response(table_payload(calculate_count_table(self._filtered(selections_from(params)), SEVERITY_ORDER)))
+
+    def regions(self, dataset, params):
+        year = int_param(params, "year")
+        region_df = get_region_crash_counts_for_join(self._filtered(selections_from(params, allowed=("year",))), year)
+        return json_response({"year": year, "regions": region_df.to_dict(orient="records")})
+
+    def region_map(self, dataset, params):
+        year = int_param(params, "year")
+        view = self._filtered(selections_from(params, allowed=("year",)))
+        return self.render_cache.get_or_render(region_counts_records(view, year), year, cmap="OrRd"), "image/png"
+
+    def _filtered(self, selections):
+        return self.dashboard_cache.filtered(**selections) if selections else self.dashboard_cache.dataset()
+
+    async def _check_data(self):
+        """Reload check (os.stat, reload in a thread if the csv changed) at most once per second."""
+        now = time.monotonic()
+        if now - self._data_checked >= 1.0:
+            self._data_checked = now
+            await asyncio.to_thread(self.dashboard_cache.dataset)
+
+    async def _compute(self, key, endpoint, params):
+        """Cached response, or computed once (concurrent identical requests wait for the same result)."""
+        cached = self.responses.get(key)
+        if cached is not None:
+            return cached
+        running = self._inflight.get(key)
+        if running is not None:
+            self.counters["shared_computations"] += 1
+            return await asyncio.shield(running)
+        if self._waiting >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise HTTPError(503, "server busy, retry later")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self._waiting += 1
+        queued = True
+        try:
+            async with self._slots:
+                self._waiting -= 1
+                queued = False
+                body, content_type = await asyncio.to_thread(endpoint, self.dashboard_cache.dataset(), params)
+            response = Response(body, content_type, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+            self.responses.put(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as error:
+            if not future.done():
+                future.set_exception(error)
+                future.exception() #retrieved, no "never retrieved" warning when nobody else waited
+            raise
+        finally:
+            if queued: #cancelled while waiting for a slot
+                self._waiting -= 1
+            self._inflight.pop(key, None)
+
+    async def respond(self, method, target, headers):
+        """Return (status, response headers dict, body) of one request."""
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405, "only GET and HEAD are supported")
+        parts = urlsplit(target)
+        route = self.routes.get(parts.path.rstrip("/") or "/")
+        if route is None:
+            raise HTTPError(404, f"unknown path {parts.path}, paths are {sorted(self.routes)}")
+        endpoint, cacheable = route
+        params = parse_params(parts.query)
+        await self._check_data()
+        if not cacheable:
+            body, content_type = await asyncio.to_thread(endpoint, self.dashboard_cache.dataset(), params)
+            return 200, {"Content-Type": content_type, "Cache-Control": "no-store"}, body
+        #reload count in the key: responses of an old dataset are never served
+        key = (self.dashboard_cache.reloads, parts.path, normalize_params(params))
+        response = await self._compute(key, endpoint, params)
+        response_headers = {"Content-Type": response.content_type, "ETag": response.etag, "Cache-Control": "no-cache"}
+        if etag_matches(response.etag, headers.get("if-none-match")):
+            self.counters["not_modified"] += 1
+            return 304, response_headers, b""
+        return 200, response_headers, response.body
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests of one connection until it closes (HTTP/1.1 keep-alive)."""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except (asyncio.LimitOverrunError, ValueError): #request line longer than the stream limit
+                    await self._write_error(writer, HTTPError(414, f"request line longer than {MAX_HEADER_BYTES} bytes"))
+                    return
+                except (asyncio.TimeoutError, ConnectionError):
+                    return
+                if not request_line.strip():
+                    return
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._write(writer, 400, {}, b"", "HEAD", False)
+                    return
+                try:
+                    headers = await read_headers(reader)
+                except HTTPError as error:
+                    #rest of the request is unknown, answer and close instead of reading it as the next request
+                    await self._write_error(writer, error)
+                    return
+                except ConnectionError:
+                    return
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+                self.counters["requests"] += 1
+                with span("server.request", path=target.split("?")[0]) as record:
+                    try:
+                        status, response_headers, body = await self.respond(method, target, headers)
+                    except HTTPError as error:
+                        status, response_headers = error.status, {"Content-Type": "application/json"}
+                        body = json_response({"error": str(error)})[0]
+                        if error.status == 503:
+                            response_headers["Retry-After"] = "1"
+                    except Exception as error: #one broken request must not stop the server
+                        self.counters["errors"] += 1
+                        status, response_headers = 500, {"Content-Type": "application/json"}
+                        body = json_response({"error": repr(error)})[0]
+                    record["status"] = status
+                await self._write(writer, status, response_headers, body, method, keep_alive)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def _write_error(self, writer, error):
+        """Answer an HTTPError and mark the connection for closing."""
+        self.counters["requests"] += 1
+        await self._write(writer, error.status, {"Content-Type": "application/json"},
+                          json_response({"error": str(error)})[0], "GET", False)
+
+    async def _write(self, writer, status, headers, body, method, keep_alive):
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                 f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if method != "HEAD" and status != 304:
+            writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass #client went away
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Load the dataset and start listening, returns the asyncio server."""
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        await asyncio.to_thread(self.dashboard_cache.dataset) #warm before the first client
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, **options):
+    server = QueryServer(**options)
+    listener = await server.start(host, port)
+    print(f"Serving crash aggregates on http://{host}:{port} (Ctrl+C to stop)", flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.render_cache.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP query API for crash aggregates")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-concurrent", type=int, default=4, help="responses computed at the same time")
+    parser.add_argument("--max-queue", type=int, default=64, help="waiting requests before 503")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, max_concurrent=args.max_concurrent, max_queue=args.max_queue))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
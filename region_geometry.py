@@ -0,0 +1,124 @@
+"""
+Geometry layer for the regional council map.
+
+Purpose:
+Read the regional council shapefile once, drop 'Area Outside Region' once,
+precompute simplified geometries and label positions, and keep the result
+in memory and on disk (GeoParquet) for fast map rendering.
+
+Key Functions:
+
+build_region_geometry: read shp, simplify at every tolerance in SIMPLIFY_TOLERANCES,
+calculate centroid and label point (representative point, always inside the polygon).
+
+load_region_geometry: GeoDataFrame from memory, else from GeoParquet cache, else build.
+Cache is rebuilt if any shapefile part (shp/shx/dbf/prj) changes or GEOMETRY_VERSION is bumped.
+
+Note: simplification uses shapely.coverage_simplify, which keeps shared borders between
+regions identical (no gaps or overlaps). Tolerances are metres (NZTM, EPSG:2193).
+"""
+
+import functools
+import json
+import os
+from clean_data import CACHE_DIR
+#geopandas and shapely are imported inside the functions, constants of this module are used
+#by dashboard/report code which should not pay the geopandas import until a map is drawn
+
+MAP_FILE = "data/regional-council-2025.shp"
+REGION_KEY = "REGC2025_1"
+SIMPLIFY_TOLERANCES = (0, 100, 500, 2000) #0 is full resolution
+DEFAULT_TOLERANCE = 500 #about 1/4 pixel in a 10x8 inch figure of NZ
+GEOMETRY_VERSION = 1 #bump when columns of the cache change
+
+def geometry_column(tolerance):
+    """Name of the geometry column for a tolerance, e.g. 'geom_500'."""
+    return f"geom_{tolerance}"
+
+def get_shapefile_fingerprint(shp_path=MAP_FILE):
+    """Size and mtime of every shapefile part, used as cache key."""
+    base = os.path.splitext(shp_path)[0]
+    fingerprint = {"geometry_version": GEOMETRY_VERSION, "tolerances": list(SIMPLIFY_TOLERANCES)}
+    for ext in (".shp", ".shx", ".dbf", ".prj"):
+        if os.path.exists(base + ext):
+            stat = os.stat(base + ext)
+            fingerprint[ext] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+def get_geometry_cache_paths(shp_path=MAP_FILE, cache_dir=CACHE_DIR):
+    """Return (geoparquet path, meta json path) for a shapefile."""
+    stem = os.path.splitext(os.path.basename(shp_path))[0]
+    return (os.path.join(cache_dir, f"{stem}.geoparquet"),
+            os.path.join(cache_dir, f"{stem}.geometry.meta.json"))
+
+def build_region_geometry(shp_path=MAP_FILE):
+    """
+    Read the shapefile and prepare everything the map needs.
+
+    Returns:
+    GeoDataFrame with REGC2025_1, one geometry column per tolerance,
+    centroid_x/centroid_y and label_x/label_y, active geometry is full resolution.
+
+    Review note: dbf has no .cpg file, read as utf-8 so 'Manawatū-Whanganui Region' matches the CAS name.
+    """
+    import geopandas as gpd
+    import shapely
+    gpd_df = gpd.read_file(shp_path, encoding="utf-8")
+    gpd_df = gpd_df[gpd_df[REGION_KEY] != 'Area Outside Region'] #remind from Edward, this region can be excluded
+    geometries = gpd_df.geometry.values
+
+    columns = {REGION_KEY: gpd_df[REGION_KEY].to_numpy()}
+    for tolerance in SIMPLIFY_TOLERANCES:
+        simplified = geometries if tolerance == 0 else shapely.coverage_simplify(geometries, tolerance)
+        columns[geometry_column(tolerance)] = gpd.GeoSeries(simplified, crs=gpd_df.crs)
+    layer = gpd.GeoDataFrame(columns, geometry=geometry_column(0), crs=gpd_df.crs)
+
+    centroids = shapely.centroid(geometries)
+    label_points = shapely.point_on_surface(geometries) #centroid of a curved region can be in the sea
+    layer["centroid_x"], layer["centroid_y"] = shapely.get_x(centroids), shapely.get_y(centroids)
+    layer["label_x"], layer["label_y"] = shapely.get_x(label_points), shapely.get_y(label_points)
+    return layer
+
+@functools.lru_cache(maxsize=4)
+def _load_region_geometry(shp_path, cache_dir, fingerprint_json):
+    """Memoized loader, fingerprint is part of the key so a changed shapefile is reloaded."""
+    import geopandas as gpd
+    fingerprint = json.loads(fingerprint_json)
+    parquet_path, meta_path = get_geometry_cache_paths(shp_path, cache_dir)
+    try:
+        with open(meta_path) as f:
+            if json.load(f) == fingerprint:
+                return gpd.read_parquet(parquet_path).set_geometry(geometry_column(0))
+    except (OSError, ValueError, ImportError):
+        pass #no cache yet or broken cache, build below
+
+    layer = build_region_geometry(shp_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        layer.to_parquet(parquet_path + ".tmp")
+        os.replace(parquet_path + ".tmp", parquet_path)
+        with open(meta_path, "w") as f:
+            json.dump(fingerprint, f, indent=2)
+    except (OSError, ImportError):
+        pass #cache is optional
+    return layer
+
+def load_region_geometry(shp_path=MAP_FILE, tolerance=None, cache_dir=CACHE_DIR):
+    """
+    Return the prepared region layer.
+
+    Parameters:
+    - shp_path: regional council shapefile
+    - tolerance: one of SIMPLIFY_TOLERANCES to set as active geometry (None = full resolution)
+    - cache_dir: folder for the GeoParquet cache
+
+    Return:
+    GeoDataFrame (shared, do not modify in place)
+    """
+    fingerprint = get_shapefile_fingerprint(shp_path)
+    layer = _load_region_geometry(shp_path, cache_dir, json.dumps(fingerprint, sort_keys=True))
+    if tolerance is None:
+        return layer
+    if tolerance not in SIMPLIFY_TOLERANCES:
+        raise ValueError(f"tolerance must be one of {SIMPLIFY_TOLERANCES}")
+    return layer.set_geometry(geometry_column(tolerance))
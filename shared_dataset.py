@@ -0,0 +1,339 @@
+"""
+Shared read-only dataset for several dashboard processes.
+
+Purpose:
+One loader process publishes the cleaned columns and the crash cube into POSIX shared memory
+(multiprocessing.shared_memory). Dashboard processes attach to the blocks and build
+numpy arrays / DataFrame / CrashCube on top of them without copying,
+so memory of the host stays about flat when more users open the dashboard.
+
+Key Functions:
+
+publish_dataset: copy columns and cube into shared memory blocks, manifest (json) in its own block.
+
+attach_dataset: map the blocks of the current generation of a dataset, arrays are read-only views.
+
+SharedDataset.cube / SharedDataset.frame: zero-copy CrashCube and cleaned DataFrame.
+
+serve: loader process for server mode, publishes and keeps the dataset current until stopped
+(Ctrl+C unlinks the blocks). When the csv content changes it publishes a new generation
+('<name>_g<n>_*' blocks), moves the '<name>_current' pointer to it and removes the old one.
+
+shared_or_local_cube: dashboard loader, the shared cube only while its fingerprint matches the csv.
+
+Usage (from project folder):
+python shared_dataset.py serve              #terminal 1, keep running
+CRASH_SHARED_NAME=crashdata streamlit run dashboard_app.py   #any number of servers
+
+Note: main.py option 3 starts the loader process by itself if no dataset is published yet.
+"""
+
+import argparse
+import json
+import os
+import signal
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from clean_data import (DATA_FILE, CATEGORY_COLUMNS, CLEANING_VERSION, CLEAN_COLUMNS, get_category_dtype,
+                        get_source_fingerprint, load_and_clean, to_registry_categorical)
+from crash_cube import CrashCube, load_crash_cube
+
+DEFAULT_SHARED_NAME = "crashdata"
+SHARED_NAME_ENV = "CRASH_SHARED_NAME" #dashboard attaches to this dataset if the variable is set
+DEFAULT_POLL_INTERVAL = 5.0 #seconds between checks of the csv by the loader process
+
+def _block_name(prefix, part):
+    return f"{prefix}_{part}"
+
+def generation_prefix(prefix, generation):
+    """Block prefix of one published generation, e.g. 'crashdata_g2'."""
+    return f"{prefix}_g{generation}"
+
+_created = set() #blocks published by this process, they stay registered with its resource tracker
+
+def _create_block(name, array):
+    """Create a shared memory block and copy the array into it."""
+    block = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+    _created.add(name)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block
+
+def _attach_block(name):
+    """
+    Attach an existing block without taking ownership.
+    Before python 3.13 the resource tracker of an attaching process unlinks the block when
+    the process exits, which would remove the dataset for every other session.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    if name not in _created: #attached in the publishing process (tests): unlink in unpublish still needs the entry
+        resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+def _columns_to_arrays(cleaned_df):
+    """Split the cleaned df into plain numpy arrays plus json metadata."""
+    arrays = {"OBJECTID": cleaned_df.index.to_numpy(), "crashYear": cleaned_df["crashYear"].to_numpy(),
+              "effectiveSpeed": cleaned_df["effectiveSpeed"].to_numpy(), #compact dtypes, see clean_data
+              "X": cleaned_df["X"].to_numpy(), "Y": cleaned_df["Y"].to_numpy()}
+    categories = {}
+    for col in CATEGORY_COLUMNS:
+        arrays[col] = cleaned_df[col].array.codes #same code dtype pandas uses, so no cast on attach
+        categories[col] = [str(value) for value in cleaned_df[col].cat.categories]
+    return arrays, categories
+
+def publish_dataset(cleaned_df, cube, prefix=DEFAULT_SHARED_NAME, fingerprint=None):
+    """
+    Publish cleaned columns and crash cube into shared memory.
+
+    Parameters:
+    - cleaned_df: output of load_and_clean
+    - cube: CrashCube of the same data
+    - prefix: block prefix (serve uses generation_prefix), blocks are '<prefix>_<column>' and '<prefix>_manifest'
+    - fingerprint: clean_data.get_source_fingerprint of the csv, stored in the manifest so readers
+      can tell whether the published data is still the data of the file
+
+    Returns:
+    - list of SharedMemory blocks, the publisher must keep them and call unpublish at the end
+    """
+    arrays, categories = _columns_to_arrays(cleaned_df)
+    arrays["cube"] = cube.counts
+    blocks = []
+    manifest = {"arrays": {}, "categories": categories, "cube_labels": cube.labels,
+                "cube_categorical": sorted(cube.categorical), "fingerprint": fingerprint, "published": time.time()}
+    try:
+        for part, array in arrays.items():
+            blocks.append(_create_block(_block_name(prefix, part), array))
+            manifest["arrays"][part] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+        payload = json.dumps(manifest).encode("utf-8")
+        manifest_block = shared_memory.SharedMemory(name=_block_name(prefix, "manifest"), create=True,
+                                                    size=len(payload) + 8)
+        _created.add(_block_name(prefix, "manifest"))
+        manifest_block.buf[:8] = struct.pack("<Q", len(payload)) #length first, block size is rounded up to pages
+        manifest_block.buf[8:8 + len(payload)] = payload
+        blocks.append(manifest_block) #written last, readers only see complete datasets
+    except Exception:
+        unpublish(blocks)
+        raise
+    return blocks
+
+def unpublish(blocks):
+    """Close and remove published blocks (attached sessions keep their mapping until they close)."""
+    for block in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+        _created.discard(block.name)
+
+def _write_pointer(pointer_block, generation):
+    pointer_block.buf[:8] = struct.pack("<Q", generation) #one aligned 8 byte store
+
+def current_generation(prefix=DEFAULT_SHARED_NAME):
+    """Generation the loader process published last, raises FileNotFoundError if no loader runs."""
+    pointer_block = _attach_block(_block_name(prefix, "current"))
+    try:
+        (generation,) = struct.unpack("<Q", bytes(pointer_block.buf[:8]))
+    finally:
+        pointer_block.close()
+    if generation == 0: #pointer created, first generation not published yet
+        raise FileNotFoundError(f"dataset '{prefix}' is not published yet")
+    return generation
+
+def is_published(prefix=DEFAULT_SHARED_NAME):
+    """True if a dataset with this name can be attached."""
+    try:
+        _attach_block(_block_name(generation_prefix(prefix, current_generation(prefix)), "manifest")).close()
+        return True
+    except FileNotFoundError:
+        return False
+
+class SharedDataset:
+    """
+    Attached dataset, arrays are read-only views on shared memory blocks.
+
+    Parameters:
+    - prefix: dataset name
+    - generation: published generation (default: the current one)
+    """
+    def __init__(self, prefix=DEFAULT_SHARED_NAME, generation=None):
+        self.prefix = prefix
+        self.generation = current_generation(prefix) if generation is None else generation
+        block_prefix = generation_prefix(prefix, self.generation)
+        manifest_block = _attach_block(_block_name(block_prefix, "manifest"))
+        (length,) = struct.unpack("<Q", bytes(manifest_block.buf[:8]))
+        self.manifest = json.loads(bytes(manifest_block.buf[8:8 + length]).decode("utf-8"))
+        manifest_block.close()
+
+        self._blocks = {}
+        self.arrays = {}
+        for part, spec in self.manifest["arrays"].items():
+            block = _attach_block(_block_name(block_prefix, part))
+            array = np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=block.buf)
+            array.flags.writeable = False #shared by every session, never modify
+            self._blocks[part] = block
+            self.arrays[part] = array
+        self._cube = None
+
+    def cube(self):
+        """CrashCube over the shared count array."""
+        if self._cube is None:
+            self._cube = CrashCube(self.arrays["cube"], self.manifest["cube_labels"], self.manifest["cube_categorical"])
+        return self._cube
+
+    def frame(self):
+        """Cleaned DataFrame (same columns as load_and_clean) built on shared arrays without copying."""
+        columns = {}
+        for col in CLEAN_COLUMNS:
+            if col not in CATEGORY_COLUMNS:
+                columns[col] = self.arrays[col]
+                continue
+            categories = self.manifest["categories"][col]
+            dtype = get_category_dtype(col, categories)
+            if list(dtype.categories) == categories: #usual case, same registry as the publisher: zero-copy
+                columns[col] = pd.Categorical.from_codes(self.arrays[col], dtype=dtype)
+            else: #publisher registered values in another order, codes are translated (copied)
+                source = pd.Series(pd.Categorical.from_codes(self.arrays[col], categories=categories), name=col)
+                columns[col] = to_registry_categorical(source).array
+        return pd.DataFrame(columns, index=pd.Index(self.arrays["OBJECTID"], name="OBJECTID", copy=False), copy=False)
+
+    def close(self):
+        """Release the mapping of this process (views must not be used afterwards)."""
+        self.arrays.clear()
+        self._cube = None
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass #a view is still referenced, mapping is released when the process exits
+        self._blocks.clear()
+
+def attach_dataset(prefix=DEFAULT_SHARED_NAME, generation=None):
+    """Attach to a published dataset, raises FileNotFoundError if nothing is published."""
+    return SharedDataset(prefix, generation)
+
+_attached = {} #prefix -> SharedDataset of the generation this process uses
+_source_fingerprints = {} #csv path -> last fingerprint computed here, so the hash is reused while size/mtime stay
+
+def _current_dataset(prefix):
+    """Attached current generation of a dataset (switched when the loader republished), None if not published."""
+    for _ in range(3):
+        try:
+            generation = current_generation(prefix)
+        except FileNotFoundError:
+            return None
+        dataset = _attached.get(prefix)
+        if dataset is not None and dataset.generation == generation:
+            return dataset
+        try:
+            new_dataset = attach_dataset(prefix, generation)
+        except FileNotFoundError:
+            continue #generation replaced between reading the pointer and attaching, read it again
+        if dataset is not None:
+            dataset.close() #mapping of the old generation goes when its last view is dropped
+        _attached[prefix] = new_dataset
+        return new_dataset
+    return None
+
+def matches_source(published, filename=DATA_FILE):
+    """
+    True if a published fingerprint is the fingerprint of the csv as it is now.
+    Same size and mtime is enough, otherwise the content hash decides (a touched but unchanged file still matches).
+    """
+    if not published:
+        return False
+    stat = os.stat(filename)
+    if (stat.st_size, stat.st_mtime_ns) == (published.get("size"), published.get("mtime_ns")):
+        return published.get("cleaning_version") == CLEANING_VERSION
+    current = get_source_fingerprint(filename, previous=_source_fingerprints.get(filename))
+    _source_fingerprints[filename] = current
+    return (current["sha256"], current["cleaning_version"]) == (published.get("sha256"), published.get("cleaning_version"))
+
+def shared_or_local_cube(filename=DATA_FILE):
+    """
+    Loader for the dashboard: the shared cube if CRASH_SHARED_NAME is set, published and made from
+    the csv as it is now, otherwise the local cached cube (load_crash_cube).
+
+    Review note: DashboardCache calls this after the csv changed. Until the loader process has
+    republished, the shared cube is stale, so this process uses its own cube rather than old numbers.
+    """
+    prefix = os.environ.get(SHARED_NAME_ENV)
+    dataset = _current_dataset(prefix) if prefix else None
+    if dataset is not None and matches_source(dataset.manifest.get("fingerprint"), filename):
+        return dataset.cube()
+    return load_crash_cube(filename)
+
+def _publish_source(prefix, generation, filename):
+    """Load the csv and publish it as one generation, returns (fingerprint, blocks)."""
+    fingerprint = get_source_fingerprint(filename, previous=_source_fingerprints.get(filename))
+    _source_fingerprints[filename] = fingerprint
+    cleaned_df = load_and_clean(filename)
+    blocks = publish_dataset(cleaned_df, load_crash_cube(filename), generation_prefix(prefix, generation), fingerprint)
+    return fingerprint, blocks #cleaned_df is dropped here, sessions use the shared copy
+
+def serve(prefix=DEFAULT_SHARED_NAME, filename=DATA_FILE, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Loader process: publish the dataset and keep it current until SIGINT/SIGTERM.
+
+    Every poll_interval seconds the csv is checked (os.stat, content hash only if it was touched).
+    A changed file is loaded and published as the next generation, then the pointer block is moved
+    and the previous generation unlinked. Sessions still attached to it keep their mapping until
+    they switch. If loading fails (e.g. file still being copied) the old generation stays and the
+    next check tries again.
+    """
+    pointer = shared_memory.SharedMemory(name=_block_name(prefix, "current"), create=True, size=8)
+    _created.add(pointer.name)
+    _write_pointer(pointer, 0)
+    blocks = []
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        generation = 1
+        fingerprint, blocks = _publish_source(prefix, generation, filename)
+        _write_pointer(pointer, generation)
+        print(f"Dataset '{prefix}' published ({sum(b.size for b in blocks) / 1e6:.1f} MB). Press Ctrl+C to stop.", flush=True)
+        while True:
+            time.sleep(poll_interval)
+            try:
+                if matches_source(fingerprint, filename):
+                    continue
+                new_fingerprint, new_blocks = _publish_source(prefix, generation + 1, filename)
+            except Exception as error: #missing or half-written file, keep serving the old generation
+                print(f"Reload of {filename} failed, still serving generation {generation}: {error}", flush=True)
+                continue
+            generation += 1
+            _write_pointer(pointer, generation)
+            unpublish(blocks)
+            fingerprint, blocks = new_fingerprint, new_blocks
+            print(f"Dataset '{prefix}' republished as generation {generation} (data file changed).", flush=True)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        unpublish(blocks + [pointer])
+        print(f"Dataset '{prefix}' removed.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared memory dataset for dashboard servers")
+    parser.add_argument("command", choices=["serve", "status"])
+    parser.add_argument("--name", default=DEFAULT_SHARED_NAME, help="dataset name")
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_INTERVAL, help="seconds between checks of the csv")
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.name, args.file, args.poll)
+    elif is_published(args.name):
+        dataset = attach_dataset(args.name)
+        fingerprint = dataset.manifest.get("fingerprint") or {}
+        current = "matches" if matches_source(fingerprint, args.file) else "does NOT match"
+        print(f"Dataset '{args.name}' is published, generation {dataset.generation}, "
+              f"sha256 {str(fingerprint.get('sha256'))[:12]} {current} {args.file}.")
+        dataset.close()
+    else:
+        print(f"Dataset '{args.name}' is not published.")
+
+if __name__ == "__main__":
+    main()
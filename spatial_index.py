@@ -0,0 +1,368 @@
+"""
+Point-level spatial index of crash coordinates.
+
+Purpose:
+The cleaned data carries the CAS X/Y columns (NZTM, EPSG:2193, metres, same CRS as the region shapefile).
+This module answers point questions without a row by row or geopandas spatial join:
+which regional council a crash lies in, how many crashes fall into each grid or hexagon cell,
+and which crashes lie inside a box or within a radius of a location.
+
+Key Functions:
+
+RegionIndex: STRtree over the regional council polygons. assign() labels millions of points at once:
+points in quadtree cells lying fully inside one region (or fully in the sea) are labelled without a
+polygon test, only points in the smallest cells crossing a border are tested (vectorized shapely query).
+
+PointIndex: points sorted by a uniform grid cell (CSR layout), within_bbox / within_radius read only the
+cells overlapping the query and return row positions of the cleaned df. Combine with a filter_engine
+selection mask for attribute filters (year, severity ...).
+
+grid_counts / hex_bins: crash counts per square or hexagon cell, one bincount.
+
+plot_crash_density: hexagon density map over the region outlines.
+
+Usage (from project folder):
+python spatial_index.py check                          #assigned region vs CAS region column
+python spatial_index.py radius 1757000 5920000 5000    #crashes within 5 km of a point
+python spatial_index.py bbox 1740000 5900000 1780000 5940000 --year 2020
+python spatial_index.py hexbin --year 2020 --size 5000 --out reports/maps/density_2020.png
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from clean_data import DATA_FILE, CACHE_DIR, COORDINATE_COLUMNS, load_and_clean
+from region_geometry import MAP_FILE, REGION_KEY, DEFAULT_TOLERANCE, load_region_geometry
+from instrumentation import traced
+#shapely and matplotlib are imported inside functions, as in region_geometry/map_plotting
+
+DEFAULT_CELL_SIZE = 2000 #metres, PointIndex grid cell (a 5 km radius query reads about 36 cells)
+DEFAULT_HEX_SIZE = 5000 #metres, hexagon centre to corner
+ASSIGN_CELL_SIZE = 625 #metres, smallest RegionIndex quadtree cell
+ASSIGN_LEVELS = 8 #quadtree levels, top cells are 80 km
+OUTSIDE, BORDER = -1, -2 #RegionIndex cell states besides a region position
+
+def point_arrays(cleaned_df):
+    """X and Y of a cleaned df as float64 arrays (NaN where the crash has no location)."""
+    return tuple(cleaned_df[col].to_numpy(dtype=np.float64) for col in COORDINATE_COLUMNS)
+
+def boundary_segments(geometries):
+    """Every edge of every polygon ring as a two point line (vectorized, no Python loop over edges)."""
+    import shapely
+    coords, ring_ids = shapely.get_coordinates(shapely.get_rings(shapely.get_parts(geometries)), return_index=True)
+    same_ring = ring_ids[:-1] == ring_ids[1:]
+    return shapely.linestrings(np.stack([coords[:-1][same_ring], coords[1:][same_ring]], axis=1))
+
+class RegionIndex:
+    """
+    Regional council polygons with an STRtree for vectorized point-in-polygon.
+
+    Parameters:
+    - tolerance: geometry of region_geometry (0 = full resolution, 100 is within 100 m of the border)
+    - cell_size: smallest quadtree cell, points in smaller cells crossing a border get a polygon test
+    - levels: quadtree levels (top cell is cell_size * 2**(levels - 1))
+    """
+    def __init__(self, shp_path=MAP_FILE, tolerance=0, cell_size=ASSIGN_CELL_SIZE, levels=ASSIGN_LEVELS):
+        import shapely
+        layer = load_region_geometry(shp_path, tolerance=tolerance)
+        self.names = list(layer[REGION_KEY])
+        self.geometries = np.asarray(layer.geometry.values)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.segment_tree = shapely.STRtree(boundary_segments(self.geometries))
+        self.cell_size = cell_size
+        self.levels = levels
+        self._cells = {} #level -> {cell id -> region position, BORDER or OUTSIDE}
+
+    @traced("spatial.assign_regions", rows=len)
+    def assign(self, x, y):
+        """
+        Region position (index into names) of every point, -1 outside all regions or without location.
+        Same result as locate, faster for many points.
+
+        Review note: cells are a quadtree, from coarse cells (cell_size * 2**(levels-1)) down to cell_size.
+        Only cells holding unresolved points are looked at, and a cell is split only while a border or coast
+        segment crosses it; other cells cost one centre point test, so no point is tested against
+        the detailed polygons unless it lies within cell_size of a border.
+        Cells start at (0, 0), tested cells are reused by later calls.
+        """
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        result = np.full(len(x), -1, dtype=np.int64)
+        open_points = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        for level in range(self.levels - 1, -1, -1):
+            if len(open_points) == 0:
+                return result
+            size = self.cell_size * (1 << level)
+            ix = np.floor(x[open_points] / size).astype(np.int64)
+            iy = np.floor(y[open_points] / size).astype(np.int64)
+            cells, inverse = np.unique(iy * (1 << 32) + ix, return_inverse=True)
+            state = self._cell_states(level, cells)[inverse]
+            result[open_points] = np.maximum(state, -1)
+            open_points = open_points[state == BORDER]
+
+        #points in the smallest cells crossing a border or the coast
+        result[open_points] = self.locate(x[open_points], y[open_points])
+        return result
+
+    def locate(self, x, y):
+        """
+        Point-in-polygon test of every point (no quadtree), region position or -1.
+        Envelope candidates from the tree, then intersects_xy on the prepared polygon, one call per region
+        (a predicate query on the tree is about 300 times slower on the detailed coastline).
+        A point exactly on a shared border matches two regions, the first region wins.
+        """
+        import shapely
+        result = np.full(len(x), -1, dtype=np.int64)
+        if len(x) == 0:
+            return result
+        point_positions, region_positions = self.tree.query(shapely.points(x, y))
+        for region in np.unique(region_positions):
+            candidates = point_positions[region_positions == region]
+            candidates = candidates[result[candidates] < 0]
+            hit = shapely.intersects_xy(self.geometries[region], x[candidates], y[candidates])
+            result[candidates[hit]] = region
+        return result
+
+    def _cell_states(self, level, cells):
+        """
+        State of every cell (numbered iy * 2**32 + ix at this level): region position if it lies fully
+        inside one region, OUTSIDE if it lies in the sea, BORDER if a border or coast segment may cross it.
+        """
+        import shapely
+        known = self._cells.setdefault(level, {})
+        new = np.array([cell for cell in cells.tolist() if cell not in known], dtype=np.int64)
+        if len(new):
+            size = self.cell_size * (1 << level)
+            iy, ix = new >> 32, new - ((new >> 32) << 32)
+            boxes = shapely.box(ix * size, iy * size, (ix + 1) * size, (iy + 1) * size)
+            state = np.full(len(new), BORDER, dtype=np.int64)
+            crossed = np.zeros(len(new), dtype=bool)
+            crossed[self.segment_tree.query(boxes)[0]] = True #envelope test only, may keep a few extra cells open
+            #no border or coast line in the cell: it lies in one region or in the sea, its centre tells which
+            inner = np.flatnonzero(~crossed)
+            state[inner] = OUTSIDE
+            centre_regions = self.locate((ix[inner] + 0.5) * size, (iy[inner] + 0.5) * size)
+            state[inner] = np.where(centre_regions >= 0, centre_regions, OUTSIDE)
+            known.update(zip(new.tolist(), state.tolist()))
+        return np.array([known[cell] for cell in cells.tolist()], dtype=np.int64)
+
+    def assign_names(self, x, y):
+        """Region name of every point as a Categorical (NaN outside all regions)."""
+        return pd.Categorical.from_codes(self.assign(x, y), categories=self.names)
+
+def assign_regions(cleaned_df, region_index=None):
+    """
+    Region of every crash from its coordinates (shapefile names, same as the cleaned 'region' column).
+
+    Returns: categorical Series with the index of cleaned_df
+    """
+    region_index = region_index or RegionIndex()
+    return pd.Series(region_index.assign_names(*point_arrays(cleaned_df)), index=cleaned_df.index, name="pointRegion")
+
+class PointIndex:
+    """
+    Crash points sorted by grid cell for box and radius queries.
+
+    Attributes:
+    - x, y: coordinates sorted by cell (float64)
+    - rows: row position in the indexed df of every sorted point (points without location are left out)
+    - starts: starts[c]:starts[c + 1] are the sorted points of cell c, cells are numbered row by row
+    """
+    def __init__(self, x, y, cell_size=DEFAULT_CELL_SIZE):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        rows = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        self.n_rows = len(x)
+        self.cell_size = cell_size
+        if len(rows) == 0:
+            self.x0 = self.y0 = 0.0
+            self.nx = self.ny = 1
+        else:
+            self.x0, self.y0 = float(x[rows].min()), float(y[rows].min())
+            self.nx = int((x[rows].max() - self.x0) // cell_size) + 1
+            self.ny = int((y[rows].max() - self.y0) // cell_size) + 1
+        cells = self._cell_of(x[rows], y[rows])
+        order = np.argsort(cells, kind="stable") #stable: rows of one cell stay in df order
+        self.rows = rows[order].astype(np.int32 if self.n_rows < np.iinfo(np.int32).max else np.int64)
+        self.x, self.y = x[self.rows], y[self.rows]
+        counts = np.bincount(cells, minlength=self.nx * self.ny)
+        self.starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    @classmethod
+    def from_df(cls, cleaned_df, cell_size=DEFAULT_CELL_SIZE):
+        return cls(*point_arrays(cleaned_df), cell_size=cell_size)
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.rows.nbytes + self.starts.nbytes
+
+    def _cell_of(self, x, y):
+        ix = ((x - self.x0) // self.cell_size).astype(np.int64)
+        iy = ((y - self.y0) // self.cell_size).astype(np.int64)
+        return iy * self.nx + ix
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        """Sorted point positions of all cells overlapping the box (one contiguous slice per grid row)."""
+        ix0 = max(int((xmin - self.x0) // self.cell_size), 0)
+        ix1 = min(int((xmax - self.x0) // self.cell_size), self.nx - 1)
+        iy0 = max(int((ymin - self.y0) // self.cell_size), 0)
+        iy1 = min(int((ymax - self.y0) // self.cell_size), self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+        slices = [np.arange(self.starts[iy * self.nx + ix0], self.starts[iy * self.nx + ix1 + 1])
+                  for iy in range(iy0, iy1 + 1)]
+        return np.concatenate(slices)
+
+    def _finish(self, candidates, hit, mask):
+        rows = self.rows[candidates[hit]]
+        if mask is not None:
+            rows = rows[np.asarray(mask)[rows]]
+        return np.sort(rows)
+
+    def within_bbox(self, xmin, ymin, xmax, ymax, mask=None):
+        """
+        Row positions of crashes inside the box (edges included), in df order.
+
+        Parameters:
+        - mask: optional boolean array over the indexed rows (e.g. BitmapSelection.mask()), only those rows are returned
+        """
+        candidates = self._candidates(xmin, ymin, xmax, ymax)
+        x, y = self.x[candidates], self.y[candidates]
+        return self._finish(candidates, (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax), mask)
+
+    def within_radius(self, x, y, radius, mask=None):
+        """Row positions of crashes within radius metres of (x, y), in df order, mask as in within_bbox."""
+        candidates = self._candidates(x - radius, y - radius, x + radius, y + radius)
+        dx, dy = self.x[candidates] - x, self.y[candidates] - y
+        return self._finish(candidates, dx * dx + dy * dy <= radius * radius, mask)
+
+    def count_within_radius(self, x, y, radius, mask=None):
+        return len(self.within_radius(x, y, radius, mask))
+
+def grid_counts(x, y, cell_size, extent=None):
+    """
+    Crash counts per square cell.
+
+    Parameters:
+    - x, y: coordinates (NaN skipped)
+    - cell_size: metres
+    - extent: (xmin, ymin, xmax, ymax), default bounds of the points
+
+    Returns: (counts array of shape (rows, columns), x edges, y edges), row 0 is the southern edge
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    if extent is None:
+        extent = (x.min(), y.min(), x.max(), y.max()) if len(x) else (0.0, 0.0, cell_size, cell_size)
+    xmin, ymin, xmax, ymax = extent
+    nx, ny = int((xmax - xmin) // cell_size) + 1, int((ymax - ymin) // cell_size) + 1
+    ix, iy = ((x - xmin) // cell_size).astype(np.int64), ((y - ymin) // cell_size).astype(np.int64)
+    inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    counts = np.bincount(iy[inside] * nx + ix[inside], minlength=nx * ny).reshape(ny, nx)
+    return counts, xmin + np.arange(nx + 1) * cell_size, ymin + np.arange(ny + 1) * cell_size
+
+def hex_bins(x, y, size=DEFAULT_HEX_SIZE):
+    """
+    Crash counts per pointy-top hexagon (size = centre to corner in metres), only cells with crashes.
+
+    Returns: DataFrame with columns q, r (axial cell coordinates), x, y (cell centre), count
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    #axial coordinates, then cube rounding (the coordinate with the largest rounding error is recomputed)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    cells = pd.DataFrame({"q": rq.astype(np.int64), "r": rr.astype(np.int64)})
+    counted = cells.groupby(["q", "r"], sort=True).size().reset_index(name="count")
+    counted["x"] = size * np.sqrt(3) * (counted["q"] + counted["r"] / 2)
+    counted["y"] = size * 1.5 * counted["r"]
+    return counted[["q", "r", "x", "y", "count"]]
+
+def hexagon_vertices(centres_x, centres_y, size):
+    """Corner coordinates (n, 6, 2) of pointy-top hexagons."""
+    angles = np.deg2rad(30 + 60 * np.arange(6))
+    return np.stack([np.asarray(centres_x)[:, None] + size * np.cos(angles),
+                     np.asarray(centres_y)[:, None] + size * np.sin(angles)], axis=-1)
+
+@traced("render.crash_density_map", rows=None)
+def plot_crash_density(x, y, size=DEFAULT_HEX_SIZE, title="Crash Density", cmap="OrRd", figsize=(10, 8)):
+    """
+    Hexagon density map: crash counts per hexagon (log colour scale) over the region outlines.
+    Returns the figure.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib import ticker
+    from matplotlib.collections import PolyCollection
+    from matplotlib.colors import LogNorm
+    bins = hex_bins(x, y, size)
+    fig, axes = plt.subplots(figsize=figsize)
+    load_region_geometry(tolerance=DEFAULT_TOLERANCE).boundary.plot(ax=axes, linewidth=0.4, color="grey", zorder=3)
+    if len(bins):
+        hexagons = PolyCollection(hexagon_vertices(bins["x"], bins["y"], size), array=bins["count"].to_numpy(),
+                                  cmap=cmap, norm=LogNorm(vmin=1, vmax=max(int(bins["count"].max()), 2)),
+                                  edgecolors="none")
+        axes.add_collection(hexagons)
+        colorbar = fig.colorbar(hexagons, ax=axes, label=f"Crashes per hexagon ({size / 1000:g} km)")
+        colorbar.ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda value, _: f"{value:g}")) #1, 10, 100
+        colorbar.ax.yaxis.set_minor_formatter(ticker.NullFormatter())
+    axes.set_aspect("equal")
+    axes.axis("off")
+    axes.set_title(title)
+    fig.tight_layout()
+    return fig
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Point queries on crash coordinates")
+    parser.add_argument("command", choices=["check", "radius", "bbox", "hexbin"])
+    parser.add_argument("values", nargs="*", type=float, help="radius: X Y METRES, bbox: XMIN YMIN XMAX YMAX")
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--year", type=int, default=None, help="only crashes of this year")
+    parser.add_argument("--size", type=float, default=DEFAULT_HEX_SIZE, help="hexagon size in metres")
+    parser.add_argument("--out", default=None, help="hexbin: image path (default: show the figure)")
+    args = parser.parse_args(argv)
+
+    cleaned_df = load_and_clean(args.file, cache_dir=CACHE_DIR)
+    mask = None if args.year is None else (cleaned_df["crashYear"] == args.year).to_numpy()
+    start = time.perf_counter()
+    if args.command == "check":
+        assigned = assign_regions(cleaned_df)
+        located = assigned.notna() & cleaned_df["region"].notna()
+        agree = (assigned[located].astype(str) == cleaned_df.loc[located, "region"].astype(str)).mean()
+        print(f"{len(cleaned_df)} crashes, {int(assigned.notna().sum())} inside a region, "
+              f"{agree:.2%} match the CAS region column ({time.perf_counter() - start:.2f}s)")
+        return assigned
+    if args.command in ("radius", "bbox"):
+        expected = 3 if args.command == "radius" else 4
+        if len(args.values) != expected:
+            parser.error(f"{args.command} needs {expected} numbers")
+        index = PointIndex.from_df(cleaned_df)
+        built = time.perf_counter()
+        rows = index.within_radius(*args.values, mask=mask) if args.command == "radius" else index.within_bbox(*args.values, mask=mask)
+        print(f"index built in {built - start:.2f}s, query {1000 * (time.perf_counter() - built):.2f} ms, {len(rows)} crashes")
+        result = cleaned_df.iloc[rows]
+        print(result["crashSeverity"].value_counts().to_string())
+        return result
+    x, y = point_arrays(cleaned_df if mask is None else cleaned_df[mask])
+    if args.out:
+        import matplotlib
+        matplotlib.use("Agg") #file only, no window
+    import matplotlib.pyplot as plt
+    fig = plot_crash_density(x, y, args.size, f"Crash Density {args.year if args.year else 'all years'}")
+    if args.out:
+        fig.savefig(args.out)
+        print(f"{args.out} written in {time.perf_counter() - start:.2f}s")
+    else:
+        plt.show()
+    return fig
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Trend and severity rate analytics of every series at once, with bootstrap confidence intervals.
+
+Purpose:
+plot_trends_over_time draws raw yearly counts. For weather/speed/region studies we need, for every series
+(default region x effectiveSpeed x weatherA) and every year: the share of each crash severity (rate),
+the change from the previous year, a trailing rolling average, and how uncertain these are.
+All series are computed together from the crash cube as one (series, year, severity) count array,
+no Python loop over series, years or resamples.
+
+Bootstrap: resampling the crashes of one series-year with replacement only changes how they split over
+the severities, so one resample of all series is one multinomial draw per series-year
+(n = crashes of that series-year, p = observed severity shares). Every statistic is computed from the
+resampled counts with the same function as the point estimate, percentiles over the resamples give the interval.
+Series are split into shards bounded by memory (SHARD_BYTES), shards can run in a process pool,
+and every shard has its own seed from one SeedSequence, so results do not depend on the number of workers.
+
+Key Functions:
+
+series_counts: cube -> counts array (series, year, severity), series keys and years.
+
+trend_metrics: rates, year-over-year deltas and rolling values of a count array (any leading axes).
+
+bootstrap_intervals: percentile intervals of rate, rate_delta and rolling_rate, sharded.
+
+compute_trends: long DataFrame, one row per series, year and severity.
+
+load_trend_table: compute_trends cached beside the cube, recomputed when the data (cube) changes.
+
+Usage (from project folder):
+python trend_analytics.py --group-by region effectiveSpeed weatherA --workers 4 --out reports/trends.csv
+python trend_analytics.py --group-by weatherA --severity "Fatal Crash" --plot reports/fatal_rate_by_weather.png
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from clean_data import DATA_FILE, CACHE_DIR
+from crash_cube import as_crash_cube, get_cube_path, load_crash_cube
+from instrumentation import span, traced
+from main import SEVERITY_ORDER
+
+GROUP_COLUMNS = ["region", "effectiveSpeed", "weatherA"]
+DEFAULT_WINDOW = 3 #years in the trailing rolling window
+DEFAULT_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+SHARD_BYTES = 64 * 1024 * 1024 #memory of one bootstrap shard (resampled counts and statistics)
+INTERVAL_METRICS = ["rate", "rate_delta", "rolling_rate"]
+TRENDS_VERSION = 1 #bump when the table layout or method changes
+
+def series_counts(cube, group_by=GROUP_COLUMNS, severities=SEVERITY_ORDER):
+    """
+    Crash counts of every series by year and severity.
+
+    Parameters:
+    - cube: CrashCube or cleaned df
+    - group_by: cube columns defining a series (other columns are summed), may be empty
+    - severities: severity axis order
+
+    Returns:
+    - counts: int64 array (series, years, severities), only series with at least one crash
+    - keys: DataFrame with one row per series, columns group_by
+    - years: list of years observed in the cube (consecutive positions, gaps are not filled)
+    """
+    cube = as_crash_cube(cube)
+    axes = [cube.axis(c) for c in group_by] + [cube.axis("crashYear"), cube.axis("crashSeverity")]
+    others = [i for i in range(cube.counts.ndim) if i not in axes]
+    #transpose is a view, sum the trailing (other) axes, then drop the missing slots
+    summed = np.transpose(cube.counts, axes + others).sum(axis=tuple(range(len(axes), cube.counts.ndim)), dtype=np.int64)
+    summed = summed[tuple(slice(0, -1) for _ in axes)]
+
+    year_labels = cube.labels["crashYear"]
+    years = cube.observed_values("crashYear")
+    year_positions = [year_labels.index(y) for y in years]
+    severity_positions = [cube.labels["crashSeverity"].index(s) for s in severities]
+    summed = summed[..., year_positions, :][..., severity_positions]
+
+    group_shape = summed.shape[:len(group_by)]
+    counts = summed.reshape((-1, len(years), len(severities)))
+    kept = np.flatnonzero(counts.sum(axis=(1, 2)) > 0)
+    positions = np.unravel_index(kept, group_shape) if group_by else ()
+    keys = pd.DataFrame({column: np.asarray(cube.labels[column], dtype=object)[pos]
+                         for column, pos in zip(group_by, positions)}, index=range(len(kept)))
+    return counts[kept], keys, years
+
+def rolling_sum(values, window, axis):
+    """Trailing sum over window positions along axis, shorter at the start (rolling(window, min_periods=1).sum())."""
+    values = np.moveaxis(values, axis, -1)
+    total = np.cumsum(values, axis=-1)
+    total[..., window:] -= total[..., :-window].copy()
+    return np.moveaxis(total, -1, axis)
+
+def _year_delta(values):
+    """Change from the previous year position (year axis -2), NaN for the first year."""
+    delta = np.full(values.shape, np.nan, dtype=values.dtype)
+    delta[..., 1:, :] = values[..., 1:, :] - values[..., :-1, :]
+    return delta
+
+def trend_metrics(counts, window=DEFAULT_WINDOW, names=None):
+    """
+    Statistics of a count array (..., years, severities), any leading axes (series, resamples).
+
+    Parameters:
+    - counts: int or float counts, float32 counts give float32 statistics (used for resamples)
+    - names: statistics to compute (default all)
+
+    Returns dict name -> array of the same shape (NaN where a rate has no crash):
+    - rate: counts / crashes of the series-year
+    - rate_delta: rate change from the previous year
+    - rolling_rate: rate of the pooled counts of the trailing window (years with more crashes weigh more)
+    - rolling_count: trailing mean count per year
+    - count_delta: count change from the previous year
+    """
+    names = names or ["rate", "rate_delta", "rolling_rate", "rolling_count", "count_delta"]
+    counts = np.asarray(counts)
+    if counts.dtype.kind != "f":
+        counts = counts.astype(np.float64)
+    metrics = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if "rate" in names or "rate_delta" in names:
+            metrics["rate"] = counts / counts.sum(axis=-1, keepdims=True)
+        if "rate_delta" in names:
+            metrics["rate_delta"] = _year_delta(metrics["rate"])
+        if "rolling_rate" in names or "rolling_count" in names:
+            rolling_counts = rolling_sum(counts, window, axis=-2)
+            if "rolling_rate" in names:
+                metrics["rolling_rate"] = rolling_counts / rolling_counts.sum(axis=-1, keepdims=True)
+            if "rolling_count" in names:
+                years_in_window = np.minimum(np.arange(1, counts.shape[-2] + 1), window)[:, None]
+                metrics["rolling_count"] = rolling_counts / years_in_window
+        if "count_delta" in names:
+            metrics["count_delta"] = _year_delta(counts)
+    return {name: metrics[name] for name in names}
+
+def bootstrap_shard(counts, resamples, window, quantiles, seed):
+    """
+    Percentiles of INTERVAL_METRICS over resamples for one shard of series.
+
+    Returns dict name -> array (len(quantiles), series, years, severities).
+    """
+    rng = np.random.default_rng(seed)
+    totals = counts.sum(axis=-1)
+    observed = totals > 0 #series-years without crashes stay 0 (rates NaN in every resample)
+    samples = np.zeros((resamples,) + counts.shape, dtype=np.float32) #counts < 2**24, exact in float32
+    shares = counts[observed] / totals[observed][:, None]
+    samples[:, observed] = rng.multinomial(totals[observed], shares, size=(resamples, len(shares)))
+    point = trend_metrics(counts, window, INTERVAL_METRICS)
+    intervals = {}
+    for name, values in trend_metrics(samples, window, INTERVAL_METRICS).items():
+        #a cell is NaN in every resample or in none (same totals), percentiles only of the defined cells
+        defined = ~np.isnan(point[name])
+        intervals[name] = np.full((len(quantiles),) + counts.shape, np.nan)
+        intervals[name][:, defined] = np.quantile(values[:, defined], quantiles, axis=0)
+    return intervals
+
+def _run_shard(job):
+    return bootstrap_shard(*job)
+
+@traced("trends.bootstrap", rows=None)
+def bootstrap_intervals(counts, resamples=DEFAULT_RESAMPLES, window=DEFAULT_WINDOW, confidence=DEFAULT_CONFIDENCE,
+                        seed=0, workers=1):
+    """
+    Percentile bootstrap intervals of INTERVAL_METRICS for every series, year and severity.
+
+    Parameters:
+    - counts: array (series, years, severities) from series_counts
+    - resamples: bootstrap resamples
+    - confidence: interval coverage, e.g. 0.95 -> 2.5% and 97.5% percentiles
+    - seed: same seed, same intervals (also with another number of workers)
+    - workers: processes (1 = run in this process, None = cpu count)
+
+    Returns dict name -> (low, high) arrays of counts.shape.
+
+    Review note: shard size is fixed by SHARD_BYTES (not by workers) and each shard has a spawned seed,
+    so the split over processes never changes the result.
+    """
+    alpha = (1 - confidence) / 2
+    quantiles = [alpha, 1 - alpha]
+    series_bytes = resamples * counts.shape[1] * counts.shape[2] * 40 #float32 resamples, statistics and temporaries
+    shard_size = max(1, SHARD_BYTES // max(series_bytes, 1))
+    starts = range(0, len(counts), shard_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    jobs = [(counts[s:s + shard_size], resamples, window, quantiles, shard_seed) for s, shard_seed in zip(starts, seeds)]
+    if workers == 1 or len(jobs) <= 1:
+        results = [_run_shard(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_shard, jobs))
+    if not results:
+        empty = np.full(counts.shape, np.nan)
+        return {name: (empty, empty) for name in INTERVAL_METRICS}
+    intervals = {}
+    for name in INTERVAL_METRICS:
+        joined = np.concatenate([r[name] for r in results], axis=1)
+        intervals[name] = (joined[0], joined[1])
+    return intervals
+
+@traced("trends.compute", rows=len)
+def compute_trends(cube, group_by=GROUP_COLUMNS, window=DEFAULT_WINDOW, resamples=DEFAULT_RESAMPLES,
+                   confidence=DEFAULT_CONFIDENCE, seed=0, workers=1, severities=SEVERITY_ORDER):
+    """
+    Trend table of every series.
+
+    Parameters: see series_counts and bootstrap_intervals (resamples=0 skips the intervals)
+
+    Returns DataFrame, one row per series, year and severity, columns:
+    group_by..., crashYear, crashSeverity, count, total, rate, rate_delta, rolling_rate, rolling_count,
+    count_delta and <metric>_low/<metric>_high for rate, rate_delta, rolling_rate
+    """
+    counts, keys, years = series_counts(cube, group_by, severities)
+    n_series, n_years, n_severities = counts.shape
+    with span("trends.metrics", rows=counts.size):
+        metrics = trend_metrics(counts, window)
+    cells = n_years * n_severities
+    table = {column: np.repeat(keys[column].to_numpy(), cells) for column in group_by}
+    table["crashYear"] = np.tile(np.repeat(np.asarray(years, dtype=np.int64), n_severities), n_series)
+    table["crashSeverity"] = pd.Categorical(np.tile(severities, n_series * n_years), categories=severities)
+    table["count"] = counts.ravel()
+    table["total"] = np.repeat(counts.sum(axis=-1).ravel(), n_severities)
+    for name, values in metrics.items():
+        table[name] = values.ravel()
+    if resamples:
+        intervals = bootstrap_intervals(counts, resamples, window, confidence, seed, workers)
+        for name, (low, high) in intervals.items():
+            table[f"{name}_low"], table[f"{name}_high"] = low.ravel(), high.ravel()
+    return pd.DataFrame(table)
+
+def get_trends_path(filename=DATA_FILE, cache_dir=CACHE_DIR):
+    """Trend table lives beside the cube of the same csv."""
+    return get_cube_path(filename, cache_dir).replace(".cube.npz", ".trends.parquet")
+
+def cube_digest(cube):
+    """Hash of the cube counts and labels, changes with every data release which changes a count."""
+    digest = hashlib.sha256(np.ascontiguousarray(cube.counts).tobytes())
+    digest.update(json.dumps(cube.labels, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+@traced("trends.load", rows=len)
+def load_trend_table(filename=DATA_FILE, cache_dir=CACHE_DIR, cube=None, workers=None, **options):
+    """
+    compute_trends of a csv, read from cache when the cube and options are unchanged.
+
+    Parameters:
+    - cube: crash cube of the csv (default: load_crash_cube)
+    - workers: bootstrap processes when the table is recomputed
+    - options: compute_trends keyword arguments (group_by, window, resamples, confidence, seed)
+    """
+    cube = cube if cube is not None else load_crash_cube(filename, cache_dir)
+    path = get_trends_path(filename, cache_dir)
+    meta = {"trends_version": TRENDS_VERSION, "cube": cube_digest(cube),
+            "options": json.loads(json.dumps(options, sort_keys=True))}
+    try:
+        with open(path + ".json") as f:
+            if json.load(f) == meta:
+                return pd.read_parquet(path)
+    except (OSError, ValueError):
+        pass #missing or broken cache, recompute
+    table = compute_trends(cube, workers=workers, **options)
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        table.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f)
+    except OSError:
+        pass #read-only folder, table is still returned
+    return table
+
+def plot_rate_trends(trends, severity, output_path=None, max_series=6):
+    """
+    Rate of one severity over the years with its bootstrap interval as a band,
+    for the series with the most crashes (same look as plot_trends_over_time).
+    """
+    import matplotlib.pyplot as plt #only loaded when a plot is drawn
+    rows = trends[trends["crashSeverity"] == severity]
+    group_by = list(trends.columns[:list(trends.columns).index("crashYear")])
+    if group_by:
+        labels = rows[group_by].astype(str).agg(" / ".join, axis=1)
+    else:
+        labels = pd.Series("All", index=rows.index)
+    biggest = rows.groupby(labels)["total"].sum().nlargest(max_series).index
+    fig, axes = plt.subplots()
+    for label in biggest:
+        part = rows[labels == label]
+        line, = axes.plot(part["crashYear"], part["rate"], label=label, marker="o")
+        if "rate_low" in part:
+            axes.fill_between(part["crashYear"], part["rate_low"], part["rate_high"], color=line.get_color(), alpha=0.2)
+    axes.set_xlabel("Year")
+    axes.set_ylabel(f"Share of {severity}")
+    axes.set_title(f"{severity} rate over time (band: bootstrap interval)")
+    axes.legend()
+    axes.grid(True)
+    if output_path:
+        fig.savefig(output_path)
+        plt.close(fig)
+    else:
+        plt.show()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Severity rates, deltas, rolling values and bootstrap intervals")
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--group-by", nargs="*", default=GROUP_COLUMNS,
+                        choices=["region", "effectiveSpeed", "weatherA", "urban"], help="columns of a series")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES, help="0 = no intervals")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="bootstrap processes (default cpu count)")
+    parser.add_argument("--out", default=None, help="also write the table (csv, or parquet by extension)")
+    parser.add_argument("--severity", choices=SEVERITY_ORDER, default="Fatal Crash", help="severity of --plot")
+    parser.add_argument("--plot", default=None, help="save a rate plot of --severity to this image file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    trends = load_trend_table(args.file, workers=args.workers, group_by=args.group_by, window=args.window,
+                              resamples=args.resamples, confidence=args.confidence, seed=args.seed)
+    n_series = len(trends) // max(trends.groupby(["crashYear", "crashSeverity"], observed=True).ngroups, 1)
+    print(f"{n_series} series, {len(trends)} rows in {time.perf_counter() - start:.1f}s")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        if args.out.endswith(".parquet"):
+            trends.to_parquet(args.out, index=False)
+        else:
+            trends.to_csv(args.out, index=False)
+        print(f"Table written to {args.out}")
+    if args.plot:
+        import matplotlib
+        matplotlib.use("Agg")
+        os.makedirs(os.path.dirname(args.plot) or ".", exist_ok=True)
+        plot_rate_trends(trends, args.severity, output_path=args.plot)
+        print(f"Plot written to {args.plot}")
+    return trends
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Background warm-up of dashboard views after a data refresh.
+
+Purpose:
+After the data file changes, the first user of each dashboard view paid for loading, cleaning,
+aggregating and drawing. WarmupScheduler watches the data file from a background thread and,
+after every (re)load, precomputes the default views: the unfiltered count tables and the region
+map of every slider year. Views users asked for most recently are warmed first (also after the
+next refresh), progress is reported for the dashboard sidebar.
+The cli warms the disk caches before the dashboard server starts (cleaned parquet, crash cube,
+year/region partitions, trend table with bootstrap intervals, map frames in the spill folder).
+
+Key Functions:
+
+default_selections: the dashboard's default filter selections (all values ticked).
+
+WarmupScheduler: thread running warm-up tasks by priority, touch() marks a requested view,
+progress() returns counters.
+
+main: cli, e.g. after the nightly data refresh.
+
+Usage (from project folder):
+python warmup.py                  #after replacing the csv, before users open the dashboard
+python warmup.py --years 2015 2024 --workers 4
+"""
+
+import argparse
+import concurrent.futures
+import threading
+import time
+
+def default_selections(dataset):
+    """
+    Default filter selections of the dashboard sidebar (everything ticked, weather 'Null' left out),
+    same chain as get_weather_filter / get_dashboard_filter in dashboard_app.
+    """
+    from clean_data import UNKNOWN_WEATHER #imported here, warmup.py itself stays light to import
+    weathers = [w for w in dataset.observed_values('weatherA') if w != UNKNOWN_WEATHER]
+    by_weather = dataset.filter(weatherA=weathers)
+    speeds = by_weather.observed_values('effectiveSpeed')
+    severities = by_weather.filter(effectiveSpeed=speeds).observed_values('crashSeverity')
+    return {"weatherA": weathers, "effectiveSpeed": speeds, "crashSeverity": severities}
+
+class WarmupScheduler:
+    """
+    Warm dashboard views in a background thread after every data (re)load.
+
+    Parameters:
+    - dashboard_cache: DashboardCache, its dataset() is polled and reloads a changed data file
+    - build_tasks: function dataset -> list of (view name, func) in default order.
+      func computes and caches one view, it may return futures of background renders (waited for).
+    - poll_interval: seconds between data file checks
+    - max_in_flight: background renders waited for at the same time
+    """
+    def __init__(self, dashboard_cache, build_tasks, poll_interval=30.0, max_in_flight=4):
+        self.dashboard_cache = dashboard_cache
+        self.build_tasks = build_tasks
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self.generation = 0 #one generation per data load
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.running = None
+        self.last_error = None
+        self.started_at = None
+        self.finished_at = None
+        self._requested = {} #view name -> time of last request, kept across refreshes
+        self._pending = [] #(default order, view name, func)
+        self._waiting = {} #future -> (generation, view name)
+        self._remaining = {} #view name -> futures not finished yet
+        self._seen_reloads = None
+        self._force = False
+        self._stop = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread (once), returns self."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="dashboard-warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def touch(self, name):
+        """Mark a view as requested now, it is warmed before views asked for earlier (or never)."""
+        with self._cond:
+            self._requested[name] = time.monotonic()
+
+    def refresh(self):
+        """Warm every view again on the next loop, e.g. after clearing the dashboard caches."""
+        with self._cond:
+            self._force = True
+            self._cond.notify_all()
+
+    def progress(self):
+        """Counters for the dashboard sidebar."""
+        with self._cond:
+            finished = self.done + self.failed
+            return {"generation": self.generation, "total": self.total, "done": self.done, "failed": self.failed,
+                    "fraction": finished / self.total if self.total else 1.0,
+                    "warm": self.total > 0 and finished == self.total and not self._waiting,
+                    "running": self.running, "last_error": self.last_error,
+                    "seconds": round((self.finished_at or time.time()) - self.started_at, 1) if self.started_at else None}
+
+    def wait_until_warm(self, timeout=None):
+        """Block until the current generation is done (for the cli and tests), True if warm."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.progress()["warm"]:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _check_data(self):
+        dataset = self.dashboard_cache.dataset() #reloads and clears memos if the file changed
+        reloads = self.dashboard_cache.reloads
+        with self._cond:
+            if reloads == self._seen_reloads and not self._force:
+                return
+            self._seen_reloads, self._force = reloads, False
+        tasks = self.build_tasks(dataset)
+        with self._cond:
+            self._pending = [(order, name, func) for order, (name, func) in enumerate(tasks)]
+            self._waiting.clear() #renders of the previous generation are not counted any more
+            self._remaining.clear()
+            self.generation += 1
+            self.total, self.done, self.failed = len(tasks), 0, 0
+            self.started_at, self.finished_at = time.time(), None
+
+    def _next_task(self):
+        #most recently requested view first, then default order
+        task = min(self._pending, key=lambda t: (-self._requested.get(t[1], 0.0), t[0]))
+        self._pending.remove(task)
+        return task
+
+    def _run_task(self, name, func):
+        try:
+            result = func()
+        except Exception as error: #one failing view must not stop the others
+            with self._cond:
+                self.failed += 1
+                self.last_error = f"{name}: {error!r}"
+            return
+        futures = [f for f in (result if isinstance(result, (list, tuple)) else [result])
+                   if isinstance(f, concurrent.futures.Future)]
+        with self._cond:
+            if not futures:
+                self.done += 1
+                return
+            for future in futures:
+                self._waiting[future] = (self.generation, name)
+            self._remaining[name] = len(futures)
+
+    def _collect(self, finished):
+        with self._cond:
+            for future in finished:
+                generation, name = self._waiting.pop(future, (None, None))
+                if generation != self.generation:
+                    continue
+                if future.exception() is not None:
+                    self.failed += 1
+                    self.last_error = f"{name}: {future.exception()!r}"
+                    self._remaining.pop(name, None)
+                    continue
+                self._remaining[name] -= 1
+                if self._remaining[name] == 0:
+                    del self._remaining[name]
+                    self.done += 1
+
+    def _run(self):
+        next_check = 0.0
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                force = self._force
+            if force or time.monotonic() >= next_check:
+                try:
+                    self._check_data()
+                except Exception as error: #e.g. data file missing during the refresh, try again later
+                    with self._cond:
+                        self.last_error = f"data: {error!r}"
+                next_check = time.monotonic() + self.poll_interval
+
+            with self._cond:
+                task = self._next_task() if self._pending and len(self._waiting) < self.max_in_flight else None
+                self.running = task[1] if task else None
+                waiting = list(self._waiting)
+            if task is not None:
+                self._run_task(task[1], task[2])
+                continue
+            if waiting:
+                finished, _ = concurrent.futures.wait(waiting, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
+                self._collect(finished)
+                continue
+            with self._cond:
+                if self.total and self.finished_at is None:
+                    self.finished_at = time.time()
+                if not self._stop and not self._force:
+                    self._cond.wait(timeout=max(0.0, next_check - time.monotonic()))
+
+def main(argv=None):
+    from clean_data import DATA_FILE
+    from crash_cube import load_crash_cube
+    from partitioned_store import load_partitioned_store
+    from trend_analytics import load_trend_table
+    from map_render_cache import MapRenderCache, YEAR_RANGE, region_counts_records
+
+    parser = argparse.ArgumentParser(description="Warm the dashboard disk caches after a data refresh")
+    parser.add_argument("--file", default=DATA_FILE, help="CAS csv path")
+    parser.add_argument("--years", type=int, nargs=2, default=[YEAR_RANGE.start, YEAR_RANGE.stop - 1],
+                        metavar=("START", "END"), help="map years (default: dashboard slider range)")
+    parser.add_argument("--workers", type=int, default=None, help="render processes")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cube = load_crash_cube(args.file) #builds cleaned parquet and cube cache if the csv changed
+    load_partitioned_store(args.file) #year/region files of the density map
+    print(f"Data, cube and partition caches ready in {time.perf_counter() - start:.1f}s")
+    load_trend_table(args.file, cube=cube, workers=args.workers) #rates and bootstrap intervals of this release
+    print(f"Trend table ready in {time.perf_counter() - start:.1f}s")
+    default_view = cube.filter(**default_selections(cube))
+    render_cache = MapRenderCache(max_memory_bytes=1 << 30, max_workers=args.workers)
+    years = range(args.years[0], args.years[1] + 1)
+    futures = render_cache.prerender([(region_counts_records(default_view, year), year, "OrRd", "png") for year in years])
+    for count, _ in enumerate(concurrent.futures.as_completed(futures), start=1):
+        print(f"\rMap frames {count}/{len(futures)}", end="", flush=True)
+    render_cache.shutdown()
+    written = render_cache.spill_all() #frames already on disk were skipped by prerender
+    print(f"\n{written} new map frame(s) written to {render_cache.spill_dir} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()